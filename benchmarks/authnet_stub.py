@@ -0,0 +1,181 @@
+"""
+A local HTTP server that speaks enough of the Authorize.net XML API for the
+benchmarks: every request gets a canned, successful response for its type.
+
+    $ python benchmarks/authnet_stub.py [--port N] [--latency SECONDS]
+
+``latency`` adds a fixed delay to every response, to stand in for the
+network.
+"""
+from __future__ import print_function
+
+import optparse
+import re
+import threading
+import time
+
+from six.moves import BaseHTTPServer, socketserver
+
+
+def envelope(name, body=b''):
+    return (b'\xef\xbb\xbf<?xml version="1.0" encoding="utf-8"?>'
+            b'<' + name + b' xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">'
+            b'<messages><resultCode>Ok</resultCode>'
+            b'<message><code>I00001</code><text>Successful.</text></message></messages>'
+            + body + b'</' + name + b'>')
+
+
+TRANSACTION_RESPONSE = envelope(b'createTransactionResponse', b"""
+<transactionResponse>
+  <responseCode>1</responseCode>
+  <authCode>ABC123</authCode>
+  <avsResultCode>Y</avsResultCode>
+  <cvvResultCode>M</cvvResultCode>
+  <transId>2200000001</transId>
+  <accountNumber>XXXX1111</accountNumber>
+  <accountType>Visa</accountType>
+  <messages>
+    <message>
+      <code>1</code>
+      <description>This transaction has been approved.</description>
+    </message>
+  </messages>
+</transactionResponse>""")
+
+TRANSACTION_DETAILS_RESPONSE = envelope(b'getTransactionDetailsResponse', b"""
+<transaction>
+  <transId>2200000001</transId>
+  <transactionType>authCaptureTransaction</transactionType>
+  <transactionStatus>settledSuccessfully</transactionStatus>
+  <responseCode>1</responseCode>
+  <authCode>ABC123</authCode>
+  <AVSResponse>Y</AVSResponse>
+  <cardCodeResponse>M</cardCodeResponse>
+  <authAmount>12.00</authAmount>
+  <settleAmount>12.00</settleAmount>
+  <payment>
+    <creditCard>
+      <cardNumber>XXXX1111</cardNumber>
+      <expirationDate>XXXX</expirationDate>
+      <cardType>Visa</cardType>
+    </creditCard>
+  </payment>
+  <customer>
+    <id>123</id>
+    <email>joeyjoejoejunior@example.com</email>
+  </customer>
+</transaction>""")
+
+PAYMENT_PROFILE = b"""
+  <billTo>
+    <firstName>Joey</firstName>
+    <lastName>Shabadoo</lastName>
+    <zip>12345</zip>
+  </billTo>
+  <customerPaymentProfileId>20000001</customerPaymentProfileId>
+  <payment>
+    <creditCard>
+      <cardNumber>XXXX1111</cardNumber>
+      <expirationDate>XXXX</expirationDate>
+    </creditCard>
+  </payment>"""
+
+RESPONSES = {
+    b'createTransaction': TRANSACTION_RESPONSE,
+    b'getTransactionDetails': TRANSACTION_DETAILS_RESPONSE,
+    b'createCustomerProfile': envelope(b'createCustomerProfileResponse', b"""
+<customerProfileId>10000001</customerProfileId>
+<customerPaymentProfileIdList><numericString>20000001</numericString></customerPaymentProfileIdList>"""),
+    b'getCustomerProfile': envelope(b'getCustomerProfileResponse', b"""
+<profile>
+  <email>joeyjoejoejunior@example.com</email>
+  <customerProfileId>10000001</customerProfileId>
+  <paymentProfiles>""" + PAYMENT_PROFILE + b"""</paymentProfiles>
+</profile>"""),
+    b'getCustomerPaymentProfile': envelope(b'getCustomerPaymentProfileResponse',
+                                           b'<paymentProfile>' + PAYMENT_PROFILE + b'</paymentProfile>'),
+    b'createCustomerProfileTransaction': envelope(b'createCustomerProfileTransactionResponse', b"""
+<directResponse>1,1,1,This transaction has been approved.,ABC123,Y,2200000002,,,12.00,CC,auth_capture,,Joey,Shabadoo,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,XXXX1111,Visa,,,,,,,,,,,,,,,,</directResponse>"""),
+    b'createCustomerPaymentProfile': envelope(b'createCustomerPaymentProfileResponse',
+                                              b'<customerPaymentProfileId>20000002</customerPaymentProfileId>'),
+    b'updateCustomerProfile': envelope(b'updateCustomerProfileResponse'),
+    b'updateCustomerPaymentProfile': envelope(b'updateCustomerPaymentProfileResponse'),
+    b'deleteCustomerProfile': envelope(b'deleteCustomerProfileResponse'),
+    b'deleteCustomerPaymentProfile': envelope(b'deleteCustomerPaymentProfileResponse'),
+    }
+
+REQUEST_NAME = re.compile(br'<(\w+)Request\b')
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # the headers and body are written separately; without this, delayed
+    # ACKs add 40ms to every keep-alive response
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        match = REQUEST_NAME.search(body)
+        response = RESPONSES.get(match.group(1)) if match else None
+        if response is None:
+            self.send_error(400)
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    The stub, listening on ``port`` (any free port by default) in a
+    background thread once it is started.
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), StubHandler)
+        self.latency = latency
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/xml/v1/request.api' % self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+
+def main(args=None):
+    parser = optparse.OptionParser(usage='python benchmarks/authnet_stub.py [options]',
+                                   description='Serves canned Authorize.net responses.')
+    parser.add_option('--port', type='int', default=0, help='default: any free port')
+    parser.add_option('--latency', type='float', default=0, help='seconds to delay each response by')
+    options, args = parser.parse_args(args)
+    if args:
+        parser.error('unexpected arguments: %s' % ' '.join(args))
+
+    server = StubServer(options.port, options.latency)
+    print('Listening at', server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
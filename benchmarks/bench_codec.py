@@ -0,0 +1,71 @@
+"""
+Size and speed of the ways a Transaction can be stored: pickling its
+``to_dict()`` ("to_dict"), pickling the object itself ("pickle") and
+``to_bytes()`` ("to_bytes").
+
+    $ python benchmarks/bench_codec.py [--iterations N]
+"""
+from __future__ import print_function
+
+import optparse
+import timeit
+
+from six.moves import cPickle as pickle
+
+from dinero import Transaction
+
+
+def make_transaction():
+    # what AuthorizeNet.retrieve returns
+    return Transaction(
+        gateway_name='default',
+        transaction_id='2200000001',
+        price='12.00',
+        auth_code='ABC123',
+        status='settledSuccessfully',
+        account_number='XXXX1111',
+        card_type='Visa',
+        last_4='1111',
+        avs_successful=True,
+        avs_zip_successful=True,
+        avs_address_successful=True,
+        cvv_successful=True,
+        customer_id=1234,
+        email='joey@example.com',
+        )
+
+
+def main(args=None):
+    parser = optparse.OptionParser(usage='python benchmarks/bench_codec.py [options]',
+                                   description='Size and speed of the ways a Transaction can be stored.')
+    parser.add_option('--iterations', type='int', default=100000, help='calls per timing')
+    options, args = parser.parse_args(args)
+    if args:
+        parser.error('unexpected arguments: %s' % ' '.join(args))
+
+    iterations = options.iterations
+    transaction = make_transaction()
+    cases = [
+        ('to_dict',
+         lambda: pickle.dumps(transaction.to_dict(), 2),
+         lambda data: Transaction.from_dict(pickle.loads(data))),
+        ('pickle',
+         lambda: pickle.dumps(transaction, 2),
+         pickle.loads),
+        ('to_bytes',
+         transaction.to_bytes,
+         Transaction.from_bytes),
+        ]
+
+    print('%-10s %8s %12s %12s' % ('', 'bytes', 'encode (us)', 'decode (us)'))
+    for name, encode, decode in cases:
+        data = encode()
+        assert decode(data).to_dict() == transaction.to_dict()
+        encoded = min(timeit.repeat(encode, number=iterations, repeat=3))
+        decoded = min(timeit.repeat(lambda: decode(data), number=iterations, repeat=3))
+        print('%-10s %8d %12.2f %12.2f' % (
+            name, len(data), encoded / iterations * 1e6, decoded / iterations * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Throughput and latency of the main operations against a local Authorize.net
+stub (see authnet_stub.py), so that no sandbox account is needed.
+
+    $ python benchmarks/bench_gateway.py --requests 2000 --concurrency 10 \\
+          --output before.json
+    $ python benchmarks/bench_gateway.py --compare before.json
+
+Each scenario is run ``--requests`` times, ``--concurrency`` at a time.
+Results are printed and, with ``--output``, saved as JSON; ``--compare``
+prints the change from a saved run.
+"""
+from __future__ import division, print_function
+
+import argparse
+import json
+import platform
+import sys
+
+import dinero
+from dinero.bulk import imap_ordered
+from dinero.timeouts import now
+
+from authnet_stub import StubServer
+
+CARD = {
+    'number': '4' + '1' * 15,
+    'month': '12',
+    'year': '2030',
+    'first_name': 'Joey',
+    'last_name': 'Shabadoo',
+    'zip': '12345',
+}
+
+
+def customer():
+    return dinero.Customer('bench', '10000001', card_id='20000001')
+
+
+SCENARIOS = [
+    ('transaction.create', lambda: dinero.Transaction.create(12, gateway_name='bench', **CARD)),
+    ('transaction.retrieve', lambda: dinero.Transaction.retrieve('2200000001', gateway_name='bench')),
+    ('transaction.refund', lambda: dinero.Transaction(
+        'bench', 12, '2200000001', account_number='XXXX1111', status='settledSuccessfully').refund()),
+    ('customer.create', lambda: dinero.Customer.create(gateway_name='bench', email='joey@example.com', **CARD)),
+    ('customer.retrieve', lambda: dinero.Customer.retrieve('10000001', gateway_name='bench')),
+    ('customer.charge', lambda: dinero.Transaction.create(12, customer=customer(), gateway_name='bench')),
+    ('customer.save', lambda: dinero.Customer('bench', '10000001', email='joey@example.com', **CARD).save()),
+    ('customer.delete', lambda: customer().delete()),
+    ]
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_scenario(fn, requests, concurrency):
+    def timed(_):
+        start = now()
+        fn()
+        return now() - start
+
+    start = now()
+    latencies = sorted(imap_ordered(timed, range(requests), concurrency))
+    elapsed = now() - start
+    return {
+        'requests': requests,
+        'seconds': elapsed,
+        'throughput': requests / elapsed,
+        'mean': sum(latencies) / requests,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        }
+
+
+def run(requests, concurrency, latency, only=None):
+    server = StubServer(latency=latency).start()
+    try:
+        dinero.configure({
+            'bench': {
+                'type': 'dinero.gateways.AuthorizeNet',
+                'login_id': 'login',
+                'transaction_key': 'key',
+                'pool_size': concurrency,
+            }
+        })
+        dinero.get_gateway('bench').url = server.url
+
+        results = {}
+        for name, fn in SCENARIOS:
+            if only and name not in only:
+                continue
+            # warm up the connection pool and the request templates
+            run_scenario(fn, concurrency, concurrency)
+            results[name] = run_scenario(fn, requests, concurrency)
+        return results
+    finally:
+        server.stop()
+
+
+def print_results(results, baseline=None):
+    header = '%-22s %10s %9s %9s %9s' % ('', 'req/s', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)')
+    print(header + ('  change (req/s, p99)' if baseline else ''))
+    for name in sorted(results):
+        result = results[name]
+        line = '%-22s %10.1f %9.2f %9.2f %9.2f' % (
+            name, result['throughput'], result['p50'] * 1e3, result['p95'] * 1e3, result['p99'] * 1e3)
+        if baseline and name in baseline:
+            before = baseline[name]
+            line += '  %+6.1f%% %+6.1f%%' % (
+                (result['throughput'] / before['throughput'] - 1) * 100,
+                (result['p99'] / before['p99'] - 1) * 100)
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds the stub waits before each response')
+    parser.add_argument('--scenario', action='append', dest='scenarios',
+                        help='only run this scenario (can be repeated)')
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='a JSON file saved by an earlier run')
+    args = parser.parse_args(argv)
+
+    results = run(args.requests, args.concurrency, args.latency, args.scenarios)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'requests': args.requests,
+                'concurrency': args.concurrency,
+                'latency': args.latency,
+                'results': results,
+                }, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
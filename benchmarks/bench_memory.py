@@ -0,0 +1,99 @@
+"""
+Memory used by 1M Transaction objects, with the old dict-backed model
+("before") vs. the __slots__-based one ("after").
+
+    $ python benchmarks/bench_memory.py [--count N]
+
+Requires Python 3.4+ (tracemalloc).  Creation times include the overhead of
+tracing allocations.
+"""
+from __future__ import print_function
+
+import gc
+import optparse
+import sys
+import time
+import tracemalloc
+
+from dinero import Transaction
+
+
+def resp(i):
+    # what AuthorizeNet.retrieve returns
+    return {
+        'transaction_id': str(2200000000 + i),
+        'price': '12.00',
+        'auth_code': 'ABC123',
+        'status': 'settledSuccessfully',
+        'account_number': 'XXXX1111',
+        'card_type': 'Visa',
+        'last_4': '1111',
+        'avs_successful': True,
+        'avs_zip_successful': True,
+        'avs_address_successful': True,
+        'cvv_successful': True,
+        'customer_id': 1234,
+        'email': 'joey@example.com',
+    }
+
+
+class DictTransaction(object):
+    """
+    The dict-backed model that Transaction used to be.
+    """
+
+    def __init__(self, gateway_name, price, transaction_id, **kwargs):
+        self.gateway_name = gateway_name
+        self.price = price
+        self.transaction_id = transaction_id
+        self.data = kwargs
+
+    def __getattr__(self, attr):
+        try:
+            return self.data[attr]
+        except KeyError as e:
+            raise AttributeError(e)
+
+    def __setattr__(self, attr, val):
+        if attr in ['gateway_name', 'transaction_id', 'price', 'data']:
+            self.__dict__[attr] = val
+        else:
+            self.data[attr] = val
+
+
+def measure(cls, count):
+    responses = [resp(i) for i in range(count)]
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    objects = [cls(gateway_name='default', **r) for r in responses]
+    created = time.time() - start
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.time()
+    for obj in objects:
+        obj.status
+        obj.auth_code
+    accessed = time.time() - start
+    # the list itself isn't part of the per-object cost
+    return size - sys.getsizeof(objects), created, accessed
+
+
+def main(args=None):
+    parser = optparse.OptionParser(usage='python benchmarks/bench_memory.py [options]',
+                                   description='Memory used by Transaction objects.')
+    parser.add_option('--count', type='int', default=1000000, help='number of objects')
+    options, args = parser.parse_args(args)
+    if args:
+        parser.error('unexpected arguments: %s' % ' '.join(args))
+
+    count = options.count
+    print('%-8s %14s %10s %12s %12s' % ('', 'total (MB)', 'per object', 'create (s)', 'access (s)'))
+    for name, cls in [('before', DictTransaction), ('after', Transaction)]:
+        size, created, accessed = measure(cls, count)
+        print('%-8s %14.1f %9dB %12.2f %12.2f' % (name, size / 1e6, size // count, created, accessed))
+
+
+if __name__ == '__main__':
+    main()
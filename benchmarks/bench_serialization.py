@@ -0,0 +1,71 @@
+"""
+Per-request serialization cost of the AuthorizeNet hot path request types,
+building an lxml tree and serializing it ("before") vs. the pre-serialized
+request templates ("after").
+
+    $ python benchmarks/bench_serialization.py [--iterations N]
+"""
+from __future__ import print_function
+
+import optparse
+import timeit
+
+from lxml import etree
+
+from dinero.gateways import AuthorizeNet
+from dinero.gateways.transport import MemoryTransport
+
+
+OPTIONS = {
+    'number': '4' + '1' * 15,
+    'month': '12',
+    'year': '2030',
+    'cvv': '900',
+    'first_name': 'Joey',
+    'last_name': 'Shabadoo',
+    'address': '123 somewhere st',
+    'city': 'somewhere',
+    'state': 'SW',
+    'zip': '12345',
+    'email': 'joeyjoejoejunior@example.com',
+    'customer_id': 123,
+}
+
+
+def main(args=None):
+    parser = optparse.OptionParser(usage='python benchmarks/bench_serialization.py [options]',
+                                   description='Serialization cost of the AuthorizeNet requests.')
+    parser.add_option('--iterations', type='int', default=20000, help='calls per timing')
+    options, args = parser.parse_args(args)
+    if args:
+        parser.error('unexpected arguments: %s' % ' '.join(args))
+
+    iterations = options.iterations
+    gateway = AuthorizeNet({
+        'login_id': 'login',
+        'transaction_key': 'key',
+        'transport': MemoryTransport(),
+    })
+
+    cases = [
+        ('createTransactionRequest',
+         lambda: etree.tostring(gateway._transaction_xml(12, OPTIONS)),
+         lambda: gateway._transaction_request(12, OPTIONS)),
+        ('createCustomerProfileTransactionRequest',
+         lambda: etree.tostring(gateway._charge_customer_xml('10000001', '20000001', 12, OPTIONS)),
+         lambda: gateway._charge_customer_request('10000001', '20000001', 12, OPTIONS)),
+        ('getTransactionDetailsRequest',
+         lambda: etree.tostring(gateway._retrieve_xml('2200000001')),
+         lambda: gateway._retrieve_request('2200000001')),
+    ]
+
+    print('%-42s %12s %12s %8s' % ('request', 'before (us)', 'after (us)', 'speedup'))
+    for name, before, after in cases:
+        assert before() == after()
+        before_us = min(timeit.repeat(before, number=iterations, repeat=3)) / iterations * 1e6
+        after_us = min(timeit.repeat(after, number=iterations, repeat=3)) / iterations * 1e6
+        print('%-42s %12.2f %12.2f %7.1fx' % (name, before_us, after_us, before_us / after_us))
+
+
+if __name__ == '__main__':
+    main()
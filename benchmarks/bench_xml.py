@@ -0,0 +1,155 @@
+"""
+Microbenchmarks of the AuthorizeNet XML layer (building requests, parsing
+responses and mapping them to dinero's dicts) over the responses in
+corpus.py.
+
+    $ python benchmarks/bench_xml.py --output before.json
+    $ python benchmarks/bench_xml.py --compare before.json --max-regression 10
+
+Each case is calibrated to run for about ``--min-time`` seconds per round,
+and the fastest of ``--rounds`` rounds is reported.  With
+``--max-regression``, the exit status is 1 if any case got slower than
+that many percent compared to ``--compare``.
+"""
+from __future__ import division, print_function
+
+import argparse
+import copy
+import json
+import platform
+import sys
+import timeit
+
+from lxml import etree
+
+from dinero.gateways import AuthorizeNet
+from dinero.gateways.authorizenet_gateway import (
+        _dict_to_xml,
+        decode_response,
+        parse_xml_response,
+        xml_to_dict,
+        )
+from dinero.gateways.transport import MemoryTransport
+
+from corpus import CORPUS
+
+OPTIONS = {
+    'number': '4' + '1' * 15,
+    'month': '12',
+    'year': '2030',
+    'cvv': '900',
+    'first_name': 'Joey',
+    'last_name': 'Shabadoo',
+    'address': '123 somewhere st',
+    'city': 'somewhere',
+    'state': 'SW',
+    'zip': '12345',
+    'email': 'joeyjoejoejunior@example.com',
+    'customer_id': 123,
+}
+
+
+def cases():
+    gateway = AuthorizeNet({
+        'login_id': 'login',
+        'transaction_key': 'key',
+        'transport': MemoryTransport(),
+    })
+    # the request bodies as dicts, as build_xml gets them
+    charge_request = xml_to_dict(gateway._transaction_xml(12, OPTIONS))
+    customer_request = xml_to_dict(gateway._create_customer_xml(OPTIONS))
+
+    yield '_dict_to_xml[charge]', lambda: _dict_to_xml(etree.Element('root'), charge_request)
+    yield '_dict_to_xml[customer]', lambda: _dict_to_xml(etree.Element('root'), customer_request)
+    yield 'build_xml[charge]', lambda: gateway.build_xml('createTransactionRequest', charge_request)
+    yield 'build_xml[customer]', lambda: gateway.build_xml('createCustomerProfileRequest', customer_request)
+
+    for name, content in CORPUS:
+        root = parse_xml_response(content)
+        resp = decode_response(root)
+        yield 'parse[%s]' % name, lambda content=content: parse_xml_response(content)
+        yield 'xml_to_dict[%s]' % name, lambda root=root: xml_to_dict(root)
+        yield 'decode_response[%s]' % name, lambda root=root: decode_response(root)
+        yield 'check_for_error[%s]' % name, lambda resp=resp: check(gateway, resp)
+
+        if 'transactionResponse' in resp:
+            yield ('_resp_to_transaction_dict[%s]' % name,
+                   lambda resp=resp: gateway._resp_to_transaction_dict(resp['transactionResponse'], 12))
+        elif 'transaction' in resp:
+            yield ('_resp_to_transaction_dict[%s]' % name,
+                   lambda resp=resp: gateway._resp_to_transaction_dict(resp['transaction'], '129.99'))
+        elif 'directResponse' in resp:
+            yield ('_resp_to_transaction_dict_direct_response[%s]' % name,
+                   lambda resp=resp: gateway._resp_to_transaction_dict_direct_response(resp['directResponse'], 12))
+        elif 'profile' in resp:
+            # _dict_to_customer changes the dict it is given
+            profile = copy.deepcopy(resp['profile'])
+            yield '_dict_to_customer[%s]' % name, lambda: gateway._dict_to_customer(profile)
+
+
+def check(gateway, resp):
+    try:
+        gateway.check_for_error(resp)
+    except Exception:
+        pass
+
+
+def measure(fn, min_time, rounds):
+    """
+    Seconds per call: the fastest of ``rounds`` rounds, each long enough to
+    take about ``min_time``.
+    """
+    timer = timeit.Timer(fn)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time / 10:
+            break
+        number *= 10
+    number = max(1, int(number * min_time / elapsed))
+    return min(timer.repeat(rounds, number)) / number
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--min-time', type=float, default=0.2)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('-k', dest='pattern', help='only run cases whose name contains this')
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='a JSON file saved by an earlier run')
+    parser.add_argument('--max-regression', type=float,
+                        help='fail if a case is this many percent slower than --compare')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    regressions = []
+    print('%-60s %12s' % ('', 'us per call') + ('  change' if baseline else ''))
+    for name, fn in cases():
+        if args.pattern and args.pattern not in name:
+            continue
+        seconds = results[name] = measure(fn, args.min_time, args.rounds)
+        line = '%-60s %12.2f' % (name, seconds * 1e6)
+        if name in baseline:
+            change = (seconds / baseline[name] - 1) * 100
+            line += '  %+6.1f%%' % change
+            if args.max_regression is not None and change > args.max_regression:
+                regressions.append(name)
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': platform.python_version(), 'results': results}, f, indent=2, sort_keys=True)
+
+    if regressions:
+        print('\nSlower by more than %s%%: %s' % (args.max_regression, ', '.join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+Authorize.net responses shaped like recorded production traffic, from a
+single charge up to a customer profile with hundreds of payment profiles.
+Card numbers, ids and names are made up.
+"""
+import codecs
+
+NS = b'AnetApi/xml/v1/schema/AnetApiSchema.xsd'
+
+OK_MESSAGES = b"""
+  <messages>
+    <resultCode>Ok</resultCode>
+    <message>
+      <code>I00001</code>
+      <text>Successful.</text>
+    </message>
+  </messages>"""
+
+
+def envelope(name, body, messages=OK_MESSAGES):
+    # authorize.net sends a BOM
+    return (codecs.BOM_UTF8 + b'<?xml version="1.0" encoding="utf-8"?>\n'
+            b'<' + name + b' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+            b'xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns="' + NS + b'">'
+            + messages + body + b'\n</' + name + b'>')
+
+
+def charge_response():
+    return envelope(b'createTransactionResponse', b"""
+  <transactionResponse>
+    <responseCode>1</responseCode>
+    <authCode>HH5414</authCode>
+    <avsResultCode>Y</avsResultCode>
+    <cvvResultCode>M</cvvResultCode>
+    <cavvResultCode>2</cavvResultCode>
+    <transId>2214523411</transId>
+    <refTransID />
+    <transHash>D15F90A2DCF7B7FD7D15E220B7676708</transHash>
+    <testRequest>0</testRequest>
+    <accountNumber>XXXX1111</accountNumber>
+    <accountType>Visa</accountType>
+    <messages>
+      <message>
+        <code>1</code>
+        <description>This transaction has been approved.</description>
+      </message>
+    </messages>
+    <transHashSha2 />
+    <SupplementalDataQualificationIndicator>0</SupplementalDataQualificationIndicator>
+    <networkTransId>123456789NNNH</networkTransId>
+  </transactionResponse>""")
+
+
+def declined_response():
+    return envelope(b'createTransactionResponse', b"""
+  <transactionResponse>
+    <responseCode>2</responseCode>
+    <authCode />
+    <avsResultCode>Y</avsResultCode>
+    <cvvResultCode>N</cvvResultCode>
+    <cavvResultCode>2</cavvResultCode>
+    <transId>2214523412</transId>
+    <refTransID />
+    <transHash>A9B2C5F1D2E3C4B5A6F7E8D9C0B1A2F3</transHash>
+    <testRequest>0</testRequest>
+    <accountNumber>XXXX0027</accountNumber>
+    <accountType>Visa</accountType>
+    <errors>
+      <error>
+        <errorCode>2</errorCode>
+        <errorText>This transaction has been declined.</errorText>
+      </error>
+    </errors>
+  </transactionResponse>""", messages=b"""
+  <messages>
+    <resultCode>Error</resultCode>
+    <message>
+      <code>E00027</code>
+      <text>The transaction was unsuccessful.</text>
+    </message>
+  </messages>""")
+
+
+def transaction_details_response():
+    return envelope(b'getTransactionDetailsResponse', b"""
+  <transaction>
+    <transId>2214523411</transId>
+    <submitTimeUTC>2026-10-18T16:00:00.123Z</submitTimeUTC>
+    <submitTimeLocal>2026-10-18T10:00:00.123</submitTimeLocal>
+    <transactionType>authCaptureTransaction</transactionType>
+    <transactionStatus>settledSuccessfully</transactionStatus>
+    <responseCode>1</responseCode>
+    <responseReasonCode>1</responseReasonCode>
+    <responseReasonDescription>Approval</responseReasonDescription>
+    <authCode>HH5414</authCode>
+    <AVSResponse>Y</AVSResponse>
+    <cardCodeResponse>M</cardCodeResponse>
+    <batch>
+      <batchId>12345678</batchId>
+      <settlementTimeUTC>2026-10-19T03:15:40.6Z</settlementTimeUTC>
+      <settlementTimeLocal>2026-10-18T21:15:40.6</settlementTimeLocal>
+      <settlementState>settledSuccessfully</settlementState>
+    </batch>
+    <order>
+      <invoiceNumber>INV-20261018-0001</invoiceNumber>
+      <description>Order from the web store</description>
+    </order>
+    <authAmount>129.99</authAmount>
+    <settleAmount>129.99</settleAmount>
+    <tax>
+      <amount>9.75</amount>
+      <name>Sales tax</name>
+    </tax>
+    <taxExempt>false</taxExempt>
+    <payment>
+      <creditCard>
+        <cardNumber>XXXX1111</cardNumber>
+        <expirationDate>XXXX</expirationDate>
+        <cardType>Visa</cardType>
+      </creditCard>
+    </payment>
+    <customer>
+      <type>individual</type>
+      <id>483920</id>
+      <email>joeyjoejoejunior@example.com</email>
+    </customer>
+    <billTo>
+      <firstName>Joey</firstName>
+      <lastName>Shabadoo</lastName>
+      <address>123 Somewhere St</address>
+      <city>Denver</city>
+      <state>CO</state>
+      <zip>80202</zip>
+      <country>USA</country>
+      <phoneNumber>303-555-0100</phoneNumber>
+    </billTo>
+    <recurringBilling>false</recurringBilling>
+    <customerIP>203.0.113.10</customerIP>
+    <product>Card Not Present</product>
+    <marketType>eCommerce</marketType>
+  </transaction>""")
+
+
+def charge_customer_response():
+    return envelope(b'createCustomerProfileTransactionResponse', b"""
+  <directResponse>1,1,1,This transaction has been approved.,HH5414,Y,2214523413,INV-1,Order from the web store,129.99,CC,auth_capture,483920,Joey,Shabadoo,,123 Somewhere St,Denver,CO,80202,USA,303-555-0100,,joeyjoejoejunior@example.com,,,,,,,,,9.75,,,,,FALSE,,D15F90A2DCF7B7FD7D15E220B7676708,M,2,,,,,,,,,,,XXXX1111,Visa,,,,,,,,,,,,,,,,</directResponse>""")
+
+
+def payment_profile(i):
+    return ("""
+    <paymentProfiles>
+      <customerType>individual</customerType>
+      <billTo>
+        <firstName>Joey</firstName>
+        <lastName>Shabadoo</lastName>
+        <company>Shabadoo Holdings</company>
+        <address>%d Somewhere St</address>
+        <city>Denver</city>
+        <state>CO</state>
+        <zip>80202</zip>
+        <country>USA</country>
+        <phoneNumber>303-555-0100</phoneNumber>
+      </billTo>
+      <customerPaymentProfileId>%d</customerPaymentProfileId>
+      <payment>
+        <creditCard>
+          <cardNumber>XXXX%04d</cardNumber>
+          <expirationDate>XXXX</expirationDate>
+          <cardType>Visa</cardType>
+        </creditCard>
+      </payment>
+    </paymentProfiles>""" % (100 + i, 20000000 + i, i % 10000)).encode('ascii')
+
+
+def customer_profile_response(payment_profiles=1):
+    return envelope(b'getCustomerProfileResponse', b"""
+  <profile>
+    <merchantCustomerId>483920</merchantCustomerId>
+    <description>Joey Shabadoo</description>
+    <email>joeyjoejoejunior@example.com</email>
+    <customerProfileId>10000001</customerProfileId>"""
+        + b''.join(payment_profile(i) for i in range(payment_profiles)) + b"""
+  </profile>""")
+
+
+CORPUS = [
+    ('charge', charge_response()),
+    ('declined', declined_response()),
+    ('transaction_details', transaction_details_response()),
+    ('charge_customer', charge_customer_response()),
+    ('profile_1', customer_profile_response(1)),
+    ('profile_10', customer_profile_response(10)),
+    ('profile_100', customer_profile_response(100)),
+    ('profile_500', customer_profile_response(500)),
+    ]
@@ -0,0 +1,18 @@
+"""
+The bench_xml.py cases for pytest-benchmark, when it is installed::
+
+    $ py.test benchmarks/test_bench_xml.py --benchmark-autosave
+    $ py.test benchmarks/test_bench_xml.py --benchmark-compare --benchmark-compare-fail=min:10%
+"""
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from bench_xml import cases
+
+CASES = list(cases())
+
+
+@pytest.mark.parametrize('fn', [fn for name, fn in CASES], ids=[name for name, fn in CASES])
+def test_xml(benchmark, fn):
+    benchmark(fn)
@@ -1,5 +1,6 @@
 from dinero.configure import configure, get_gateway
 from dinero.exceptions import *
+from dinero.timeouts import deadline
 from dinero.transaction import Transaction
 from dinero.customer import Customer
 from dinero.card import CreditCard
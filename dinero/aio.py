@@ -0,0 +1,300 @@
+"""
+Coroutine versions of the :class:`dinero.Transaction`, :class:`dinero.Customer`
+and :class:`dinero.CreditCard` methods.  This module requires Python 3.5 or
+newer; the model classes only mix these in when it is available.
+
+::
+
+    transaction = await dinero.Transaction.acreate(
+        price=200,
+        number='4111111111111111',
+        month='12',
+        year='2015',
+    )
+"""
+import asyncio
+import copy
+import functools
+import time
+
+from dinero import exceptions, get_gateway
+from dinero.exceptions import GatewayTimeout, InvalidCustomerException
+from dinero.cache import get_cached, set_cached
+from dinero.identity import identify, forget
+from dinero.log import log, log_call
+from dinero.metrics import collect_timings, start_operation, finish_operation
+from dinero.singleflight import copy_error
+from dinero.timeouts import deadline, now, request_timeout
+
+
+def alog(fn):
+    """
+    :func:`dinero.log.log` for coroutine functions.
+    """
+    @functools.wraps(fn)
+    async def inner(*args, **kwargs):
+        start_time = time.time()
+
+        try:
+            value = await fn(*args, **kwargs)
+            log_call(fn, args, kwargs, time.time() - start_time)
+            return value
+        except Exception as e:
+            log_call(fn, args, kwargs, time.time() - start_time, e)
+            raise
+
+    return inner
+
+
+def ametered(fn):
+    """
+    :func:`dinero.metrics.metered` for coroutine functions.
+    """
+    @functools.wraps(fn)
+    async def inner(self, *args, **kwargs):
+        started = start_operation()
+        if started is None:
+            return await fn(self, *args, **kwargs)
+
+        start_time = now()
+        error = None
+        try:
+            return await fn(self, *args, **kwargs)
+        except BaseException as e:
+            # including a cancellation
+            error = e
+            raise
+        finally:
+            finish_operation(started, self.name, fn.__name__, now() - start_time, error)
+
+    return inner
+
+
+async def acoalesced(gateway, kind, key, fn, *args):
+    """
+    :func:`dinero.singleflight.coalesced` for coroutine functions.  The
+    request runs in its own task, so it carries on for the other callers if
+    the one that started it is cancelled.
+    """
+    single_flight = gateway.single_flight
+    if single_flight is None:
+        return await fn(*args)
+
+    key = (kind, key)
+    loop = asyncio.get_event_loop()
+    while True:
+        with single_flight._lock:
+            tasks = single_flight._tasks.setdefault(key, {})
+            task = tasks.get(loop)
+            leader = task is None
+            if leader:
+                task = tasks[loop] = asyncio.ensure_future(fn(*args))
+                task.add_done_callback(functools.partial(single_flight._task_done, key, loop, task))
+            else:
+                single_flight.coalesced += 1
+
+        if leader:
+            return await asyncio.shield(task)
+
+        try:
+            # the caller's own deadline still applies
+            result = await asyncio.wait_for(asyncio.shield(task), request_timeout())
+        except asyncio.TimeoutError:
+            raise GatewayTimeout('Timed out waiting for a request in flight')
+        except GatewayTimeout:
+            # maybe only the deadline of the caller that started it, try
+            # again with this one's
+            continue
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise
+            continue
+        except Exception as e:
+            raise copy_error(e)
+        # callers are free to change what they get back
+        return copy.deepcopy(result)
+
+
+class TransactionAsyncMixin(object):
+    __slots__ = ()
+
+    @classmethod
+    @log
+    async def acreate(cls, price, gateway_name=None, timeout=None, **kwargs):
+        """
+        Coroutine version of :meth:`create`.
+        """
+        gateway = get_gateway(gateway_name)
+        with deadline(timeout), collect_timings() as timings:
+            resp = await gateway.aio.charge(price, kwargs)
+        transaction = identify(gateway, 'transaction', resp['transaction_id'], cls(gateway_name=gateway.name, **resp))
+        transaction.timings = timings
+        return transaction
+
+    @classmethod
+    @log
+    async def aretrieve(cls, transaction_id, gateway_name=None, timeout=None):
+        """
+        Coroutine version of :meth:`retrieve`.
+        """
+        gateway = get_gateway(gateway_name)
+        resp = get_cached(gateway, 'transaction', transaction_id)
+        timings = None
+        if resp is None:
+            with deadline(timeout), collect_timings() as timings:
+                resp = await gateway.aio.retrieve(transaction_id)
+            set_cached(gateway, 'transaction', transaction_id, resp)
+        transaction = identify(gateway, 'transaction', transaction_id, cls(gateway_name=gateway.name, **resp))
+        transaction.timings = timings
+        return transaction
+
+    @log
+    async def arefund(self, amount=None, timeout=None):
+        """
+        Coroutine version of :meth:`refund`.
+        """
+        gateway = get_gateway(self.gateway_name)
+        try:
+            return await self._arefund(gateway, amount, timeout)
+        finally:
+            self._invalidate(gateway)
+
+    async def _arefund(self, gateway, amount, timeout):
+        full = amount is None or amount == self.price
+
+        with deadline(timeout):
+            # see Transaction._refund
+            voided = False
+            if full and gateway.is_settled(self) is False:
+                try:
+                    return await gateway.aio.void(self)
+                except exceptions.PaymentException:
+                    voided = True
+
+            try:
+                return await gateway.aio.refund(self, amount or self.price)
+            except exceptions.PaymentException:
+                if full and not voided:
+                    return await gateway.aio.void(self)
+                elif full:
+                    raise
+                else:
+                    raise exceptions.PaymentException(
+                        "You cannot refund a transaction that hasn't been settled"
+                        " unless you refund it for the full amount."
+                    )
+
+    @log
+    async def asettle(self, amount=None, timeout=None):
+        """
+        Coroutine version of :meth:`settle`.
+        """
+        gateway = get_gateway(self.gateway_name)
+        try:
+            with deadline(timeout):
+                return await gateway.aio.settle(self, amount or self.price)
+        finally:
+            self._invalidate(gateway)
+
+
+class CustomerAsyncMixin(object):
+    __slots__ = ()
+
+    @classmethod
+    @log
+    async def acreate(cls, gateway_name=None, timeout=None, **kwargs):
+        """
+        Coroutine version of :meth:`create`.
+        """
+        gateway = get_gateway(gateway_name).aio
+        with deadline(timeout), collect_timings() as timings:
+            resp = await gateway.create_customer(kwargs)
+        customer = identify(gateway.gateway, 'customer', resp['customer_id'], cls(gateway_name=gateway.name, **resp))
+        customer.timings = timings
+        return customer
+
+    @classmethod
+    @log
+    async def aretrieve(cls, customer_id, gateway_name=None, timeout=None):
+        """
+        Coroutine version of :meth:`retrieve`.
+        """
+        from dinero.card import CreditCard
+
+        gateway = get_gateway(gateway_name).aio
+        with deadline(timeout), collect_timings() as timings:
+            resp, cards = await gateway.retrieve_customer(customer_id)
+        customer = cls(gateway_name=gateway.name, **resp)
+        for card in cards:
+            customer.cards.append(CreditCard(
+                gateway_name=gateway.name,
+                **card
+                ))
+        customer = identify(gateway.gateway, 'customer', customer_id, customer)
+        customer.timings = timings
+        return customer
+
+    @log
+    async def asave(self, timeout=None):
+        """
+        Coroutine version of :meth:`save`.
+        """
+        if not self.customer_id:
+            raise InvalidCustomerException("Cannot save a customer that doesn't have a customer_id")
+        gateway = get_gateway(self.gateway_name).aio
+        with deadline(timeout):
+            await gateway.update_customer(self.customer_id, self.data)
+        return True
+
+    @log
+    async def adelete(self, timeout=None):
+        """
+        Coroutine version of :meth:`delete`.
+        """
+        if not self.customer_id:
+            raise InvalidCustomerException("Cannot delete a customer that doesn't have a customer_id")
+        gateway = get_gateway(self.gateway_name).aio
+        with deadline(timeout):
+            await gateway.delete_customer(self.customer_id)
+        forget(gateway.gateway, 'customer', self.customer_id)
+        self.customer_id = None
+        return True
+
+    @log
+    async def aadd_card(self, gateway_name=None, timeout=None, **options):
+        """
+        Coroutine version of :meth:`add_card`.
+        """
+        from dinero.card import CreditCard
+
+        if not self.customer_id:
+            raise InvalidCustomerException("Cannot add a card to a customer that doesn't have a customer_id")
+        gateway = get_gateway(gateway_name).aio
+        with deadline(timeout):
+            resp = await gateway.add_card_to_customer(self, options)
+        card = CreditCard(gateway_name=self.gateway_name, **resp)
+        self.cards.append(card)
+        return card
+
+
+class CreditCardAsyncMixin(object):
+    __slots__ = ()
+
+    @log
+    async def asave(self, timeout=None):
+        """
+        Coroutine version of :meth:`save`.
+        """
+        gateway = get_gateway(self.gateway_name).aio
+        with deadline(timeout):
+            await gateway.update_card(self)
+
+    @log
+    async def adelete(self, timeout=None):
+        """
+        Coroutine version of :meth:`delete`.
+        """
+        gateway = get_gateway(self.gateway_name).aio
+        with deadline(timeout):
+            await gateway.delete_card(self)
+        return True
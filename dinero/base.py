@@ -1,11 +1,355 @@
+import json
+import struct
+from decimal import Decimal
+
+import six
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # Python 2
+    from collections import MutableMapping
+
+
+class Fields(MutableMapping):
+    """
+    The ``data`` of a :class:`DineroObject`: a dict-like view of its fields,
+    known and extra.
+    """
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __getitem__(self, key):
+        obj = self.obj
+        if key in obj._field_set:
+            try:
+                return getattr(obj, key)
+            except AttributeError:
+                raise KeyError(key)
+        extra = _extras(obj)
+        if extra is None:
+            raise KeyError(key)
+        return extra[key]
+
+    def __setitem__(self, key, value):
+        obj = self.obj
+        if key in obj._field_set:
+            setattr(obj, key, value)
+        else:
+            obj._set_extra(key, value)
+
+    def __delitem__(self, key):
+        obj = self.obj
+        if key in obj._field_set:
+            try:
+                delattr(obj, key)
+            except AttributeError:
+                raise KeyError(key)
+        else:
+            extra = _extras(obj)
+            if extra is None:
+                raise KeyError(key)
+            del extra[key]
+
+    def __iter__(self):
+        obj = self.obj
+        for field in obj._fields:
+            if hasattr(obj, field):
+                yield field
+        extra = _extras(obj)
+        if extra:
+            for key in extra:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+_setattr = object.__setattr__
+
+
+def _extras(obj):
+    try:
+        # the slot itself, so that an unset one doesn't go through __getattr__
+        return _get_extra(obj)
+    except AttributeError:
+        return None
+
+
 class DineroObject(object):
-    def __getattr__(self, attr):
-        if attr == '__setstate__':
-            raise AttributeError
-        try:
-            return self.data[attr]
-        except KeyError as e:
-            raise AttributeError(e)
+    """
+    The fields every gateway returns are stored in ``__slots__`` (subclasses
+    list them in ``_fields``).  Anything else goes in ``_extra``, a dict that
+    is only allocated for objects that have extra fields, and can be read as
+    an attribute unless the class has an attribute of the same name (like
+    ``refund``); ``data`` always has it.  The identifying attributes, like
+    ``transaction_id``, are listed in ``_core`` and kept out of ``data``.
+    """
+    # __weakref__ for dinero.identity
+    __slots__ = ('_extra', '__weakref__', '_timings')
+
+    _core = ()
+    _fields = ()
+    _field_set = frozenset()
+    # identifies the class in to_bytes, never reuse one
+    _type_code = None
+
+    def _set_data(self, data):
+        fields = self._field_set
+        for key, value in data.items():
+            if key in fields:
+                # the slot itself, skipping __setattr__
+                _setattr(self, key, value)
+            else:
+                self._set_extra(key, value)
+
+    def _set_extra(self, key, value):
+        extra = _extras(self)
+        if extra is None:
+            extra = self._extra = {}
+        extra[key] = value
+
+    def __getattr__(self, name):
+        # only called when the usual lookup fails, so never for a method
+        if not name.startswith('_'):
+            extra = _extras(self)
+            if extra is not None and name in extra:
+                return extra[name]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if hasattr(type(self), name) or name.startswith('_'):
+            # a slot, or a property like timings
+            _setattr(self, name, value)
+        else:
+            self._set_extra(name, value)
+
+    def __delattr__(self, name):
+        if name.startswith('_') or hasattr(type(self), name):
+            object.__delattr__(self, name)
+        else:
+            extra = _extras(self)
+            if extra is None or name not in extra:
+                raise AttributeError(name)
+            del extra[name]
+
+    @property
+    def timings(self):
+        """
+        The seconds spent in each phase of the gateway operation that
+        created or retrieved this object (see :mod:`dinero.metrics`), or
+        None.
+        """
+        return getattr(self, '_timings', None)
+
+    @timings.setter
+    def timings(self, timings):
+        self._timings = timings
+
+    @property
+    def data(self):
+        return Fields(self)
+
+    @data.setter
+    def data(self, data):
+        for field in self._fields:
+            if hasattr(self, field):
+                delattr(self, field)
+        self._extra = None
+        self._set_data(data)
+
+    def _update_from(self, other):
+        """
+        Copies the attributes and fields of ``other``, a newer copy of the
+        same object.  Fields that ``other`` doesn't have are kept.
+        """
+        for attr in self._core:
+            setattr(self, attr, getattr(other, attr))
+        self._set_data(other.data)
 
     def to_dict(self):
-        return vars(self)
+        ret = dict((attr, getattr(self, attr)) for attr in self._core)
+        ret['data'] = dict(self.data)
+        return ret
+
+    def __reduce__(self):
+        return (_restore, (type(self), tuple(getattr(self, attr) for attr in self._core), dict(self.data)))
+
+    def to_bytes(self):
+        """
+        A compact binary representation of the object, see
+        :meth:`from_bytes`.  Field values have to be JSON types, tuples,
+        :class:`decimal.Decimal` or dinero objects, and the bytes can be read
+        by any version of Python that dinero supports.
+        """
+        return HEADER.pack(MAGIC, FORMAT_VERSION, self._type_code) + _encode_json(self._state()).encode('utf-8')
+
+    def _state(self):
+        mask = 0
+        values = []
+        for i, get in enumerate(_slot_getters(type(self))):
+            try:
+                # the slot itself, an unset one doesn't go through __getattr__
+                value = get(self)
+            except AttributeError:
+                continue
+            mask |= 1 << i
+            values.append(value if type(value) in _PLAIN_TYPES else _pack_value(value))
+        extra = _extras(self)
+        return [
+            [_pack_value(getattr(self, attr)) for attr in self._core],
+            mask,
+            values,
+            _pack_value(extra) if extra else None,
+            ]
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Rebuilds an object from :meth:`to_bytes`.  Called on
+        :class:`DineroObject`, it returns whichever class was serialized.
+        """
+        try:
+            magic, version, code = HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError('Not a serialized dinero object')
+        if magic != MAGIC:
+            raise ValueError('Not a serialized dinero object')
+        if version != FORMAT_VERSION:
+            raise ValueError('Unsupported format version: {0}'.format(version))
+        obj_cls = _type_for_code(code)
+        if not issubclass(obj_cls, cls):
+            raise ValueError('Expected a {0}, got a {1}'.format(cls.__name__, obj_cls.__name__))
+        return _from_state(obj_cls, _decode_json(data[HEADER.size:].decode('utf-8')))
+
+
+_get_extra = DineroObject.__dict__['_extra'].__get__
+
+
+def _from_state(cls, state):
+    try:
+        core, mask, values, extra = state
+        obj = cls.__new__(cls)
+        for attr, value in zip(cls._core, core):
+            _setattr(obj, attr, _unpack_value(value))
+        values = iter(values)
+        for i, set_ in enumerate(_slot_setters(cls)):
+            if mask & (1 << i):
+                value = next(values)
+                set_(obj, value if type(value) in _PLAIN_TYPES else _unpack_value(value))
+        if extra:
+            obj._extra = _unpack_value(extra)
+    except (TypeError, ValueError, StopIteration):
+        raise ValueError('Corrupt serialized dinero object')
+    return obj
+
+
+def _restore(cls, core, data):
+    """
+    Rebuilds a pickled :class:`DineroObject`.
+    """
+    obj = cls.__new__(cls)
+    for attr, value in zip(cls._core, core):
+        setattr(obj, attr, value)
+    obj._set_data(data)
+    return obj
+
+
+##|
+##|  BINARY FORMAT
+##|
+# A serialized object is a header (magic, format version, type code)
+# followed by a JSON list:
+#
+#     [core values, bitmask of the _fields that are set, their values, extras]
+#
+# Fields are identified by their position in _fields, so new fields may only
+# be appended.  Anything else needs a new FORMAT_VERSION.  Values JSON
+# doesn't have are objects with a single tagged key, so every dict is
+# tagged too:
+#
+#     {"$decimal": "12.00"}
+#     {"$tuple": [values]}
+#     {"$dict": [[key, value], ...]}
+#     {"$object": [type code, [core, mask, values, extras]]}
+MAGIC = b'DN'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<2sBB')
+
+_types = {}
+
+# json.dumps builds a new encoder for every call with options
+_encode_json = json.JSONEncoder(separators=(',', ':')).encode
+_decode_json = json.JSONDecoder().decode
+
+# values that are written (and read back) as they are
+_PLAIN_TYPES = frozenset((type(None), bool, float) + six.integer_types + six.string_types + (six.text_type,))
+
+
+def _slot_getters(cls):
+    """
+    The ``__get__`` of the slot of each of ``cls._fields``, in order.
+    """
+    getters = cls.__dict__.get('_getters')
+    if getters is None:
+        getters = cls._getters = tuple(getattr(cls, field).__get__ for field in cls._fields)
+    return getters
+
+
+def _slot_setters(cls):
+    setters = cls.__dict__.get('_setters')
+    if setters is None:
+        setters = cls._setters = tuple(getattr(cls, field).__set__ for field in cls._fields)
+    return setters
+
+
+def _type_for_code(code):
+    if code not in _types:
+        pending = list(DineroObject.__subclasses__())
+        while pending:
+            cls = pending.pop()
+            if cls._type_code is not None:
+                _types[cls._type_code] = cls
+            pending.extend(cls.__subclasses__())
+    try:
+        return _types[code]
+    except KeyError:
+        raise ValueError('Unknown type code: {0}'.format(code))
+
+
+def _pack_value(value):
+    if value is None or isinstance(value, (bool, float) + six.integer_types + six.string_types):
+        return value
+    if isinstance(value, list):
+        return [_pack_value(item) for item in value]
+    if isinstance(value, tuple):
+        return {'$tuple': [_pack_value(item) for item in value]}
+    if isinstance(value, dict):
+        return {'$dict': [[_pack_value(key), _pack_value(item)] for key, item in value.items()]}
+    if isinstance(value, Decimal):
+        return {'$decimal': str(value)}
+    if isinstance(value, DineroObject):
+        return {'$object': [value._type_code, value._state()]}
+    raise TypeError('Cannot serialize {0!r}'.format(value))
+
+
+def _unpack_value(value):
+    if isinstance(value, list):
+        return [_unpack_value(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    (tag, value), = value.items()
+    if tag == '$tuple':
+        return tuple(_unpack_value(item) for item in value)
+    if tag == '$dict':
+        return dict((_unpack_value(key), _unpack_value(item)) for key, item in value)
+    if tag == '$decimal':
+        return Decimal(value)
+    if tag == '$object':
+        code, state = value
+        return _from_state(_type_for_code(code), state)
+    raise ValueError('Unknown tag: {0}'.format(tag))
@@ -0,0 +1,123 @@
+"""
+Helpers for running many gateway operations at once.
+"""
+import collections
+import sys
+import threading
+
+import six
+from six.moves import queue
+
+from dinero.timeouts import at_deadline, deadline, get_deadline
+
+
+class _Slot(object):
+    """
+    Holds the outcome of one call until the consumer gets to it.
+    """
+
+    def __init__(self, item):
+        self.item = item
+        # the worker runs it within the consumer's deadline
+        self.deadline = get_deadline()
+        self.done = threading.Event()
+        self.value = None
+        self.exc_info = None
+
+    def run(self, fn):
+        try:
+            with at_deadline(self.deadline):
+                self.value = fn(self.item)
+        except BaseException:
+            self.exc_info = sys.exc_info()
+        finally:
+            # even if it failed, so that result() never waits forever
+            self.done.set()
+
+    def result(self):
+        self.done.wait()
+        if self.exc_info is not None:
+            six.reraise(*self.exc_info)
+        return self.value
+
+
+def imap_ordered(fn, iterable, concurrency):
+    """
+    Yields ``fn(item)`` for every item in ``iterable``, in order, running up
+    to ``concurrency`` calls at once in worker threads.  ``iterable`` is
+    consumed lazily; no more than ``2 * concurrency`` items are in flight or
+    waiting to be yielded at any time, so it can be a generator of any
+    length.  If ``fn`` raises, the exception is raised when its item's turn
+    comes.  Each call is bound by the :func:`dinero.deadline` that was in
+    effect where its item was taken from ``iterable``.
+    """
+    if concurrency < 1:
+        raise ValueError('concurrency must be at least 1')
+
+    tasks = queue.Queue(maxsize=concurrency)
+    stopped = threading.Event()
+
+    def work():
+        while True:
+            slot = tasks.get()
+            if slot is None:
+                return
+            if not stopped.is_set():
+                slot.run(fn)
+
+    workers = [threading.Thread(target=work) for _ in range(concurrency)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    window = collections.deque()
+    try:
+        for item in iterable:
+            slot = _Slot(item)
+            tasks.put(slot)
+            window.append(slot)
+            if len(window) >= 2 * concurrency:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+    finally:
+        # if the consumer stopped early, skip whatever is still queued
+        stopped.set()
+        for worker in workers:
+            tasks.put(None)
+        for worker in workers:
+            worker.join()
+
+
+class Outcome(collections.namedtuple('Outcome', 'transaction operation result')):
+    """
+    What happened to one transaction in a bulk operation.  ``operation`` is
+    what was done: ``'refund'``, ``'void'`` or ``'settle'``.  ``result`` is
+    the gateway's return value, or the exception that the operation raised:
+    usually a :class:`dinero.exceptions.DineroException`, but it can be
+    anything the transport raises, like a connection error.
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return not isinstance(self.result, Exception)
+
+
+def run_many(fn, operation, transactions, concurrency, timeout=None):
+    """
+    Calls ``fn(transaction)``, which returns ``(operation, result)``, for
+    every transaction, through :func:`imap_ordered`, and yields an
+    :class:`Outcome` for each.  ``timeout`` applies to each call.  A call
+    that fails only fails its own outcome, so the transactions after it
+    still get theirs.
+    """
+    def run(transaction):
+        try:
+            with deadline(timeout):
+                done, result = fn(transaction)
+            return Outcome(transaction, done, result)
+        except Exception as e:
+            return Outcome(transaction, operation, e)
+
+    return imap_ordered(run, transactions, concurrency)
@@ -0,0 +1,397 @@
+"""
+Caches of gateway responses, so that repeated reads of the same object don't
+each cost a round trip.  Caching is off unless the gateway is configured
+with a ``cache``::
+
+    dinero.configure({
+        'foo': {
+            'type': 'dinero.gateways.AuthorizeNet',
+            # ...
+            'cache': {'ttl': 300, 'max_size': 1000},
+        },
+    })
+
+There are three backends: :class:`LRUCache` keeps entries in the process,
+:class:`SQLiteCache` and :class:`SharedMemoryCache` keep them in a file that
+every process on the host can share.  The shared backends keep the cached
+responses as JSON, so a value that can't be written as JSON isn't cached by
+them.
+"""
+import copy
+import errno
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import zlib
+
+from dinero.base import _pack_value, _unpack_value
+from dinero.timeouts import now
+
+if sys.version_info < (2, 7):
+    from dinero.ordereddict import OrderedDict
+else:
+    from collections import OrderedDict
+
+
+DEFAULT_TTL = 300
+DEFAULT_MAX_SIZE = 1000
+
+
+class Cache(object):
+    """
+    The interface of a cache.  ``saved_round_trips`` counts the gateway
+    requests that were avoided because the response was in the cache.
+    ``shares_values`` is True for a cache that stores and hands out the
+    values themselves, rather than copies.
+    """
+    shares_values = False
+
+    def __init__(self):
+        self.saved_round_trips = 0
+        self._count_lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the value for ``key``, or None if it isn't cached.
+        """
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def record_saved_round_trip(self):
+        with self._count_lock:
+            self.saved_round_trips += 1
+
+
+class LRUCache(Cache):
+    """
+    A thread-safe in-memory cache.  Entries expire ``ttl`` seconds after they
+    are set; when there are more than ``max_size`` of them, the least
+    recently used one is dropped.
+    """
+    shares_values = True
+
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        super(LRUCache, self).__init__()
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires, value = self._entries.pop(key)
+            except KeyError:
+                return None
+            if expires <= now():
+                return None
+            # move it to the most recently used end
+            self._entries[key] = (expires, value)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (now() + self.ttl, value)
+            while len(self._entries) > self.max_size:
+                del self._entries[next(iter(self._entries))]
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def dump_value(value):
+    """
+    ``value`` as bytes for a shared backend, or None if it can't be written.
+    It is JSON, tagged like :meth:`dinero.base.DineroObject.to_bytes`, so
+    that tuples and decimals come back as they were.
+    """
+    try:
+        return json.dumps(_pack_value(value), sort_keys=True, separators=(',', ':')).encode('utf-8')
+    except (TypeError, ValueError):
+        return None
+
+
+def load_value(data):
+    """
+    The value written by :func:`dump_value`, or None if ``data`` isn't one.
+    """
+    try:
+        return _unpack_value(json.loads(bytes(data).decode('utf-8')))
+    except (TypeError, ValueError):
+        return None
+
+
+def create_private(path):
+    """
+    Creates ``path``, readable and writable only by this user, unless it
+    already exists.
+    """
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    else:
+        os.close(fd)
+
+
+class SQLiteCache(Cache):
+    """
+    A cache in an SQLite database at ``path``, which all the processes on a
+    host can share.  Entries expire ``ttl`` seconds after they are set; when
+    there are more than ``max_size`` of them, the ones closest to expiring
+    are dropped.  That is checked every ``max_size / 10`` sets rather than on
+    each one, so the table can briefly grow past ``max_size``.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE, timeout=5):
+        super(SQLiteCache, self).__init__()
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.timeout = timeout
+        self._local = threading.local()
+        self._evict_every = max(1, max_size // 10)
+        self._sets = 0
+        create_private(path)
+
+    @property
+    def connection(self):
+        # sqlite3 connections can't be shared between threads, or
+        # carried across a fork
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                    'CREATE TABLE IF NOT EXISTS dinero_cache ('
+                    'key TEXT PRIMARY KEY, value BLOB, expires REAL)')
+            connection.execute(
+                    'CREATE INDEX IF NOT EXISTS dinero_cache_expires ON dinero_cache (expires)')
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    def get(self, key):
+        row = self.connection.execute(
+                'SELECT value, expires FROM dinero_cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires = row
+        # time.time, not the monotonic clock, because it is the same in
+        # every process
+        if expires <= time.time():
+            return None
+        return load_value(value)
+
+    def set(self, key, value):
+        data = dump_value(value)
+        if data is None:
+            self.delete(key)
+            return
+        connection = self.connection
+        connection.execute(
+                'INSERT OR REPLACE INTO dinero_cache (key, value, expires) VALUES (?, ?, ?)',
+                (key, sqlite3.Binary(data), time.time() + self.ttl))
+        with self._count_lock:
+            self._sets += 1
+            evict = self._sets % self._evict_every == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """
+        Drops the expired entries, and the ones over ``max_size``.
+        """
+        connection = self.connection
+        connection.execute('DELETE FROM dinero_cache WHERE expires <= ?', (time.time(),))
+        connection.execute(
+                'DELETE FROM dinero_cache WHERE expires <= ('
+                'SELECT expires FROM dinero_cache ORDER BY expires DESC LIMIT 1 OFFSET ?)',
+                (self.max_size,))
+
+    def delete(self, key):
+        self.connection.execute('DELETE FROM dinero_cache WHERE key = ?', (key,))
+
+    def clear(self):
+        self.connection.execute('DELETE FROM dinero_cache')
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM dinero_cache').fetchone()[0]
+
+
+class SharedMemoryCache(Cache):
+    """
+    A cache in a memory-mapped file, which all the processes on a host can
+    share; put it on a tmpfs like ``/dev/shm`` to keep it in memory.
+
+    The file is a fixed table of ``slots`` slots of ``slot_size`` bytes, and
+    each key can only go in one of them, so an entry is dropped when another
+    key needs its slot.  Entries that don't fit in a slot aren't cached.
+    Nothing is locked across processes; a reader that sees a half-written
+    slot finds that its checksum doesn't match and treats it as a miss.
+    """
+
+    # md5 of the key, expiry time, length and crc32 of the value
+    header = struct.Struct('<16sdII')
+
+    def __init__(self, path, ttl=DEFAULT_TTL, slots=4096, slot_size=2048):
+        super(SharedMemoryCache, self).__init__()
+        self.path = path
+        self.ttl = ttl
+        self.slots = slots
+        self.slot_size = slot_size
+        self._lock = threading.Lock()
+
+        size = slots * slot_size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def _slot(self, key):
+        digest = hashlib.md5(key.encode('utf-8')).digest()
+        index = struct.unpack('<Q', digest[:8])[0] % self.slots
+        return digest, index * self.slot_size
+
+    def get(self, key):
+        digest, offset = self._slot(key)
+        with self._lock:
+            header = self._map[offset:offset + self.header.size]
+            slot_digest, expires, length, crc = self.header.unpack(header)
+            if slot_digest != digest or not length or expires <= time.time():
+                return None
+            start = offset + self.header.size
+            data = self._map[start:start + length]
+        if len(data) != length or zlib.crc32(data) & 0xffffffff != crc:
+            return None
+        return load_value(data)
+
+    def set(self, key, value):
+        digest, offset = self._slot(key)
+        data = dump_value(value)
+        if data is None or self.header.size + len(data) > self.slot_size:
+            # doesn't fit, make sure a stale value isn't left behind
+            self.delete(key)
+            return
+        header = self.header.pack(digest, time.time() + self.ttl, len(data), zlib.crc32(data) & 0xffffffff)
+        start = offset + self.header.size
+        with self._lock:
+            self._clear_slot(offset)
+            self._map[start:start + len(data)] = data
+            self._map[offset:offset + self.header.size] = header
+
+    def delete(self, key):
+        digest, offset = self._slot(key)
+        with self._lock:
+            if self._map[offset:offset + len(digest)] == digest:
+                self._clear_slot(offset)
+
+    def _clear_slot(self, offset):
+        self._map[offset:offset + self.header.size] = b'\0' * self.header.size
+
+    def clear(self):
+        with self._lock:
+            for index in range(self.slots):
+                self._clear_slot(index * self.slot_size)
+
+
+BACKENDS = {
+    'lru': LRUCache,
+    'sqlite': SQLiteCache,
+    'shared_memory': SharedMemoryCache,
+    }
+
+
+def cache_from_options(options):
+    """
+    Builds the cache described by ``options['cache']``: None for no cache,
+    ``True`` for an :class:`LRUCache`, a :class:`Cache` instance, or a dict
+    of arguments for the class named by its ``backend`` (``'lru'``, the
+    default, ``'sqlite'``, ``'shared_memory'`` or the dotted path of a
+    :class:`Cache` subclass).
+    """
+    cache = options.get('cache')
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        return LRUCache()
+    if isinstance(cache, dict):
+        cache = dict(cache)
+        backend = cache.pop('backend', 'lru')
+        try:
+            cls = BACKENDS[backend]
+        except KeyError:
+            from dinero.configure import fancy_import
+            cls = fancy_import(backend)
+        return cls(**cache)
+    return cache
+
+
+def cache_key(gateway, kind, key):
+    # gateways configured for different accounts can share a cache
+    return '%s:%s:%s:%s' % (gateway.name, gateway.cache_namespace or '', kind, key)
+
+
+def get_cached(gateway, kind, key):
+    """
+    A copy of ``gateway``'s cached response for the ``kind`` object (for
+    example ``'transaction'``) with id ``key``, if there is one.
+    """
+    cache = gateway.cache
+    if cache is None:
+        return None
+    value = cache.get(cache_key(gateway, kind, key))
+    if value is None:
+        return None
+    cache.record_saved_round_trip()
+    if cache.shares_values:
+        return copy.deepcopy(value)
+    # the shared backends load a new one every time
+    return value
+
+
+def set_cached(gateway, kind, key, resp):
+    cache = gateway.cache
+    if cache is not None:
+        if cache.shares_values:
+            resp = copy.deepcopy(resp)
+        cache.set(cache_key(gateway, kind, key), resp)
+
+
+def invalidate(gateway, kind, key):
+    """
+    Called when the ``kind`` object with id ``key`` has (or might have)
+    changed.
+    """
+    if gateway.cache is not None:
+        gateway.cache.delete(cache_key(gateway, kind, key))
+    # a read in flight may have been answered before the change
+    if gateway.single_flight is not None:
+        gateway.single_flight.forget(kind, key)
@@ -0,0 +1,106 @@
+"""
+Records the requests a gateway sends and the responses it gets, for
+replaying them later with ``python -m dinero.replay``.  Capturing is off
+unless the gateway is configured with a ``capture`` file::
+
+    dinero.configure({
+        'foo': {
+            'type': 'dinero.gateways.AuthorizeNet',
+            # ...
+            'capture': '/var/log/dinero/capture.jsonl',
+        },
+    })
+
+Each exchange is appended to the file as a line of JSON, with the time the
+request was sent, how long the gateway took, and the request and response
+bodies.  Card numbers are masked like they are in the logs (see
+:func:`dinero.log.scrub`), and transaction keys and card codes are removed.
+"""
+import json
+import re
+import threading
+import time
+
+import six
+
+from dinero.log import scrub
+
+SECRET_RE = re.compile(r'<(transactionKey|cardCode)>[^<]*</')
+
+
+def scrub_xml(body):
+    """
+    Masks the card numbers, transaction keys and card codes in a request or
+    response body.
+    """
+    if body is None:
+        return None
+    if isinstance(body, six.binary_type):
+        body = body.decode('utf-8', 'replace')
+    return SECRET_RE.sub(r'<\1>XXX</', scrub(body))
+
+
+class Capture(object):
+    """
+    An append-only file of captured exchanges, which any number of threads
+    (and processes) can write to.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def record(self, url, request, response, seconds, error=None, sent=None):
+        """
+        Appends an exchange.  ``sent`` is when the request was sent (defaults
+        to ``seconds`` ago) and ``error`` the exception it raised, if it
+        didn't get a response.
+        """
+        if sent is None:
+            sent = time.time() - seconds
+        line = json.dumps({
+            'time': round(sent, 6),
+            'url': url,
+            'seconds': round(seconds, 6),
+            'request': scrub_xml(request),
+            'response': scrub_xml(response),
+            'error': error and type(error).__name__,
+            }, sort_keys=True) + '\n'
+        with self._lock:
+            if self._file is None:
+                # unbuffered appends, so that lines from several processes
+                # don't interleave
+                self._file = open(self.path, 'ab', 0)
+            self._file.write(line.encode('utf-8'))
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def capture_from_options(options):
+    """
+    The :class:`Capture` for ``options['capture']``, which is a path or a
+    :class:`Capture`, or None.
+    """
+    capture = options.get('capture')
+    if not capture:
+        return None
+    if isinstance(capture, six.string_types):
+        return Capture(capture)
+    return capture
+
+
+def read_capture(path):
+    """
+    Yields the exchanges in a capture file as dicts, in the order they were
+    recorded.
+    """
+    with open(path, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line.decode('utf-8'))
@@ -1,41 +1,65 @@
+import sys
+
 from dinero.log import log
 from dinero import get_gateway
 from dinero.base import DineroObject
+from dinero.timeouts import deadline
+
+if sys.version_info >= (3, 5):
+    from dinero.aio import CreditCardAsyncMixin
+else:
+    CreditCardAsyncMixin = object
 
 
-class CreditCard(DineroObject):
+class CreditCard(DineroObject, CreditCardAsyncMixin):
     """
     A representation of a credit card to be stored in the gateway.
     """
+    _core = ('gateway_name', 'customer_id')
+    _fields = (
+        'card_id',
+        'first_name',
+        'last_name',
+        'company',
+        'address',
+        'city',
+        'state',
+        'zip',
+        'country',
+        'phone',
+        'fax',
+        'number',
+        'last_4',
+        'expiration_date',
+        )
+    _field_set = frozenset(_fields)
+    __slots__ = _core + _fields
+    _type_code = 3
 
     def __init__(self, gateway_name, customer_id, **kwargs):
         self.gateway_name = gateway_name
         self.customer_id = customer_id
-        self.data = kwargs
+        self._set_data(kwargs)
 
     @log
-    def save(self):
+    def save(self, timeout=None):
         """
         Save changes to a card to the gateway.
         """
         gateway = get_gateway(self.gateway_name)
-        gateway.update_card(self)
+        with deadline(timeout):
+            gateway.update_card(self)
 
     @log
-    def delete(self):
+    def delete(self, timeout=None):
         """
         Delete a card from the gateway.
         """
         gateway = get_gateway(self.gateway_name)
-        gateway.delete_card(self)
+        with deadline(timeout):
+            gateway.delete_card(self)
         return True
 
-    def __setattr__(self, attr, val):
-        if attr in ['customer_id', 'data', 'gateway_name']:
-            self.__dict__[attr] = val
-        else:
-            self.data[attr] = val
-
     @classmethod
     def from_dict(cls, dict):
         return cls(dict['gateway_name'],
@@ -1,5 +1,9 @@
 import six
 
+from dinero.cache import cache_from_options
+from dinero.identity import identity_map_from_options
+from dinero.singleflight import single_flight_from_options
+
 
 def fancy_import(import_name):
     """
@@ -22,6 +26,10 @@ def configure(options):
         'auth.net': { # the name for this gateway
             'default': True, # register as the default gateway
             'type': 'dinero.gateways.AuthorizeNet' # the gateway path
+            'warmup': False, # do any setup, like endpoint discovery, now
+            'cache': None, # see dinero.cache
+            'identity_map': False, # see dinero.identity
+            'single_flight': False, # see dinero.singleflight
             # ... gateway-specific configuration
         }})
 
@@ -30,11 +38,16 @@ def configure(options):
     for name, conf in six.iteritems(options):
         _configured_gateways[name] = fancy_import(conf['type'])(conf)
         _configured_gateways[name].name = name
+        _configured_gateways[name].cache = cache_from_options(conf)
+        _configured_gateways[name].identity_map = identity_map_from_options(conf)
+        _configured_gateways[name].single_flight = single_flight_from_options(conf)
         is_default = conf.get('default', False)
         if is_default:
             for gateway in six.itervalues(_configured_gateways):
                 gateway.default = False
         _configured_gateways[name].default = is_default
+        if conf.get('warmup', False):
+            _configured_gateways[name].warmup()
 
 
 def get_gateway(gateway_name=None):
@@ -1,18 +1,49 @@
+import sys
+
 from dinero import get_gateway
 from dinero.exceptions import InvalidCustomerException
 from dinero.log import log
 from dinero.card import CreditCard
 from dinero.base import DineroObject
+from dinero.identity import identify, forget
+from dinero.metrics import collect_timings
+from dinero.timeouts import deadline, iter_deadline
+
+if sys.version_info >= (3, 5):
+    from dinero.aio import CustomerAsyncMixin
+else:
+    CustomerAsyncMixin = object
 
 
-class Customer(DineroObject):
+class Customer(DineroObject, CustomerAsyncMixin):
     """
     A :class:`Customer` object stores information about your customers.
     """
+    _core = ('gateway_name', 'customer_id')
+    _fields = (
+        'email',
+        'first_name',
+        'last_name',
+        'company',
+        'address',
+        'city',
+        'state',
+        'zip',
+        'country',
+        'phone',
+        'fax',
+        'number',
+        'last_4',
+        'card_id',
+        'cards',
+        )
+    _field_set = frozenset(_fields)
+    __slots__ = _core + _fields
+    _type_code = 2
 
     @classmethod
     @log
-    def create(cls, gateway_name=None, **kwargs):
+    def create(cls, gateway_name=None, timeout=None, **kwargs):
         """
         Creates and stores a customer object.  When you first create a
         customer, you are required to also pass in arguments for a credit card. ::
@@ -29,21 +60,27 @@ class Customer(DineroObject):
                 zip='12345',
             )
 
-        This method also accepts ``gateway_name``.
+        This method also accepts ``gateway_name`` and ``timeout``.
         """
         gateway = get_gateway(gateway_name)
-        resp = gateway.create_customer(kwargs)
-        return cls(gateway_name=gateway.name, **resp)
+        with deadline(timeout), collect_timings() as timings:
+            resp = gateway.create_customer(kwargs)
+        customer = identify(gateway, 'customer', resp['customer_id'], cls(gateway_name=gateway.name, **resp))
+        customer.timings = timings
+        return customer
 
     @classmethod
     @log
-    def retrieve(cls, customer_id, gateway_name=None):
+    def retrieve(cls, customer_id, gateway_name=None, timeout=None):
         """
-        Fetches a customer object from the gateway.  This optionally accepts a
-        ``gateway_name`` parameter.
+        Fetches a customer object from the gateway.  This optionally accepts
+        ``gateway_name`` and ``timeout`` parameters.  Like
+        :meth:`dinero.Transaction.retrieve`, it returns the customer that is
+        already loaded if the gateway has an identity map.
         """
         gateway = get_gateway(gateway_name)
-        resp, cards = gateway.retrieve_customer(customer_id)
+        with deadline(timeout), collect_timings() as timings:
+            resp, cards = gateway.retrieve_customer(customer_id)
         # resp must have customer_id in it
         customer = cls(gateway_name=gateway.name, **resp)
         for card in cards:
@@ -51,43 +88,48 @@ class Customer(DineroObject):
                 gateway_name=gateway.name,
                 **card
                 ))
+        customer = identify(gateway, 'customer', customer_id, customer)
+        customer.timings = timings
         return customer
 
     def __init__(self, gateway_name, customer_id, **kwargs):
         self.gateway_name = gateway_name
         self.customer_id = customer_id
-        self.data = kwargs
-        self.data['cards'] = []
+        self._set_data(kwargs)
+        self.cards = []
 
     def update(self, options):
         for key, value in options.iteritems():
             setattr(self, key, value)
 
     @log
-    def save(self):
+    def save(self, timeout=None):
         """
         Saves changes to a customer object.
         """
         if not self.customer_id:
             raise InvalidCustomerException("Cannot save a customer that doesn't have a customer_id")
         gateway = get_gateway(self.gateway_name)
-        gateway.update_customer(self.customer_id, self.data)
+        with deadline(timeout):
+            gateway.update_customer(self.customer_id, self.data)
         return True
 
     @log
-    def delete(self):
+    def delete(self, timeout=None):
         """
         Deletes a customer object from the gateway.
         """
         if not self.customer_id:
             raise InvalidCustomerException("Cannot delete a customer that doesn't have a customer_id")
         gateway = get_gateway(self.gateway_name)
-        gateway.delete_customer(self.customer_id)
+        with deadline(timeout):
+            gateway.delete_customer(self.customer_id)
+        forget(gateway, 'customer', self.customer_id)
         self.customer_id = None
         return True
 
     @log
-    def add_card(self, gateway_name=None, **options):
+    def add_card(self, gateway_name=None, timeout=None, **options):
         """
         The first credit card is added when you call :meth:`create`, but you
         can add more cards using this method. ::
@@ -104,16 +146,30 @@ class Customer(DineroObject):
         if not self.customer_id:
             raise InvalidCustomerException("Cannot add a card to a customer that doesn't have a customer_id")
         gateway = get_gateway(gateway_name)
-        resp = gateway.add_card_to_customer(self, options)
+        with deadline(timeout):
+            resp = gateway.add_card_to_customer(self, options)
         card = CreditCard(gateway_name=self.gateway_name, **resp)
         self.cards.append(card)
         return card
 
-    def __setattr__(self, attr, val):
-        if attr in ['gateway_name', 'customer_id', 'data']:
-            self.__dict__[attr] = val
-        else:
-            self.data[attr] = val
+    @log
+    def iter_cards(self, timeout=None):
+        """
+        Fetches the customer's cards from the gateway one at a time, without
+        loading the whole customer profile into memory.  Use this instead of
+        :meth:`retrieve` for customers with a very large number of cards. ::
+
+            for card in customer.iter_cards():
+                ...
+
+        ``timeout`` covers the whole response, but not the time spent in the
+        loop between cards.
+        """
+        if not self.customer_id:
+            raise InvalidCustomerException("Cannot list the cards of a customer that doesn't have a customer_id")
+        gateway = get_gateway(self.gateway_name)
+        for card in iter_deadline(timeout, gateway.iter_customer_cards(self.customer_id)):
+            yield CreditCard(gateway_name=gateway.name, **card)
 
     @classmethod
     def from_dict(cls, dict):
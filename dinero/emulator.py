@@ -0,0 +1,761 @@
+"""
+A local HTTP server that emulates the Authorize.net XML API, for testing the
+real :class:`dinero.gateways.AuthorizeNet` (its serialization, transport and
+response handling) end to end, under load, on a machine that can't or
+shouldn't reach the sandbox::
+
+    $ python -m dinero.emulator --port 8080 --latency 0.2
+
+    dinero.configure({
+        'emulated': {
+            'type': 'dinero.gateways.AuthorizeNet',
+            'login_id': 'login',
+            'transaction_key': 'key',
+        }
+    })
+    dinero.get_gateway('emulated').url = 'http://127.0.0.1:8080/xml/v1/request.api'
+
+It implements the requests that AuthorizeNet sends (charges, voids, refunds,
+captures, transaction details, and customer and payment profiles), keeps
+their state in memory, and answers with the codes Authorize.net uses, like
+E00007 for bad credentials, E00039 for duplicates and E00040 for records
+that can't be found.  The card numbers in
+:data:`dinero.gateways.fake.TEST_NUMBERS` always fail, as do cards that
+have expired or fail the Luhn check.
+"""
+from __future__ import print_function
+
+import codecs
+import collections
+import errno
+import itertools
+import optparse
+import random
+import re
+import string
+import sys
+import threading
+import time
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from lxml import etree
+from six.moves import BaseHTTPServer, socketserver
+
+from dinero.gateways.authorizenet_gateway import NS, _dict_to_bytes, get_tag, xml_to_dict
+from dinero.gateways.fake import CARD_TYPES, ERROR_MESSAGES, TEST_NUMBERS, latency_from_options
+from dinero.timeouts import now
+
+if sys.version_info < (2, 7):
+    from dinero.ordereddict import OrderedDict
+else:
+    from collections import OrderedDict
+
+
+RESPONSE_START = codecs.BOM_UTF8 + b'<?xml version="1.0" encoding="utf-8"?>'
+
+SUCCESSFUL = ('I00001', 'Successful.')
+AUTHENTICATION_FAILED = ('E00007', 'User authentication failed due to invalid authentication values.')
+RECORD_NOT_FOUND = ('E00040', 'The record cannot be found.')
+TRANSACTION_UNSUCCESSFUL = ('E00027', 'The transaction was unsuccessful.')
+INVALID_EXPIRATION_DATE = ('E00013', 'Expiration Date is invalid.')
+
+# (responseCode, reason code, text) of the transaction results
+APPROVED = ('1', '1', 'This transaction has been approved.')
+DECLINED = ('2', '2', ERROR_MESSAGES['CardDeclinedError'])
+INVALID_AMOUNT = ('3', '5', ERROR_MESSAGES['InvalidAmountError'])
+INVALID_NUMBER = ('3', '6', ERROR_MESSAGES['InvalidCardError'])
+EXPIRED = ('3', '8', ERROR_MESSAGES['ExpiryError'])
+NOT_FOUND = ('3', '16', ERROR_MESSAGES['InvalidTransactionError'])
+REFERENCE_REQUIRED = ('3', '33', 'A valid referenced transaction ID is required.')
+CVV_MISMATCH = ('2', '44', ERROR_MESSAGES['CVVError'])
+OVER_AUTHORIZED = ('3', '47', 'The amount requested for settlement cannot be greater than the original amount authorized.')
+CANNOT_REFUND = ('3', '54', ERROR_MESSAGES['RefundError'])
+OVER_REFUNDED = ('3', '55', 'The sum of credits against the referenced transaction would exceed original debit amount.')
+ALREADY_VOIDED = ('3', '310', 'This transaction has already been voided.')
+ALREADY_CAPTURED = ('3', '311', 'This transaction has already been captured.')
+
+TEST_NUMBER_RESULTS = {
+    'CardDeclinedError': DECLINED,
+    'ExpiryError': EXPIRED,
+    'CVVError': CVV_MISMATCH,
+    }
+
+UNSETTLED = frozenset(['authorizedPendingCapture', 'capturedPendingSettlement'])
+
+BILLTO_TAGS = ['firstName', 'lastName', 'company', 'address', 'city', 'state', 'zip', 'country',
+               'phoneNumber', 'faxNumber']
+
+
+class EmulatorError(Exception):
+    """
+    Ends a request with an error message, and the transaction result if
+    there was one.
+    """
+    def __init__(self, message, result=None, body=None):
+        super(EmulatorError, self).__init__(message)
+        self.message = message
+        self.result = result
+        self.body = body
+
+
+def luhn_valid(number):
+    total = 0
+    for i, digit in enumerate(reversed(number)):
+        digit = int(digit)
+        if i % 2:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
+
+def parse_expiration(value):
+    """
+    The (year, month) of an expirationDate, which can be ``YYYY-MM``,
+    ``MMYY`` or ``MM/YY``, or None if it isn't valid.
+    """
+    match = re.match(r'^(?:(\d{4})-(\d{2})|(\d{2})/?(\d{2}))$', value or '')
+    if not match:
+        return None
+    if match.group(1):
+        year, month = int(match.group(1)), int(match.group(2))
+    else:
+        year, month = 2000 + int(match.group(4)), int(match.group(3))
+    if not 1 <= month <= 12:
+        return None
+    return year, month
+
+
+def check_card(number, expiration):
+    """
+    The failed transaction result for a card, or None if it can be charged.
+    """
+    if not number.isdigit() or not 13 <= len(number) <= 19 or not luhn_valid(number):
+        return INVALID_NUMBER
+    expiry = parse_expiration(expiration)
+    today = date.today()
+    if expiry is None or expiry < (today.year, today.month):
+        return EXPIRED
+    if number in TEST_NUMBERS:
+        return TEST_NUMBER_RESULTS[TEST_NUMBERS[number]]
+    return None
+
+
+def mask(number):
+    return 'XXXX' + number[-4:]
+
+
+def money(amount):
+    return '%.2f' % amount
+
+
+def _amount(value):
+    try:
+        amount = Decimal(value)
+    except (InvalidOperation, TypeError):
+        return None
+    if not amount.is_finite() or amount <= 0:
+        return None
+    return amount
+
+
+def _billto(billto):
+    if not billto:
+        return None
+    return OrderedDict((tag, billto[tag]) for tag in BILLTO_TAGS if billto.get(tag))
+
+
+class _Transaction(object):
+    __slots__ = ('transaction_id', 'transaction_type', 'status', 'amount', 'settled_amount', 'refunded',
+                 'captured', 'number', 'card_type', 'auth_code', 'card_code_response', 'customer', 'bill_to')
+
+
+class _PaymentProfile(object):
+    __slots__ = ('payment_profile_id', 'number', 'expiration', 'bill_to')
+
+
+class _CustomerProfile(object):
+    __slots__ = ('customer_profile_id', 'email', 'payment_profiles')
+
+
+class Emulator(object):
+    """
+    The state of the emulated account and the request handlers.  ``handle``
+    takes a request body and returns the response body, so it can be used
+    without the HTTP server.
+
+    If ``login_id`` and ``transaction_key`` are given, requests with other
+    credentials fail with E00007.  Captured transactions settle
+    ``settlement_delay`` seconds later, if it is set, or when
+    :meth:`settle_batch` is called.
+    """
+
+    def __init__(self, login_id=None, transaction_key=None, settlement_delay=None, seed=None):
+        self.login_id = login_id
+        self.transaction_key = transaction_key
+        self.settlement_delay = settlement_delay
+        self.random = random.Random(seed)
+        self.transactions = {}
+        self.customers = {}
+        self._emails = {}
+        # transactions waiting to settle, in the order they were captured
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+        self._transaction_ids = itertools.count(2200000001)
+        self._customer_ids = itertools.count(10000001)
+        self._payment_profile_ids = itertools.count(20000001)
+
+    def handle(self, body):
+        try:
+            request = etree.XML(body)
+        except etree.XMLSyntaxError:
+            return self.response('ErrorResponse', error=('E00003', 'An error occurred while parsing the XML request.'))
+        name = get_tag(request)
+        handler = getattr(self, '_' + name, None) if name.endswith('Request') else None
+        response_name = name[:-len('Request')] + 'Response'
+        if handler is None:
+            return self.response('ErrorResponse', error=(
+                'E00003', "The element '%s:%s' is not declared." % (NS, name)))
+
+        request = xml_to_dict(request)
+        if not self._authenticated(request.get('merchantAuthentication') or {}):
+            return self.response(response_name, error=AUTHENTICATION_FAILED)
+        try:
+            with self._lock:
+                self._settle_due()
+                body = handler(request)
+        except EmulatorError as e:
+            return self.response(response_name, error=e.message, result=e.result, body=e.body)
+        return self.response(response_name, body=body)
+
+    def _authenticated(self, authentication):
+        if self.login_id is None:
+            return True
+        return (authentication.get('name') == self.login_id
+                and authentication.get('transactionKey') == self.transaction_key)
+
+    def response(self, name, error=None, body=None, result=None):
+        message = error or SUCCESSFUL
+        parts = [
+            RESPONSE_START,
+            ('<%s xmlns="%s">' % (name, NS)).encode('ascii'),
+            _dict_to_bytes(OrderedDict([
+                ('messages', OrderedDict([
+                    ('resultCode', 'Error' if error else 'Ok'),
+                    ('message', OrderedDict([('code', message[0]), ('text', message[1])])),
+                    ])),
+                ])),
+            ]
+        if result is not None:
+            parts.append(_dict_to_bytes(OrderedDict([('transactionResponse', result)])))
+        if body:
+            parts.append(_dict_to_bytes(body))
+        parts.append(('</%s>' % name).encode('ascii'))
+        return b''.join(parts)
+
+    ##|
+    ##|  STATE
+    ##|
+    def _captured(self, transaction):
+        transaction.captured = now()
+        self._pending.append(transaction)
+
+    def _settle_due(self):
+        if self.settlement_delay is None:
+            return
+        cutoff = now() - self.settlement_delay
+        pending = self._pending
+        while pending and pending[0].captured <= cutoff:
+            self._settle(pending.popleft())
+
+    def _settle(self, transaction):
+        # voided since it was captured
+        if transaction.status == 'capturedPendingSettlement':
+            transaction.status = 'settledSuccessfully'
+        elif transaction.status == 'refundPendingSettlement':
+            transaction.status = 'refundSettledSuccessfully'
+
+    def settle_batch(self):
+        """
+        Settles every captured transaction.
+        """
+        with self._lock:
+            while self._pending:
+                self._settle(self._pending.popleft())
+
+    def _auth_code(self):
+        return ''.join(self.random.choice(string.ascii_uppercase + string.digits) for _ in range(6))
+
+    def _new_transaction(self, transaction_type, status, amount, number, card_type=None):
+        transaction = _Transaction()
+        transaction.transaction_id = str(next(self._transaction_ids))
+        transaction.transaction_type = transaction_type
+        transaction.status = status
+        transaction.amount = amount
+        transaction.settled_amount = amount if status != 'authorizedPendingCapture' else None
+        transaction.refunded = Decimal(0)
+        transaction.captured = None
+        transaction.number = number
+        transaction.card_type = card_type or CARD_TYPES.get(number[:1], 'Visa')
+        transaction.auth_code = self._auth_code()
+        transaction.card_code_response = 'P'
+        transaction.customer = None
+        transaction.bill_to = None
+        self.transactions[transaction.transaction_id] = transaction
+        if status != 'authorizedPendingCapture':
+            self._captured(transaction)
+        return transaction
+
+    def _transaction(self, transaction_id, missing=NOT_FOUND):
+        if not transaction_id or transaction_id == '0':
+            raise self._failed(REFERENCE_REQUIRED)
+        try:
+            return self.transactions[transaction_id]
+        except KeyError:
+            raise self._failed(missing)
+
+    def _customer(self, customer_profile_id):
+        try:
+            return self.customers[customer_profile_id]
+        except KeyError:
+            raise EmulatorError(RECORD_NOT_FOUND)
+
+    def _payment_profile(self, customer, payment_profile_id):
+        try:
+            return customer.payment_profiles[payment_profile_id]
+        except KeyError:
+            raise EmulatorError(RECORD_NOT_FOUND)
+
+    ##|
+    ##|  RESPONSES
+    ##|
+    def _result(self, result, transaction=None, number=''):
+        code, reason, text = result
+        if transaction is not None:
+            number = transaction.number
+        ret = OrderedDict([
+            ('responseCode', code),
+            ('authCode', transaction.auth_code if transaction is not None else ''),
+            ('avsResultCode', 'Y' if code == '1' else 'P'),
+            ('cvvResultCode', 'N' if result == CVV_MISMATCH else
+                (transaction.card_code_response if transaction is not None else '')),
+            ('transId', transaction.transaction_id if transaction is not None else '0'),
+            ('accountNumber', mask(number) if number else ''),
+            ('accountType', CARD_TYPES.get(number[:1], '') if number else ''),
+            ])
+        if code == '1':
+            ret['messages'] = OrderedDict([
+                ('message', OrderedDict([('code', reason), ('description', text)])),
+                ])
+        else:
+            ret['errors'] = OrderedDict([
+                ('error', OrderedDict([('errorCode', reason), ('errorText', text)])),
+                ])
+        return ret
+
+    def _failed(self, result, number=''):
+        return EmulatorError(TRANSACTION_UNSUCCESSFUL, result=self._result(result, number=number))
+
+    def _approved(self, transaction):
+        return OrderedDict([('transactionResponse', self._result(APPROVED, transaction))])
+
+    def _direct_response(self, result, transaction=None, number=''):
+        """
+        The comma separated result of a createCustomerProfileTransaction.
+        """
+        code, reason, text = result
+        fields = [''] * 68
+        fields[0] = code
+        fields[1] = '1'
+        fields[2] = reason
+        fields[3] = text
+        fields[10] = 'CC'
+        if transaction is not None:
+            fields[4] = transaction.auth_code
+            fields[5] = 'Y'
+            fields[6] = transaction.transaction_id
+            fields[9] = money(transaction.amount)
+            fields[11] = 'auth_capture' if transaction.status != 'authorizedPendingCapture' else 'auth_only'
+            fields[38] = transaction.card_code_response
+            number = transaction.number
+        if number:
+            fields[50] = mask(number)
+            fields[51] = CARD_TYPES.get(number[:1], '')
+        return ','.join(fields)
+
+    def _payment_profile_dict(self, profile):
+        ret = OrderedDict()
+        if profile.bill_to:
+            ret['billTo'] = profile.bill_to
+        ret['customerPaymentProfileId'] = profile.payment_profile_id
+        ret['payment'] = OrderedDict([
+            ('creditCard', OrderedDict([
+                ('cardNumber', mask(profile.number)),
+                ('expirationDate', 'XXXX'),
+                ])),
+            ])
+        return ret
+
+    ##|
+    ##|  TRANSACTIONS
+    ##|
+    def _createTransactionRequest(self, request):
+        fields = request.get('transactionRequest') or {}
+        transaction_type = fields.get('transactionType')
+        if transaction_type in ('authCaptureTransaction', 'authOnlyTransaction'):
+            return self._charge(fields, transaction_type)
+        if transaction_type == 'voidTransaction':
+            return self._void(fields)
+        if transaction_type == 'refundTransaction':
+            return self._refund(fields)
+        if transaction_type == 'priorAuthCaptureTransaction':
+            return self._capture(fields)
+        raise EmulatorError(('E00003', "The 'transactionType' element is invalid."))
+
+    def _charge(self, fields, transaction_type):
+        card = (fields.get('payment') or {}).get('creditCard') or {}
+        number = card.get('cardNumber', '')
+        amount = _amount(fields.get('amount'))
+        if amount is None:
+            raise self._failed(INVALID_AMOUNT, number)
+        failure = check_card(number, card.get('expirationDate'))
+        if failure is not None:
+            raise self._failed(failure, number)
+
+        if transaction_type == 'authCaptureTransaction':
+            status = 'capturedPendingSettlement'
+        else:
+            status = 'authorizedPendingCapture'
+        transaction = self._new_transaction(transaction_type, status, amount, number)
+        if card.get('cardCode'):
+            transaction.card_code_response = 'M'
+        customer = fields.get('customer')
+        if customer:
+            transaction.customer = OrderedDict((key, customer[key]) for key in ('id', 'email') if customer.get(key))
+        transaction.bill_to = _billto(fields.get('billTo'))
+        return self._approved(transaction)
+
+    def _void(self, fields):
+        transaction = self._transaction(fields.get('refTransId'))
+        if transaction.status == 'voided':
+            raise self._failed(ALREADY_VOIDED)
+        if transaction.status not in UNSETTLED:
+            raise self._failed(NOT_FOUND)
+        transaction.status = 'voided'
+        return self._approved(transaction)
+
+    def _refund(self, fields):
+        transaction = self._transaction(fields.get('refTransId'), missing=CANNOT_REFUND)
+        number = ((fields.get('payment') or {}).get('creditCard') or {}).get('cardNumber', '')
+        amount = _amount(fields.get('amount'))
+        if amount is None:
+            raise self._failed(INVALID_AMOUNT)
+        if transaction.status != 'settledSuccessfully' or number[-4:] != transaction.number[-4:]:
+            raise self._failed(CANNOT_REFUND)
+        if transaction.refunded + amount > transaction.settled_amount:
+            raise self._failed(OVER_REFUNDED)
+        transaction.refunded += amount
+        refund = self._new_transaction('refundTransaction', 'refundPendingSettlement', amount,
+                                       transaction.number, transaction.card_type)
+        refund.customer = transaction.customer
+        return self._approved(refund)
+
+    def _capture(self, fields):
+        transaction = self._transaction(fields.get('refTransId'))
+        if transaction.status != 'authorizedPendingCapture':
+            raise self._failed(ALREADY_CAPTURED)
+        amount = _amount(fields.get('amount')) or transaction.amount
+        if amount > transaction.amount:
+            raise self._failed(OVER_AUTHORIZED)
+        transaction.status = 'capturedPendingSettlement'
+        transaction.transaction_type = 'priorAuthCaptureTransaction'
+        transaction.settled_amount = amount
+        self._captured(transaction)
+        return self._approved(transaction)
+
+    def _getTransactionDetailsRequest(self, request):
+        try:
+            transaction = self.transactions[request.get('transId')]
+        except KeyError:
+            raise EmulatorError(RECORD_NOT_FOUND)
+        details = OrderedDict([
+            ('transId', transaction.transaction_id),
+            ('transactionType', transaction.transaction_type),
+            ('transactionStatus', transaction.status),
+            ('responseCode', '1'),
+            ('authCode', transaction.auth_code),
+            ('AVSResponse', 'Y'),
+            ('cardCodeResponse', transaction.card_code_response),
+            ('authAmount', money(transaction.amount)),
+            ('settleAmount', money(transaction.settled_amount or 0)),
+            ('payment', OrderedDict([
+                ('creditCard', OrderedDict([
+                    ('cardNumber', mask(transaction.number)),
+                    ('expirationDate', 'XXXX'),
+                    ('cardType', transaction.card_type),
+                    ])),
+                ])),
+            ])
+        if transaction.customer:
+            details['customer'] = transaction.customer
+        if transaction.bill_to:
+            details['billTo'] = transaction.bill_to
+        return OrderedDict([('transaction', details)])
+
+    ##|
+    ##|  CUSTOMER PROFILES
+    ##|
+    def _check_email(self, email, customer_profile_id=None):
+        existing = self._emails.get(email)
+        if existing is not None and existing != customer_profile_id:
+            raise EmulatorError(('E00039', 'A duplicate record with ID %s already exists.' % existing))
+
+    def _new_payment_profile(self, customer, fields):
+        card = (fields.get('payment') or {}).get('creditCard') or {}
+        if parse_expiration(card.get('expirationDate')) is None:
+            raise EmulatorError(INVALID_EXPIRATION_DATE)
+        number = card.get('cardNumber', '')
+        for existing in customer.payment_profiles.values():
+            if existing.number == number:
+                raise EmulatorError(('E00039', 'A duplicate customer payment profile already exists.'),
+                                    body=OrderedDict([('customerPaymentProfileId', existing.payment_profile_id)]))
+        profile = _PaymentProfile()
+        profile.payment_profile_id = str(next(self._payment_profile_ids))
+        profile.number = number
+        profile.expiration = card['expirationDate']
+        profile.bill_to = _billto(fields.get('billTo'))
+        return profile
+
+    def _createCustomerProfileRequest(self, request):
+        fields = request.get('profile') or {}
+        email = fields.get('email')
+        self._check_email(email)
+
+        customer = _CustomerProfile()
+        customer.customer_profile_id = str(next(self._customer_ids))
+        customer.email = email
+        customer.payment_profiles = OrderedDict()
+        for payment_fields in fields.get('paymentProfiles') or []:
+            profile = self._new_payment_profile(customer, payment_fields)
+            customer.payment_profiles[profile.payment_profile_id] = profile
+
+        self.customers[customer.customer_profile_id] = customer
+        if email:
+            self._emails[email] = customer.customer_profile_id
+        return OrderedDict([
+            ('customerProfileId', customer.customer_profile_id),
+            ('customerPaymentProfileIdList', OrderedDict([
+                ('numericString', list(customer.payment_profiles)),
+                ])),
+            ('customerShippingAddressIdList', {}),
+            ('validationDirectResponseList', {}),
+            ])
+
+    def _getCustomerProfileRequest(self, request):
+        customer = self._customer(request.get('customerProfileId'))
+        profile = OrderedDict()
+        if customer.email:
+            profile['email'] = customer.email
+        profile['customerProfileId'] = customer.customer_profile_id
+        profile['paymentProfiles'] = [self._payment_profile_dict(payment_profile)
+                                      for payment_profile in customer.payment_profiles.values()]
+        return OrderedDict([('profile', profile)])
+
+    def _updateCustomerProfileRequest(self, request):
+        fields = request.get('profile') or {}
+        customer = self._customer(fields.get('customerProfileId'))
+        email = fields.get('email')
+        self._check_email(email, customer.customer_profile_id)
+        self._emails.pop(customer.email, None)
+        customer.email = email
+        if email:
+            self._emails[email] = customer.customer_profile_id
+        return None
+
+    def _deleteCustomerProfileRequest(self, request):
+        customer = self._customer(request.get('customerProfileId'))
+        del self.customers[customer.customer_profile_id]
+        self._emails.pop(customer.email, None)
+        return None
+
+    def _createCustomerPaymentProfileRequest(self, request):
+        customer = self._customer(request.get('customerProfileId'))
+        fields = request.get('paymentProfile') or {}
+        profile = self._new_payment_profile(customer, fields)
+        if request.get('validationMode') in ('liveMode', 'testMode'):
+            failure = check_card(profile.number, profile.expiration)
+            if failure is not None:
+                raise EmulatorError((TRANSACTION_UNSUCCESSFUL[0], failure[2]))
+        customer.payment_profiles[profile.payment_profile_id] = profile
+        return OrderedDict([('customerPaymentProfileId', profile.payment_profile_id)])
+
+    def _getCustomerPaymentProfileRequest(self, request):
+        customer = self._customer(request.get('customerProfileId'))
+        profile = self._payment_profile(customer, request.get('customerPaymentProfileId'))
+        return OrderedDict([('paymentProfile', self._payment_profile_dict(profile))])
+
+    def _updateCustomerPaymentProfileRequest(self, request):
+        customer = self._customer(request.get('customerProfileId'))
+        fields = request.get('paymentProfile') or {}
+        profile = self._payment_profile(customer, fields.get('customerPaymentProfileId'))
+        card = (fields.get('payment') or {}).get('creditCard') or {}
+        number = card.get('cardNumber', '')
+        # masked values leave the card as it is
+        if number and not number.startswith('X'):
+            profile.number = number
+        expiration = card.get('expirationDate')
+        if expiration and expiration != 'XXXX':
+            if parse_expiration(expiration) is None:
+                raise EmulatorError(INVALID_EXPIRATION_DATE)
+            profile.expiration = expiration
+        if 'billTo' in fields:
+            profile.bill_to = _billto(fields['billTo'])
+        return None
+
+    def _deleteCustomerPaymentProfileRequest(self, request):
+        customer = self._customer(request.get('customerProfileId'))
+        profile = self._payment_profile(customer, request.get('customerPaymentProfileId'))
+        del customer.payment_profiles[profile.payment_profile_id]
+        return None
+
+    def _createCustomerProfileTransactionRequest(self, request):
+        transaction_fields = request.get('transaction') or {}
+        if 'profileTransAuthCapture' in transaction_fields:
+            transaction_type, status = 'authCaptureTransaction', 'capturedPendingSettlement'
+            fields = transaction_fields['profileTransAuthCapture']
+        elif 'profileTransAuthOnly' in transaction_fields:
+            transaction_type, status = 'authOnlyTransaction', 'authorizedPendingCapture'
+            fields = transaction_fields['profileTransAuthOnly']
+        else:
+            raise EmulatorError(('E00003', "The 'transaction' element is invalid."))
+
+        customer = self._customer(fields.get('customerProfileId'))
+        profile = self._payment_profile(customer, fields.get('customerPaymentProfileId'))
+        amount = _amount(fields.get('amount'))
+        failure = INVALID_AMOUNT if amount is None else check_card(profile.number, profile.expiration)
+        if failure is not None:
+            raise EmulatorError((TRANSACTION_UNSUCCESSFUL[0], failure[2]), body=OrderedDict([
+                ('directResponse', self._direct_response(failure, number=profile.number)),
+                ]))
+
+        transaction = self._new_transaction(transaction_type, status, amount, profile.number)
+        if fields.get('cardCode'):
+            transaction.card_code_response = 'M'
+        transaction.customer = OrderedDict([('id', customer.customer_profile_id)])
+        if customer.email:
+            transaction.customer['email'] = customer.email
+        transaction.bill_to = profile.bill_to
+        return OrderedDict([('directResponse', self._direct_response(APPROVED, transaction))])
+
+
+##|
+##|  SERVER
+##|
+def _disconnected(error):
+    return isinstance(error, (IOError, OSError)) and getattr(error, 'errno', None) in (
+        errno.EPIPE, errno.ECONNRESET, errno.ECONNABORTED)
+
+
+class EmulatorHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # the headers and body are written separately; without this, delayed
+    # ACKs add 40ms to every keep-alive response
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'] or 0))
+        response = self.server.emulator.handle(body)
+        delay = self.server.delay()
+        if delay:
+            time.sleep(delay)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class EmulatorServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Serves an :class:`Emulator` on ``host``:``port`` (any free port by
+    default).  ``latency`` delays every response, see
+    :func:`dinero.gateways.fake.latency_from_options`.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, emulator=None, host='127.0.0.1', port=0, latency=None, seed=None, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), EmulatorHandler)
+        self.emulator = emulator or Emulator(seed=seed)
+        self.verbose = verbose
+        self._latency = latency_from_options(latency)
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._thread = None
+
+    def handle_error(self, request, client_address):
+        # a client that hung up isn't worth a traceback
+        if not _disconnected(sys.exc_info()[1]):
+            BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+    def delay(self):
+        if self._latency is None:
+            return None
+        with self._random_lock:
+            return self._latency(self._random)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return 'http://%s:%d/xml/v1/request.api' % (host, port)
+
+    def start(self):
+        """
+        Serves requests in a background thread.
+        """
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main(args=None):
+    parser = optparse.OptionParser(usage='python -m dinero.emulator [options]',
+                                   description='Emulates the Authorize.net XML API.')
+    parser.add_option('--host', default='127.0.0.1')
+    parser.add_option('--port', type='int', default=8080)
+    parser.add_option('--login-id', help='only accept these credentials')
+    parser.add_option('--transaction-key')
+    parser.add_option('--latency', type='float', help='seconds to delay each response by')
+    parser.add_option('--settlement-delay', type='float',
+                      help='seconds before captured transactions settle (default: never)')
+    parser.add_option('--seed', type='int')
+    parser.add_option('-v', '--verbose', action='store_true', help='log every request')
+    options, args = parser.parse_args(args)
+
+    emulator = Emulator(options.login_id, options.transaction_key, options.settlement_delay, options.seed)
+    server = EmulatorServer(emulator, options.host, options.port, options.latency, options.seed, options.verbose)
+    print('Emulating Authorize.net at', server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,14 @@ class GatewayException(DineroException):
     """
     pass
 
+class GatewayTimeout(DineroException):
+    """
+    The gateway did not respond in time, or the deadline for the current
+    operation (see :func:`dinero.deadline`) ran out.  Unlike a
+    :class:`GatewayException`, there are no gateway error codes.
+    """
+    pass
+
 class PaymentException(DineroException):
     """
     This is how errors are reported when submitting a transaction.
@@ -1,4 +1,5 @@
 from __future__ import absolute_import
 
 from .authorizenet_gateway import AuthorizeNet
+from .fake import Fake
 #from braintree_gateway import Braintree
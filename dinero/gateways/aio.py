@@ -0,0 +1,504 @@
+"""
+asyncio support for gateways.  This module requires Python 3.5 or newer; it is
+only imported when the async API is used.
+
+An :class:`AsyncAuthorizeNet` drives the requests of an existing
+:class:`dinero.gateways.AuthorizeNet` over an :class:`AsyncTransport`.  All of
+the XML building and response handling is shared with the blocking gateway,
+only the I/O differs.
+"""
+import asyncio
+import functools
+import time
+
+import six
+
+from dinero.aio import acoalesced
+from dinero.cache import get_cached, set_cached
+from dinero.exceptions import GatewayException, GatewayTimeout, CustomerNotFoundError
+from dinero.gateways.authorizenet_gateway import (
+        XML_HEADERS,
+        INVALID_AUTHENTICATION_ERROR_CODE,
+        decode_response,
+        parse_xml_response,
+        serialize_request,
+        )
+from dinero.gateways.transport import DEFAULT_POOL_SIZE, MemoryTransport
+from dinero.metrics import count_bytes, metered, phase
+from dinero.timeouts import at_deadline, get_deadline, now, request_timeout
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import contextvars
+except ImportError:  # Python < 3.7
+    contextvars = None
+
+
+class AsyncTransport(object):
+    """
+    The asyncio counterpart of :class:`dinero.gateways.transport.Transport`.
+    """
+
+    async def post(self, url, data, headers, timeout=None):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class AiohttpTransport(AsyncTransport):
+    """
+    A keep-alive transport backed by an :class:`aiohttp.ClientSession`.  At
+    most ``pool_size`` connections are open at once; more concurrent requests
+    wait for a free connection.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        if aiohttp is None:
+            raise ImportError('AiohttpTransport requires the aiohttp package')
+        self.pool_size = pool_size
+        self._session = None
+        self._loop = None
+
+    def _get_session(self):
+        # a ClientSession belongs to the event loop it was created in
+        loop = asyncio.get_event_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._loop = loop
+        return self._session
+
+    async def post(self, url, data, headers, timeout=None):
+        session = self._get_session()
+        try:
+            async with session.post(url, data=data, headers=headers,
+                                    timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                return await resp.read()
+        except asyncio.TimeoutError:
+            raise GatewayTimeout('Timed out after %s seconds' % (timeout,))
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class ExecutorTransport(AsyncTransport):
+    """
+    Runs a blocking :class:`dinero.gateways.transport.Transport` in an
+    executor (by default the event loop's thread pool).
+    """
+
+    def __init__(self, transport, executor=None):
+        self.transport = transport
+        self.executor = executor
+
+    async def post(self, url, data, headers, timeout=None):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+                self.executor,
+                functools.partial(self.transport.post, url, data, headers, timeout),
+                )
+
+    async def close(self):
+        self.transport.close()
+
+
+class AsyncMemoryTransport(MemoryTransport, AsyncTransport):
+    """
+    :class:`dinero.gateways.transport.MemoryTransport` for the asyncio API.
+    """
+
+    async def post(self, url, data, headers, timeout=None):
+        return MemoryTransport.post(self, url, data, headers, timeout)
+
+    async def close(self):
+        pass
+
+
+def async_transport_from_options(options, transport):
+    """
+    Builds the async transport described by ``options['async_transport']``,
+    an :class:`AsyncTransport` instance or dotted path.  Without one, a
+    custom blocking ``transport`` is run in an executor, so that an injected
+    transport is used by both APIs; otherwise an :class:`AiohttpTransport` is
+    used if aiohttp is installed.
+    """
+    async_transport = options.get('async_transport')
+    if async_transport is None:
+        if options.get('transport') is None and aiohttp is not None:
+            return AiohttpTransport(pool_size=options.get('pool_size', DEFAULT_POOL_SIZE))
+        return ExecutorTransport(transport)
+    if isinstance(async_transport, six.string_types):
+        from dinero.configure import fancy_import
+        return fancy_import(async_transport)()
+    return async_transport
+
+
+class AsyncAuthorizeNet(object):
+    """
+    Coroutine versions of the :class:`dinero.gateways.AuthorizeNet`
+    operations.  Get one from ``gateway.aio`` rather than creating it
+    directly.
+    """
+
+    def __init__(self, gateway, transport):
+        self.gateway = gateway
+        self.transport = transport
+
+    @property
+    def name(self):
+        return self.gateway.name
+
+    async def url(self):
+        gateway = self.gateway
+        if not gateway._url:
+            gateway._load_cached_url()
+        if not gateway._url:
+            # see AuthorizeNet.url
+            if gateway._handle_probe(await self._post_to(gateway.test_url, gateway._void_xml('0'))):
+                gateway._discovered(gateway.test_url)
+            elif gateway._handle_probe(await self._post_to(gateway.live_url, gateway._void_xml('0'))):
+                gateway._discovered(gateway.live_url)
+            else:
+                raise GatewayException([(INVALID_AUTHENTICATION_ERROR_CODE,
+                                         'User authentication failed due to invalid authentication values.')])
+        return gateway._url
+
+    async def _post_to(self, url, xml):
+        timeout = request_timeout(self.gateway.timeout)
+        capture = self.gateway.capture
+        with phase('serialize'):
+            data = serialize_request(xml)
+        if capture is not None:
+            sent, started = time.time(), now()
+        with phase('network'):
+            try:
+                content = await asyncio.wait_for(
+                        self.transport.post(url, data, XML_HEADERS, timeout=timeout),
+                        timeout)
+            except asyncio.TimeoutError:
+                error = GatewayTimeout('Timed out after %s seconds' % (timeout,))
+                if capture is not None:
+                    await self._record(capture, url, data, None, now() - started, error, sent)
+                raise error
+            except Exception as e:
+                if capture is not None:
+                    await self._record(capture, url, data, None, now() - started, e, sent)
+                raise
+        if capture is not None:
+            await self._record(capture, url, data, content, now() - started, None, sent)
+        count_bytes(len(data), len(content))
+        with phase('parse'):
+            root = parse_xml_response(content)
+        return decode_response(root)
+
+    async def _record(self, capture, *args):
+        # scrubbing and writing the exchange would block the event loop
+        await asyncio.get_event_loop().run_in_executor(None, functools.partial(capture.record, *args))
+
+    async def _post(self, xml):
+        resp = await self._post_to(await self.url(), xml)
+        if self.gateway._stale_url(resp):
+            # see AuthorizeNet._post
+            resp = await self._post_to(await self.url(), xml)
+        return resp
+
+    @metered
+    async def charge(self, price, options):
+        if 'customer' in options:
+            return await self.charge_customer(options['customer'], price, options)
+        if 'cc' in options:
+            return await self.charge_card(options['cc'], price, options)
+
+        xml = self.gateway._transaction_request(price, options)
+        return self.gateway._handle_charge(await self._post(xml), price)
+
+    @metered
+    async def retrieve(self, transaction_id):
+        return await acoalesced(self.gateway, 'transaction', transaction_id, self._retrieve_transaction, transaction_id)
+
+    async def _retrieve_transaction(self, transaction_id):
+        xml = self.gateway._retrieve_request(transaction_id)
+        return self.gateway._handle_retrieve(await self._post(xml))
+
+    @metered
+    async def void(self, transaction):
+        return await self._void(transaction.transaction_id)
+
+    async def _void(self, transaction_id):
+        xml = self.gateway._void_xml(transaction_id)
+        return self.gateway._handle_ok(await self._post(xml))
+
+    @metered
+    async def refund(self, transaction, amount):
+        xml = self.gateway._refund_xml(transaction, amount)
+        return self.gateway._handle_ok(await self._post(xml))
+
+    @metered
+    async def create_customer(self, options):
+        xml = self.gateway._create_customer_xml(options)
+        return self.gateway._handle_create_customer(await self._post(xml), options)
+
+    async def _update_customer_payment(self, customer_id, options):
+        gateway = self.gateway
+        billto, payment = gateway._customer_payment_fields(options)
+        if not (billto or payment):
+            return
+
+        if 'card_id' in options:
+            card_id = options['card_id']
+        else:
+            customer, cards = await self.retrieve_customer(customer_id)
+            card_id = customer.get('card_id')
+
+        profile = None
+        if card_id:
+            try:
+                profile = await self._get_customer_payment_profile(customer_id, card_id)
+            except CustomerNotFoundError:
+                pass
+
+        xml = gateway._update_customer_payment_xml(customer_id, card_id, profile, options)
+        try:
+            gateway._handle_update_customer_payment(await self._post(xml))
+        finally:
+            gateway._invalidate_customer(customer_id, card_id)
+
+    @metered
+    async def add_card_to_customer(self, customer, options):
+        xml = self.gateway._add_card_xml(customer, options)
+        try:
+            return self.gateway._handle_add_card(await self._post(xml), customer, options)
+        finally:
+            self.gateway._invalidate_customer(customer.customer_id)
+
+    @metered
+    async def update_customer(self, customer_id, options):
+        xml = self.gateway._update_customer_xml(customer_id, options)
+        try:
+            self.gateway._handle_customer_not_found(await self._post(xml))
+        finally:
+            self.gateway._invalidate_customer(customer_id)
+        await self._update_customer_payment(customer_id, options)
+        return True
+
+    @metered
+    async def retrieve_customer(self, customer_id):
+        cached = self.gateway._cached_customer(customer_id)
+        if cached is not None:
+            return cached
+        return await acoalesced(self.gateway, 'customer', customer_id, self._retrieve_customer, customer_id)
+
+    async def _retrieve_customer(self, customer_id):
+        xml = self.gateway._retrieve_customer_xml(customer_id)
+        return self.gateway._cache_customer(customer_id, self.gateway._handle_retrieve_customer(await self._post(xml)))
+
+    @metered
+    async def delete_customer(self, customer_id):
+        xml = self.gateway._delete_customer_xml(customer_id)
+        try:
+            self.gateway._handle_customer_not_found(await self._post(xml))
+        finally:
+            self.gateway._invalidate_customer(customer_id)
+        return True
+
+    @metered
+    async def charge_customer(self, customer, price, options):
+        customer_id = customer.customer_id
+
+        try:
+            card_id = customer.card_id
+        except AttributeError:
+            customer, cards = await self.retrieve_customer(customer_id)
+            card_id = customer.get('card_id')
+
+        return await self._charge_customer(customer_id, card_id, price, options)
+
+    async def _charge_customer(self, customer_id, card_id, price, options):
+        xml = self.gateway._charge_customer_request(customer_id, card_id, price, options)
+        return self.gateway._handle_charge_customer(await self._post(xml), price)
+
+    @metered
+    async def update_card(self, card):
+        xml = self.gateway._update_card_xml(card)
+        try:
+            return self.gateway._handle_ok(await self._post(xml))
+        finally:
+            self.gateway._invalidate_customer(card.customer_id, card.card_id)
+
+    @metered
+    async def charge_card(self, card, price, options):
+        return await self._charge_customer(card.customer_id, card.card_id, price, options)
+
+    async def _get_customer_payment_profile(self, customer_id, card_id):
+        gateway = self.gateway
+        key = gateway._payment_profile_key(customer_id, card_id)
+        profile = get_cached(gateway, 'payment_profile', key)
+        if profile is None:
+            profile = await acoalesced(gateway, 'payment_profile', key, self._fetch_payment_profile, customer_id, card_id)
+        return profile
+
+    async def _fetch_payment_profile(self, customer_id, card_id):
+        gateway = self.gateway
+        xml = gateway._get_customer_payment_profile_xml(customer_id, card_id)
+        profile = gateway._handle_customer_not_found(await self._post(xml))
+        set_cached(gateway, 'payment_profile', gateway._payment_profile_key(customer_id, card_id), profile)
+        return profile
+
+    @metered
+    async def settle(self, transaction, amount):
+        xml = self.gateway._settle_xml(transaction, amount)
+        return self.gateway._handle_settle(await self._post(xml), transaction)
+
+    @metered
+    async def delete_card(self, card):
+        xml = self.gateway._delete_card_xml(card)
+        try:
+            return self.gateway._handle_ok(await self._post(xml))
+        finally:
+            self.gateway._invalidate_customer(card.customer_id, card.card_id)
+
+    async def close(self):
+        await self.transport.close()
+
+
+class AsyncFake(object):
+    """
+    Coroutine versions of the :class:`dinero.gateways.Fake` operations.  The
+    latency is waited out with :func:`asyncio.sleep`, so it doesn't block
+    the event loop.
+    """
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+
+    @property
+    def name(self):
+        return self.gateway.name
+
+    async def _request(self, charge=False):
+        gateway = self.gateway
+        seconds = gateway._delay()
+        if seconds is not None:
+            timeout = request_timeout(gateway.timeout)
+            if timeout is not None and seconds > timeout:
+                await asyncio.sleep(timeout)
+                raise GatewayTimeout('Timed out after %s seconds' % (timeout,))
+            await asyncio.sleep(seconds)
+        gateway._roll(gateway._charge_outcomes if charge else gateway._outcomes)
+
+    @metered
+    async def charge(self, price, options):
+        await self._request(charge=True)
+        return self.gateway._charge(price, options)
+
+    @metered
+    async def charge_customer(self, customer, price, options):
+        await self._request(charge=True)
+        return self.gateway._charge_customer(customer, price, options)
+
+    @metered
+    async def charge_card(self, card, price, options):
+        await self._request(charge=True)
+        return self.gateway._charge_card(card, price, options)
+
+    @metered
+    async def retrieve(self, transaction_id):
+        await self._request()
+        return self.gateway._retrieve(transaction_id)
+
+    @metered
+    async def void(self, transaction):
+        await self._request()
+        return self.gateway._void(transaction)
+
+    @metered
+    async def refund(self, transaction, amount):
+        await self._request()
+        return self.gateway._refund(transaction, amount)
+
+    @metered
+    async def settle(self, transaction, amount):
+        await self._request()
+        return self.gateway._settle(transaction, amount)
+
+    @metered
+    async def create_customer(self, options):
+        await self._request()
+        return self.gateway._create_customer(options)
+
+    @metered
+    async def retrieve_customer(self, customer_id):
+        await self._request()
+        return self.gateway._retrieve_customer(customer_id)
+
+    @metered
+    async def update_customer(self, customer_id, options):
+        await self._request()
+        return self.gateway._update_customer(customer_id, options)
+
+    @metered
+    async def delete_customer(self, customer_id):
+        await self._request()
+        return self.gateway._delete_customer(customer_id)
+
+    @metered
+    async def add_card_to_customer(self, customer, options):
+        await self._request()
+        return self.gateway._add_card_to_customer(customer, options)
+
+    @metered
+    async def update_card(self, card):
+        await self._request()
+        return self.gateway._update_card(card)
+
+    @metered
+    async def delete_card(self, card):
+        await self._request()
+        return self.gateway._delete_card(card)
+
+    async def close(self):
+        pass
+
+
+class AsyncGateway(object):
+    """
+    Coroutine versions of the operations of a gateway without asyncio
+    support of its own, like Braintree: each call runs the blocking
+    operation in an executor (by default the event loop's thread pool), with
+    the caller's deadline.  This is what ``gateway.aio`` is unless the
+    gateway has something better.
+    """
+
+    def __init__(self, gateway, executor=None):
+        self.gateway = gateway
+        self.executor = executor
+
+    @property
+    def name(self):
+        return self.gateway.name
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        method = getattr(self.gateway, name)
+
+        async def call(*args, **kwargs):
+            fn = functools.partial(_run_at_deadline, get_deadline(), method, args, kwargs)
+            if contextvars is not None:
+                # the caller's metrics too
+                fn = functools.partial(contextvars.copy_context().run, fn)
+            return await asyncio.get_event_loop().run_in_executor(self.executor, fn)
+        call.__name__ = name
+        return call
+
+
+def _run_at_deadline(expires, fn, args, kwargs):
+    with at_deadline(expires):
+        return fn(*args, **kwargs)
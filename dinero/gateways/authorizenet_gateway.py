@@ -1,21 +1,31 @@
 from __future__ import division
-import codecs
+import json
+import os
 import re
-import requests
 import six
 import sys
+import tempfile
+import time
 
 from datetime import date
 from lxml import etree
 
+from dinero.cache import get_cached, set_cached, invalidate
+from dinero.capture import capture_from_options
 from dinero.exceptions import *
 from dinero.gateways.base import Gateway
+from dinero.gateways.transport import RequestsTransport, transport_from_options
+from dinero.metrics import count_bytes, metered, phase, timed
+from dinero.singleflight import coalesced
+from dinero.timeouts import now, request_timeout
 
 if sys.version_info < (2, 7):
     from dinero.ordereddict import OrderedDict
 else:
     from collections import OrderedDict
 
+NS = 'AnetApi/xml/v1/schema/AnetApiSchema.xsd'
+
 # resonseCodes
 # 1 = Approved
 # 2 = Declined
@@ -64,22 +74,134 @@ AVS_ADDRESS_SUCCESSFUL_RESPONSES = [
 ]
 
 
-def xml_post(url, obj):
-    resp = requests.post(
-            url,
-            data=etree.tostring(obj),
-            headers={'content-type': 'application/xml'},
-            verify=True,
-            )
+XML_HEADERS = {'content-type': 'application/xml'}
+
+# seconds to wait for any single response from authorize.net
+DEFAULT_TIMEOUT = 30
+
+_default_transport = None
+
+
+def get_default_transport():
+    global _default_transport
+    if _default_transport is None:
+        _default_transport = RequestsTransport()
+    return _default_transport
+
+
+def serialize_request(obj):
+    """
+    Request builders return either an lxml element or an already serialized
+    request (bytes).
+    """
+    if isinstance(obj, six.binary_type):
+        return obj
+    return etree.tostring(obj)
 
-    content = resp.content
-    if content.startswith(codecs.BOM_UTF8):
-        # authorize.net puts a BOM in utf-8. Shame.
-        content = content[3:]
+
+def xml_post(url, obj, transport=None, timeout=None, capture=None):
+    """
+    Sends a request and parses the response.  If ``capture`` (a
+    :class:`dinero.capture.Capture`) is given, the exchange is recorded in it.
+    """
+    if transport is None:
+        transport = get_default_transport()
+
+    with phase('serialize'):
+        data = serialize_request(obj)
+    if capture is not None:
+        sent, started = time.time(), now()
+    with phase('network'):
+        try:
+            content = transport.post(url, data, XML_HEADERS, timeout=request_timeout(timeout))
+        except Exception as e:
+            if capture is not None:
+                capture.record(url, data, None, now() - started, e, sent)
+            raise
+    if capture is not None:
+        capture.record(url, data, content, now() - started, sent=sent)
+    count_bytes(len(data), len(content))
+    with phase('parse'):
+        return parse_xml_response(content)
+
+
+def parse_xml_response(content):
+    # authorize.net puts a BOM in utf-8.  Shame.  libxml2 skips it, as long
+    # as the content is passed as bytes.
     content = six.binary_type(content)
     return etree.XML(content)
 
 
+def xml_iterparse(chunks, tags):
+    """
+    Parses an XML document from an iterable of ``chunks`` of bytes,
+    yielding each element whose tag (without namespace) is in ``tags`` as
+    soon as it is complete.  Once the consumer moves on, the element is
+    cleared and removed from the tree, so memory use stays flat no matter
+    how many elements the document has.  An element in ``tags`` may not
+    contain another element in ``tags``.
+    """
+    parser = etree.XMLPullParser(events=('end',))
+    for chunk in chunks:
+        parser.feed(chunk)
+        for elem in _completed_elements(parser, tags):
+            yield elem
+    parser.close()
+    for elem in _completed_elements(parser, tags):
+        yield elem
+
+
+def _completed_elements(parser, tags):
+    for event, elem in parser.read_events():
+        if get_tag(elem) in tags:
+            yield elem
+            elem.clear()
+            # earlier siblings have been handed out (or aren't wanted)
+            # already, drop them
+            parent = elem.getparent()
+            while elem.getprevious() is not None:
+                del parent[0]
+
+
+def xml_stream(url, obj, tags, transport=None, timeout=None, capture=None):
+    """
+    Like xml_post, but the response is streamed through xml_iterparse.
+    """
+    if transport is None:
+        transport = get_default_transport()
+
+    data = serialize_request(obj)
+    count_bytes(sent=len(data))
+    sent, started = time.time(), now()
+    chunks = transport.post_stream(url, data, XML_HEADERS, timeout=request_timeout(timeout))
+    chunks = _counted(chunks)
+    if capture is not None:
+        chunks = _captured(chunks, capture, url, data, sent, started)
+    return xml_iterparse(chunks, tags)
+
+
+def _counted(chunks):
+    for chunk in chunks:
+        count_bytes(received=len(chunk))
+        yield chunk
+
+
+def _captured(chunks, capture, url, data, sent, started):
+    """
+    Passes ``chunks`` through, and records the exchange once the whole
+    response has been read.
+    """
+    content = []
+    try:
+        for chunk in chunks:
+            content.append(chunk)
+            yield chunk
+    except Exception as e:
+        capture.record(url, data, None, now() - started, e, sent)
+        raise
+    capture.record(url, data, b''.join(content), now() - started, sent=sent)
+
+
 def prepare_number(number):
     return re.sub('[^0-9Xx]', '', number)
 
@@ -114,6 +236,53 @@ def _dict_to_xml(root, dictionary, ns=None):
     return root
 
 
+def _escape_text(text):
+    # the same escaping that lxml does for element text
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('\r', '&#13;')
+
+
+def _dict_to_text(parts, dictionary):
+    for key, value in six.iteritems(dictionary):
+        if isinstance(value, list):
+            for item in value:
+                _value_to_text(parts, key, item)
+        else:
+            _value_to_text(parts, key, value)
+
+
+def _value_to_text(parts, key, value):
+    if value is None:
+        return
+
+    if isinstance(value, dict):
+        start = len(parts)
+        parts.append('<%s>' % key)
+        _dict_to_text(parts, value)
+        if len(parts) == start + 1:
+            parts[start] = '<%s/>' % key
+        else:
+            parts.append('</%s>' % key)
+    elif value or isinstance(value, six.text_type):
+        if not isinstance(value, six.text_type):
+            value = str(value)
+            if not isinstance(value, six.text_type):
+                # Python 2 byte string
+                value = value.decode('utf-8')
+        parts.append('<%s>%s</%s>' % (key, _escape_text(value), key))
+    else:
+        parts.append('<%s/>' % key)
+
+
+def _dict_to_bytes(dictionary):
+    """
+    Serializes ``dictionary`` exactly like ``etree.tostring(_dict_to_xml(...))``
+    would serialize its children, without building an element tree.
+    """
+    parts = []
+    _dict_to_text(parts, dictionary)
+    return ''.join(parts).encode('ascii', 'xmlcharrefreplace')
+
+
 def get_tag(elem):
     return elem.tag.partition('}')[2] or elem.tag
 
@@ -148,6 +317,190 @@ def xml_to_dict(parent):
     return ret
 
 
+def _text(elem):
+    return elem.text and elem.text.strip() or ''
+
+
+def _leaves(elem):
+    """
+    The text of the childless children of ``elem``, by tag.
+    """
+    ret = {}
+    for child in elem:
+        if not len(child):
+            tag = child.tag
+            ret[tag[tag.find('}') + 1:]] = child.text and child.text.strip() or ''
+    return ret
+
+
+def _tags(*names):
+    """
+    Maps the tag names, with and without the Authorize.net namespace, to
+    the bare name.
+    """
+    ret = {}
+    for name in names:
+        ret[name] = name
+        ret['{%s}%s' % (NS, name)] = name
+    return ret
+
+
+MESSAGES_TAGS = _tags('resultCode', 'message')
+
+# the parts of <transactionResponse> and <transaction> that check_for_error
+# and _resp_to_transaction_dict read
+TRANSACTION_TAGS = _tags(
+        'transId',
+        'avsResultCode',
+        'AVSResponse',
+        'cvvResultCode',
+        'cardCodeResponse',
+        'authCode',
+        'transactionStatus',
+        'accountNumber',
+        'accountType',
+        'authAmount',
+        'messages',
+        'errors',
+        'payment',
+        'customer',
+        )
+
+PAYMENT_PROFILE_TAGS = _tags('customerPaymentProfileId', 'billTo', 'payment')
+
+PROFILE_TAGS = _tags('customerProfileId', 'email', 'paymentProfiles', 'messages')
+
+RESPONSE_TAGS = _tags('messages', 'transactionResponse', 'transaction', 'directResponse',
+                      'profile', 'customerProfileId')
+
+
+def _decode_messages(elem):
+    ret = {'message': []}
+    for child in elem:
+        tag = MESSAGES_TAGS.get(child.tag)
+        if tag == 'message':
+            ret['message'].append(_leaves(child))
+        elif tag is not None:
+            ret[tag] = _text(child)
+    return ret
+
+
+def _decode_errors(elem):
+    return {'error': [_leaves(child) for child in elem]}
+
+
+def _decode_payment(elem):
+    ret = {}
+    for child in elem:
+        tag = child.tag
+        ret[tag[tag.find('}') + 1:]] = _leaves(child)
+    return ret
+
+
+def _decode_transaction(elem):
+    if not len(elem):
+        return ''
+
+    ret = {}
+    for child in elem:
+        tag = TRANSACTION_TAGS.get(child.tag)
+        if tag is None:
+            continue
+        if not len(child):
+            ret[tag] = _text(child)
+        elif tag == 'messages':
+            ret[tag] = _decode_messages(child)
+        elif tag == 'errors':
+            ret[tag] = _decode_errors(child)
+        elif tag == 'payment':
+            ret[tag] = _decode_payment(child)
+        elif tag == 'customer':
+            ret[tag] = _leaves(child)
+    return ret
+
+
+def _decode_payment_profile(elem):
+    ret = {}
+    for child in elem:
+        tag = PAYMENT_PROFILE_TAGS.get(child.tag)
+        if tag is None:
+            continue
+        if not len(child):
+            ret[tag] = _text(child)
+        elif tag == 'billTo':
+            ret[tag] = _leaves(child)
+        elif tag == 'payment':
+            ret[tag] = _decode_payment(child)
+    return ret
+
+
+def _decode_profile(elem):
+    ret = {'paymentProfiles': []}
+    for child in elem:
+        tag = PROFILE_TAGS.get(child.tag)
+        if tag == 'paymentProfiles':
+            ret[tag].append(_decode_payment_profile(child))
+        elif tag is None:
+            continue
+        elif not len(child):
+            ret[tag] = _text(child)
+        elif tag == 'messages':
+            ret[tag] = _decode_messages(child)
+    return ret
+
+
+def decode_transaction_response(root):
+    """
+    Decodes createTransactionResponse, getTransactionDetailsResponse and
+    createCustomerProfileTransactionResponse in a single pass.  The result is
+    shaped like the xml_to_dict result, but only contains what the response
+    handlers read, in plain dicts.
+    """
+    ret = {}
+    for child in root:
+        tag = RESPONSE_TAGS.get(child.tag)
+        if tag == 'messages':
+            ret[tag] = _decode_messages(child)
+        elif tag in ('transactionResponse', 'transaction'):
+            ret[tag] = _decode_transaction(child)
+        elif tag is not None and not len(child):
+            ret[tag] = _text(child)
+    return ret
+
+
+def decode_customer_profile_response(root):
+    """
+    Decodes getCustomerProfileResponse, see decode_transaction_response.
+    """
+    ret = {}
+    for child in root:
+        tag = RESPONSE_TAGS.get(child.tag)
+        if tag == 'messages':
+            ret[tag] = _decode_messages(child)
+        elif tag == 'profile':
+            ret[tag] = _decode_profile(child)
+        elif tag is not None and not len(child):
+            ret[tag] = _text(child)
+    return ret
+
+
+RESPONSE_DECODERS = {
+    'createTransactionResponse': decode_transaction_response,
+    'getTransactionDetailsResponse': decode_transaction_response,
+    'createCustomerProfileTransactionResponse': decode_transaction_response,
+    'getCustomerProfileResponse': decode_customer_profile_response,
+    }
+
+
+@timed('parse')
+def decode_response(root):
+    """
+    Turns a response into dicts, using a typed decoder for the known response
+    types and xml_to_dict for everything else.
+    """
+    return RESPONSE_DECODERS.get(get_tag(root), xml_to_dict)(root)
+
+
 def dotted_get(dict, key):
     searches = key.split('.')
     while searches:
@@ -178,10 +531,44 @@ RESPONSE_CODE_EXCEPTION_MAP = {
         '54': [RefundError],
         '33': [InvalidTransactionError],
         '44': [CVVError],
+        '16': [InvalidTransactionError],
+        '47': [InvalidAmountError],
+        '55': [RefundError],
+        '310': [InvalidTransactionError],
+        '311': [InvalidTransactionError],
         }
 
 INVALID_AUTHENTICATION_ERROR_CODE = 'E00007'
 
+# transactionStatus values of transactions that can be voided, and of
+# transactions that have to be refunded instead
+UNSETTLED_STATUSES = frozenset([
+    'authorizedPendingCapture',
+    'capturedPendingSettlement',
+    'FDSPendingReview',
+    'FDSAuthorizedPendingReview',
+    ])
+SETTLED_STATUSES = frozenset([
+    'settledSuccessfully',
+    ])
+
+TRANSACTION_SETTINGS = OrderedDict([
+    ('setting', [
+        OrderedDict([
+            ('settingName', 'duplicateWindow'),
+            ('settingValue', 0),
+            ]),
+        OrderedDict([
+            ('settingName', 'testRequest'),
+            ('settingValue', 'false'),
+            ]),
+        ],)
+    ])
+
+TRANSACTION_SETTINGS_BYTES = _dict_to_bytes(OrderedDict([
+    ('transactionSettings', TRANSACTION_SETTINGS),
+    ]))
+
 
 def payment_exception_factory(errors):
     exceptions = []
@@ -194,47 +581,165 @@ def payment_exception_factory(errors):
     return exceptions
 
 
+def default_discovery_cache():
+    """
+    A file in the user's own cache directory, rather than the shared
+    temporary directory, where other users could plant an endpoint.
+    """
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'dinero', 'authorizenet.json')
+
+
+def read_discovery_cache(path):
+    """
+    The login id -> endpoint mapping saved by write_discovery_cache, or an
+    empty dict if there isn't a usable one.
+    """
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict):
+        return {}
+    return cache
+
+
+def write_discovery_cache(path, login_id, url):
+    """
+    Saves the endpoint of ``login_id``, or forgets it if ``url`` is None.
+    The file is replaced atomically, so processes racing to write it never
+    see a partial one.  Failing to write the cache isn't an error, discovery
+    will just happen again.
+    """
+    cache = read_discovery_cache(path)
+    if url is None:
+        if cache.pop(login_id, None) is None:
+            return
+    else:
+        cache[login_id] = url
+    try:
+        cache_dir = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, 0o700)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(cache, f)
+        os.rename(tmp_path, path)
+    except (IOError, OSError):
+        pass
+
+
 class AuthorizeNet(Gateway):
-    ns = 'AnetApi/xml/v1/schema/AnetApiSchema.xsd'
+    ns = NS
     live_url = 'https://api2.authorize.net/xml/v1/request.api'
     test_url = 'https://apitest.authorize.net/xml/v1/request.api'
 
+    environments = {
+            'test': test_url,
+            'sandbox': test_url,
+            'live': live_url,
+            'production': live_url,
+            }
+
     def __init__(self, options):
         self.login_id = options['login_id']
         self.transaction_key = options['transaction_key']
+        self.options = options
+        self.transport = transport_from_options(options)
+        self.capture = capture_from_options(options)
+        self.timeout = options.get('timeout', DEFAULT_TIMEOUT)
+        self._request_heads = {}
+
+        environment = options.get('environment')
+        if environment is not None:
+            try:
+                self._url = self.environments[environment]
+            except KeyError:
+                raise DineroException('Unknown Authorize.net environment: {0!r}'.format(environment))
+
+        self.discovery_cache = options.get('discovery_cache')
+        if self.discovery_cache is True:
+            self.discovery_cache = default_discovery_cache()
+
+    @property
+    def cache_namespace(self):
+        return self.login_id
 
     _url = None
 
+    # True until the endpoint from the discovery cache has been used once
+    _unverified = False
+
     @property
     def url(self):
+        if not self._url:
+            self._load_cached_url()
         if not self._url:
             # Auto-discover if this is a real account or a developer account.  Tries
             # to access both end points and see which one works.
-            self._url = self.test_url
-            try:
-                # 0 is an invalid transaction ID.  This should raise an
-                # InvalidTransactionError.
-                self._void('0')
-            except PaymentException as e:
-                if InvalidTransactionError not in e:
-                    raise
-            except GatewayException as e:
-                error_code = e.args[0][0][0]
-                if error_code == INVALID_AUTHENTICATION_ERROR_CODE:
-                    self._url = self.live_url
-                    try:
-                        self._void('0')
-                    except PaymentException as e:
-                        if InvalidTransactionError not in e:
-                            raise
-                else:
-                    raise
+            if self._handle_probe(self._post_to(self.test_url, self._void_xml('0'))):
+                self._discovered(self.test_url)
+            elif self._handle_probe(self._post_to(self.live_url, self._void_xml('0'))):
+                self._discovered(self.live_url)
+            else:
+                raise GatewayException([(INVALID_AUTHENTICATION_ERROR_CODE,
+                                         'User authentication failed due to invalid authentication values.')])
         return self._url
 
     @url.setter
     def url(self, value):
         self._url = value
 
+    def _load_cached_url(self):
+        if self.discovery_cache:
+            url = read_discovery_cache(self.discovery_cache).get(self.login_id)
+            if url in (self.test_url, self.live_url):
+                self._url = url
+                self._unverified = True
+
+    def _stale_url(self, resp):
+        """
+        Whether ``resp``, the first response from an endpoint that came from
+        the discovery cache, shows that the account isn't there (anymore).
+        If so the endpoint is forgotten, so that the next request discovers
+        it again.
+        """
+        if not self._unverified:
+            return False
+        self._unverified = False
+        messages = resp['messages']
+        if messages['resultCode'] != 'Error' or not any(
+                message['code'] == INVALID_AUTHENTICATION_ERROR_CODE for message in messages['message']):
+            return False
+        self._url = None
+        write_discovery_cache(self.discovery_cache, self.login_id, None)
+        return True
+
+    def _discovered(self, url):
+        self._url = url
+        if self.discovery_cache:
+            write_discovery_cache(self.discovery_cache, self.login_id, url)
+
+    def warmup(self):
+        """
+        Discovers the endpoint now, rather than on the first request.
+        """
+        return self.url
+
+    _aio = None
+
+    @property
+    def aio(self):
+        """
+        The asyncio interface to this gateway, an
+        :class:`dinero.gateways.aio.AsyncAuthorizeNet`.
+        """
+        if self._aio is None:
+            from dinero.gateways.aio import AsyncAuthorizeNet, async_transport_from_options
+            self._aio = AsyncAuthorizeNet(self, async_transport_from_options(self.options, self.transport))
+        return self._aio
+
     def build_xml(self, root_name, root):
         root = OrderedDict(
             [('merchantAuthentication', OrderedDict([
@@ -244,27 +749,69 @@ class AuthorizeNet(Gateway):
 
         return _dict_to_xml(root_name, root, self.ns)
 
+    def _request_head(self, root_name):
+        """
+        The serialized start of a ``root_name`` request, including the
+        merchantAuthentication block.  It only depends on the credentials, so
+        it is built once.
+        """
+        try:
+            return self._request_heads[root_name]
+        except KeyError:
+            head = ('<%s xmlns="%s">' % (root_name, self.ns)).encode('ascii') + _dict_to_bytes(OrderedDict([
+                ('merchantAuthentication', OrderedDict([
+                    ('name', self.login_id),
+                    ('transactionKey', self.transaction_key),
+                ])),
+            ]))
+            self._request_heads[root_name] = head
+            return head
+
+    def build_request(self, root_name, root, tail=b''):
+        """
+        Like build_xml, but returns the serialized request.  ``tail`` is
+        already serialized XML to append after ``root``.
+        """
+        return b''.join([
+            self._request_head(root_name),
+            _dict_to_bytes(root),
+            tail,
+            ('</%s>' % root_name).encode('ascii'),
+            ])
+
+    def _post_to(self, url, xml):
+        return decode_response(xml_post(url, xml, self.transport, self.timeout, self.capture))
+
+    def _post(self, xml):
+        resp = self._post_to(self.url, xml)
+        if self._stale_url(resp):
+            # authentication failed, so nothing was done; try it again
+            resp = self._post_to(self.url, xml)
+        return resp
+
+    def _stream(self, xml, tags):
+        return xml_stream(self.url, xml, tags, self.transport, self.timeout, self.capture)
+
     def check_for_error(self, resp):
+        transaction_response = resp.get('transactionResponse')
         if resp['messages']['resultCode'] == 'Error':
-            if resp.get('transactionResponse'):
+            if transaction_response:
                 raise PaymentException(payment_exception_factory([(errors['errorCode'], errors['errorText'])
-                                                                  for errors in resp['transactionResponse']['errors']['error']]))
+                                                                  for errors in transaction_response['errors']['error']]))
             else:
                 raise GatewayException([(message['code'], message['text'])
                                         for message in resp['messages']['message']])
 
         # Sometimes Authorize.net is confused and returns errors even though it
         # says that the request was Successful!
-        try:
+        if transaction_response and transaction_response.get('errors'):
             raise PaymentException(payment_exception_factory([(errors['errorCode'], errors['errorText'])
-                                                              for errors in resp['transactionResponse']['errors']['error']]))
-        except KeyError:
-            pass
+                                                              for errors in transaction_response['errors']['error']]))
 
     ##|
     ##|  XML BUILDERS
     ##|
-    def _transaction_xml(self, price, options):
+    def _transaction_fields(self, price, options):
         if options.get('settle', True):
             txn_type = 'authCaptureTransaction'
         else:
@@ -288,24 +835,31 @@ class AuthorizeNet(Gateway):
         billto = self._billto_xml(options)
         if billto:
             transaction_xml['billTo'] = billto
-        transaction_xml['transactionSettings'] = OrderedDict([
-                    ('setting', [
-                        OrderedDict([
-                            ('settingName', 'duplicateWindow'),
-                            ('settingValue', 0),
-                            ]),
-                        OrderedDict([
-                            ('settingName', 'testRequest'),
-                            ('settingValue', 'false'),
-                            ]),
-                        ],)
-                    ])
+        return transaction_xml
+
+    def _transaction_xml(self, price, options):
+        transaction_xml = self._transaction_fields(price, options)
+        transaction_xml['transactionSettings'] = TRANSACTION_SETTINGS
 
         xml = self.build_xml('createTransactionRequest', OrderedDict([
             ('transactionRequest', transaction_xml,),
             ]))
         return xml
 
+    @timed('serialize')
+    def _transaction_request(self, price, options):
+        """
+        The serialized version of _transaction_xml.  This is the hot path for
+        every charge, so only the fields that change are serialized.
+        """
+        return b''.join([
+            self._request_head('createTransactionRequest'),
+            b'<transactionRequest>',
+            _dict_to_bytes(self._transaction_fields(price, options)),
+            TRANSACTION_SETTINGS_BYTES,
+            b'</transactionRequest></createTransactionRequest>',
+            ])
+
     def _payment_xml(self, options):
         year = str(options.get('year', '0'))
         if year != 'XXXX' and int(year) < 100:
@@ -353,7 +907,7 @@ class AuthorizeNet(Gateway):
                 ('email', options.get('email')),
                 ])
 
-    def _create_customer_xml(self, options):
+    def _customer_payment_fields(self, options):
         # include <billTo> and <payment> fields only if
         # the necessary data was included
 
@@ -381,6 +935,15 @@ class AuthorizeNet(Gateway):
         else:
             payment = None
 
+        return billto, payment
+
+    @timed('serialize')
+    def _create_customer_xml(self, options):
+        if 'email' not in options:
+            raise InvalidCustomerException('"email" is a required field in Customer.create')
+
+        billto, payment = self._customer_payment_fields(options)
+
         if billto or payment:
             stuff = []
             if billto:
@@ -399,6 +962,7 @@ class AuthorizeNet(Gateway):
             ])
         return self.build_xml('createCustomerProfileRequest', root)
 
+    @timed('serialize')
     def _update_customer_xml(self, customer_id, options):
         stuff = [('email', options['email']), ('customerProfileId', customer_id)]
 
@@ -407,13 +971,13 @@ class AuthorizeNet(Gateway):
             ])
         return self.build_xml('updateCustomerProfileRequest', root)
 
-    def _charge_customer_xml(self, customer_id, card_id, price, options):
+    def _charge_customer_fields(self, customer_id, card_id, price, options):
         if options.get('settle', True):
             txn_type = 'profileTransAuthCapture'
         else:
             txn_type = 'profileTransAuthOnly'
 
-        return self.build_xml('createCustomerProfileTransactionRequest', OrderedDict([
+        return OrderedDict([
                 ('transaction', OrderedDict([
                     (txn_type, OrderedDict([
                         ('amount', price),
@@ -422,16 +986,166 @@ class AuthorizeNet(Gateway):
                         ('cardCode', options.get('cvv')),
                     ])),
                 ]))
+            ])
+
+    def _charge_customer_xml(self, customer_id, card_id, price, options):
+        return self.build_xml('createCustomerProfileTransactionRequest',
+                              self._charge_customer_fields(customer_id, card_id, price, options))
+
+    @timed('serialize')
+    def _charge_customer_request(self, customer_id, card_id, price, options):
+        return self.build_request('createCustomerProfileTransactionRequest',
+                                  self._charge_customer_fields(customer_id, card_id, price, options))
+
+    def _retrieve_fields(self, transaction_id):
+        return OrderedDict([
+            ('transId', transaction_id),
+            ])
+
+    def _retrieve_xml(self, transaction_id):
+        return self.build_xml('getTransactionDetailsRequest', self._retrieve_fields(transaction_id))
+
+    @timed('serialize')
+    def _retrieve_request(self, transaction_id):
+        return self.build_request('getTransactionDetailsRequest', self._retrieve_fields(transaction_id))
+
+    @timed('serialize')
+    def _void_xml(self, transaction_id):
+        return self.build_xml('createTransactionRequest', OrderedDict([
+            ('transactionRequest', OrderedDict([
+                ('transactionType', 'voidTransaction'),
+                ('refTransId', transaction_id),
+            ])),
+        ]))
+
+    @timed('serialize')
+    def _refund_xml(self, transaction, amount):
+        return self.build_xml('createTransactionRequest', OrderedDict([
+            ('transactionRequest', OrderedDict([
+                ('transactionType', 'refundTransaction'),
+                ('amount', amount),
+                ('payment', self._payment_xml({
+                    'number': transaction.data['account_number'],
+                    'year': 'XXXX',
+                    'month': 'XX'
+                })),
+                ('refTransId', transaction.transaction_id),
+                ])),
+            ]))
+
+    @timed('serialize')
+    def _settle_xml(self, transaction, amount):
+        return self.build_xml('createTransactionRequest', OrderedDict([
+            ('transactionRequest', OrderedDict([
+                ('transactionType', 'priorAuthCaptureTransaction'),
+                ('amount', amount),
+                ('refTransId', transaction.transaction_id),
+                ])),
+            ]))
+
+    @timed('serialize')
+    def _update_customer_payment_xml(self, customer_id, card_id, profile, options):
+        """
+        ``profile`` is the existing payment profile (or None), its fields are
+        used for anything that isn't in ``options``.
+        """
+        billto, payment = self._customer_payment_fields(options)
+
+        if profile is not None:
+            merge = self._dict_to_payment_profile(profile['paymentProfile'])
+            merge.update(options)
+            options = merge
+            # refresh billto and payment with the merged information
+            billto = ('billTo', self._billto_xml(options))
+            payment = ('payment', self._payment_xml(options))
+
+        stuff = []
+        if billto:
+            stuff.append(billto)
+        if payment:
+            stuff.append(payment)
+
+        if card_id:
+            stuff.append(('customerPaymentProfileId', card_id))
+
+            root = OrderedDict([
+                ('customerProfileId', customer_id),
+                ('paymentProfile', OrderedDict(stuff)),
+                ])
+            return self.build_xml('updateCustomerPaymentProfileRequest', root)
+        else:
+            root = OrderedDict([
+                ('customerProfileId', customer_id),
+                ('paymentProfile', OrderedDict(stuff)),
+                ])
+            return self.build_xml('createCustomerPaymentProfileRequest', root)
+
+    def _card_payment_profile(self, options):
+        return OrderedDict([
+            ('billTo', self._billto_xml(options)),
+            ('payment', self._payment_xml(options)),
+            ])
+
+    @timed('serialize')
+    def _add_card_xml(self, customer, options):
+        return self.build_xml('createCustomerPaymentProfileRequest', OrderedDict([
+            ('customerProfileId', customer.customer_id),
+            ('paymentProfile', self._card_payment_profile(options)),
+            ('validationMode', 'liveMode'),
+            ]))
+
+    @timed('serialize')
+    def _retrieve_customer_xml(self, customer_id):
+        return self.build_xml('getCustomerProfileRequest', OrderedDict([
+            ('customerProfileId', customer_id),
+            ]))
+
+    @timed('serialize')
+    def _delete_customer_xml(self, customer_id):
+        return self.build_xml('deleteCustomerProfileRequest', OrderedDict([
+            ('customerProfileId', customer_id),
+            ]))
+
+    @timed('serialize')
+    def _update_card_xml(self, card):
+        return self.build_xml('updateCustomerPaymentProfileRequest', OrderedDict([
+            ('customerProfileId', card.customer_id),
+            ('paymentProfile', OrderedDict([
+                ('billTo', self._billto_xml(card.data)),
+                ('payment', self._payment_xml(card.data)),
+                ('customerPaymentProfileId', card.card_id),
+            ])),
+            ('validationMode', 'liveMode'),
+        ]))
+
+    @timed('serialize')
+    def _transaction_list_xml(self, batch_id):
+        return self.build_xml('getTransactionListRequest', OrderedDict([
+            ('batchId', batch_id),
+            ]))
+
+    @timed('serialize')
+    def _get_customer_payment_profile_xml(self, customer_id, card_id):
+        return self.build_xml('getCustomerPaymentProfileRequest', OrderedDict([
+            ('customerProfileId', customer_id),
+            ('customerPaymentProfileId', card_id),
+            ]))
+
+    def _delete_card_xml(self, card):
+        return self.build_xml('deleteCustomerPaymentProfileRequest', OrderedDict([
+            ('customerProfileId', card.customer_id),
+            ('customerPaymentProfileId', card.card_id),
             ]))
 
     def _resp_to_transaction_dict(self, resp, price):
+        avs = get_first_of(resp, ['avsResultCode', 'AVSResponse'])
         ret = {
                 'price': price,
                 'transaction_id': resp['transId'],
-                'avs_successful': get_first_of(resp, ['avsResultCode', 'AVSResponse']) in AVS_SUCCESSFUL_RESPONSES,
+                'avs_successful': avs in AVS_SUCCESSFUL_RESPONSES,
                 'cvv_successful': get_first_of(resp, ['cvvResultCode', 'cardCodeResponse']) in CVV_SUCCESSFUL_RESPONSES,
-                'avs_zip_successful': get_first_of(resp, ['avsResultCode', 'AVSResponse']) in AVS_ZIP_SUCCESSFUL_RESPONSES,
-                'avs_address_successful': get_first_of(resp, ['avsResultCode', 'AVSResponse']) in AVS_ADDRESS_SUCCESSFUL_RESPONSES,
+                'avs_zip_successful': avs in AVS_ZIP_SUCCESSFUL_RESPONSES,
+                'avs_address_successful': avs in AVS_ADDRESS_SUCCESSFUL_RESPONSES,
                 'auth_code': resp.get('authCode'),
                 'status': resp.get('transactionStatus'),
                 }
@@ -482,70 +1196,63 @@ class AuthorizeNet(Gateway):
                 }
         return ret
 
-    def charge(self, price, options):
-        if 'customer' in options:
-            return self.charge_customer(options['customer'], price, options)
-        if 'cc' in options:
-            return self.charge_card(options['cc'], price, options)
+    ##|
+    ##|  RESPONSE HANDLERS
+    ##|
+    def _check_for_error_codes(self, resp, codes):
+        """
+        Like check_for_error, but a GatewayException with an error code in
+        ``codes`` is turned into the matching exception class.
+        """
+        try:
+            self.check_for_error(resp)
+        except GatewayException as e:
+            error_code = e.args[0][0][0]
+            if error_code in codes:
+                raise codes[error_code](e)
+            raise
 
-        xml = self._transaction_xml(price, options)
+    @timed('map')
+    def _handle_probe(self, resp):
+        """
+        Returns False if the endpoint didn't accept our credentials.
+        """
+        try:
+            # 0 is an invalid transaction ID.  This should raise an
+            # InvalidTransactionError.
+            self.check_for_error(resp)
+        except PaymentException as e:
+            if InvalidTransactionError not in e:
+                raise
+        except GatewayException as e:
+            error_code = e.args[0][0][0]
+            if error_code == INVALID_AUTHENTICATION_ERROR_CODE:
+                return False
+            raise
+        return True
 
-        resp = xml_to_dict(xml_post(self.url, xml))
+    @timed('map')
+    def _handle_ok(self, resp):
         self.check_for_error(resp)
+        return True
 
+    @timed('map')
+    def _handle_charge(self, resp, price):
+        self.check_for_error(resp)
         return self._resp_to_transaction_dict(resp['transactionResponse'], price)
 
-    def retrieve(self, transaction_id):
-        xml = self.build_xml('getTransactionDetailsRequest', OrderedDict([
-            ('transId', transaction_id),
-            ]))
-
-        resp = xml_to_dict(xml_post(self.url, xml))
+    @timed('map')
+    def _handle_retrieve(self, resp):
         self.check_for_error(resp)
-
         return self._resp_to_transaction_dict(resp['transaction'], resp['transaction']['authAmount'])
 
-    def void(self, transaction):
-        return self._void(transaction.transaction_id)
-
-    def _void(self, transaction_id):
-        xml = self.build_xml('createTransactionRequest', OrderedDict([
-            ('transactionRequest', OrderedDict([
-                ('transactionType', 'voidTransaction'),
-                ('refTransId', transaction_id),
-            ])),
-        ]))
-
-        resp = xml_to_dict(xml_post(self.url, xml))
-        self.check_for_error(resp)
-
-        return True
-
-    def refund(self, transaction, amount):
-        xml = self.build_xml('createTransactionRequest', OrderedDict([
-            ('transactionRequest', OrderedDict([
-                ('transactionType', 'refundTransaction'),
-                ('amount', amount),
-                ('payment', self._payment_xml({
-                    'number': transaction.data['account_number'],
-                    'year': 'XXXX',
-                    'month': 'XX'
-                })),
-                ('refTransId', transaction.transaction_id),
-                ])),
-            ]))
-
-        resp = xml_to_dict(xml_post(self.url, xml))
-        self.check_for_error(resp)
-
-        return True
-
-    def create_customer(self, options):
-        if 'email' not in options:
-            raise InvalidCustomerException('"email" is a required field in Customer.create')
+    @timed('map')
+    def _handle_settle(self, resp, transaction):
+        transaction.auth_code = resp['transactionResponse']['authCode']
+        return transaction
 
-        xml = self._create_customer_xml(options)
-        resp = xml_to_dict(xml_post(self.url, xml))
+    @timed('map')
+    def _handle_create_customer(self, resp, options):
         try:
             self.check_for_error(resp)
         except GatewayException as e:
@@ -576,226 +1283,267 @@ class AuthorizeNet(Gateway):
 
         return profile
 
-    def _update_customer_payment(self, customer_id, options):
-        # update <billTo> and <payment> fields only if
-        # the necessary data was included
+    @timed('map')
+    def _handle_update_customer_payment(self, resp):
+        self._check_for_error_codes(resp, {
+            'E00039': DuplicateCustomerError,  # Duplicate Record
+            'E00013': InvalidCardError,  # Expiration Date is invalid
+            })
+
+    @timed('map')
+    def _handle_add_card(self, resp, customer, options):
+        self._check_for_error_codes(resp, {
+            'E00039': DuplicateCardError,  # Duplicate Record
+            'E00013': InvalidCardError,  # Expiration Date is invalid
+            })
+        card = self._dict_to_payment_profile(self._card_payment_profile(options))
+        card.update({
+            'customer_id': customer.customer_id,
+            'card_id': resp['customerPaymentProfileId'],
+        })
+        return card
 
-        # update <billTo> entry?
-        billto_fields = [
-            'first_name',
-            'last_name',
-            'company',
-            'address',
-            'city',
-            'state',
-            'zip',
-            'country',
-            'phone',
-            'fax',
-            ]
-        if any(field in options for field in billto_fields):
-            billto = ('billTo', self._billto_xml(options))
-        else:
-            billto = None
+    @timed('map')
+    def _handle_customer_not_found(self, resp):
+        self._check_for_error_codes(resp, {
+            'E00040': CustomerNotFoundError,  # NotFound
+            })
+        return resp
 
-        # update <payment> entry?
-        if 'number' in options:
-            payment = ('payment', self._payment_xml(options))
-        else:
-            payment = None
+    @timed('map')
+    def _handle_retrieve_customer(self, resp):
+        self._handle_customer_not_found(resp)
+        return self._dict_to_customer(resp['profile'])
 
-        if billto or payment:
-            if 'card_id' in options:
-                card_id = options['card_id']
-            else:
-                customer = self.retrieve_customer(customer_id)
-                card_id = customer.card_id
-
-            merge = None
-            if card_id:
-                try:
-                    profile = self._get_customer_payment_profile(customer_id, card_id)
-                    # TODO: test this, sorry
-                    merge = self._dict_to_payment_profile(profile['paymentProfile'])
-                    merge.update(options)
-                    options = merge
-                except CustomerNotFoundError:
-                    pass
+    @timed('map')
+    def _handle_charge_customer(self, resp, price):
+        self._handle_customer_not_found(resp)
+        return self._resp_to_transaction_dict_direct_response(resp['directResponse'], price)
 
-            stuff = []
-            # refresh billto and payment if merge came back with anything
-            if merge:
-                billto = ('billTo', self._billto_xml(options))
+    ##|
+    ##|  OPERATIONS
+    ##|
+    @metered
+    def charge(self, price, options):
+        if 'customer' in options:
+            return self.charge_customer(options['customer'], price, options)
+        if 'cc' in options:
+            return self.charge_card(options['cc'], price, options)
 
-            if billto:
-                stuff.append(billto)
+        xml = self._transaction_request(price, options)
+        return self._handle_charge(self._post(xml), price)
 
-            if merge:
-                payment = ('payment', self._payment_xml(options))
+    @metered
+    def retrieve(self, transaction_id):
+        return coalesced(self, 'transaction', transaction_id, self._retrieve_transaction, transaction_id)
 
-            if payment:
-                stuff.append(payment)
+    def _retrieve_transaction(self, transaction_id):
+        xml = self._retrieve_request(transaction_id)
+        return self._handle_retrieve(self._post(xml))
 
-            if card_id:
-                stuff.append(('customerPaymentProfileId', card_id))
+    @metered
+    def void(self, transaction):
+        return self._void(transaction.transaction_id)
 
-                root = OrderedDict([
-                    ('customerProfileId', customer_id),
-                    ('paymentProfile', OrderedDict(stuff)),
-                    ])
-                xml = self.build_xml('updateCustomerPaymentProfileRequest', root)
-                resp = xml_to_dict(xml_post(self.url, xml))
-            else:
-                root = OrderedDict([
-                    ('customerProfileId', customer_id),
-                    ('paymentProfile', OrderedDict(stuff)),
-                    ])
-                xml = self.build_xml('createCustomerPaymentProfileRequest', root)
-                resp = xml_to_dict(xml_post(self.url, xml))
+    def _void(self, transaction_id):
+        xml = self._void_xml(transaction_id)
+        return self._handle_ok(self._post(xml))
+
+    @metered
+    def refund(self, transaction, amount):
+        xml = self._refund_xml(transaction, amount)
+        return self._handle_ok(self._post(xml))
+
+    def is_settled(self, transaction):
+        status = transaction.data.get('status')
+        if status in SETTLED_STATUSES:
+            return True
+        if status in UNSETTLED_STATUSES:
+            return False
+        return None
+
+    @metered
+    def create_customer(self, options):
+        xml = self._create_customer_xml(options)
+        return self._handle_create_customer(self._post(xml), options)
 
+    def _update_customer_payment(self, customer_id, options):
+        billto, payment = self._customer_payment_fields(options)
+        if not (billto or payment):
+            return
+
+        if 'card_id' in options:
+            card_id = options['card_id']
+        else:
+            customer, cards = self.retrieve_customer(customer_id)
+            card_id = customer.get('card_id')
+
+        profile = None
+        if card_id:
             try:
-                self.check_for_error(resp)
-            except GatewayException as e:
-                error_code = e.args[0][0][0]
-                if error_code == 'E00039':  # Duplicate Record
-                    raise DuplicateCustomerError(e)
-                elif error_code == 'E00013':  # Expiration Date is invalid
-                    raise InvalidCardError(e)
-                raise
+                profile = self._get_customer_payment_profile(customer_id, card_id)
+            except CustomerNotFoundError:
+                pass
+
+        xml = self._update_customer_payment_xml(customer_id, card_id, profile, options)
+        try:
+            self._handle_update_customer_payment(self._post(xml))
+        finally:
+            self._invalidate_customer(customer_id, card_id)
 
+    @metered
     def add_card_to_customer(self, customer, options):
-        root = OrderedDict([
-            ('customerProfileId', customer.customer_id),
-            ('paymentProfile', OrderedDict([
-                ('billTo', self._billto_xml(options)),
-                ('payment', self._payment_xml(options)),
-                ])),
-            ('validationMode', 'liveMode'),
-            ])
-        xml = self.build_xml('createCustomerPaymentProfileRequest', root)
-        resp = xml_to_dict(xml_post(self.url, xml))
+        xml = self._add_card_xml(customer, options)
         try:
-            self.check_for_error(resp)
-        except GatewayException as e:
-            error_code = e.args[0][0][0]
-            if error_code == 'E00039':  # Duplicate Record
-                raise DuplicateCardError(e)
-            elif error_code == 'E00013':  # Expiration Date is invalid
-                raise InvalidCardError(e)
-            raise
-        card = self._dict_to_payment_profile(root['paymentProfile'])
-        card.update({
-            'customer_id': customer.customer_id,
-            'card_id': resp['customerPaymentProfileId'],
-        })
-        return card
+            return self._handle_add_card(self._post(xml), customer, options)
+        finally:
+            self._invalidate_customer(customer.customer_id)
 
+    @metered
     def update_customer(self, customer_id, options):
+        xml = self._update_customer_xml(customer_id, options)
         try:
-            xml = self._update_customer_xml(customer_id, options)
-            resp = xml_to_dict(xml_post(self.url, xml))
-            self.check_for_error(resp)
-        except GatewayException as e:
-            error_code = e.args[0][0][0]
-            if error_code == 'E00040':  # NotFound
-                raise CustomerNotFoundError(e)
-            raise
-        else:
-            self._update_customer_payment(customer_id, options)
-
+            self._handle_customer_not_found(self._post(xml))
+        finally:
+            self._invalidate_customer(customer_id)
+        self._update_customer_payment(customer_id, options)
         return True
 
+    @metered
     def retrieve_customer(self, customer_id):
-        xml = self.build_xml('getCustomerProfileRequest', OrderedDict([
-            ('customerProfileId', customer_id),
-            ]))
-
-        resp = xml_to_dict(xml_post(self.url, xml))
-        try:
-            self.check_for_error(resp)
-        except GatewayException as e:
-            error_code = e.args[0][0][0]
-            if error_code == 'E00040':  # NotFound
-                raise CustomerNotFoundError(e)
-            raise
+        cached = self._cached_customer(customer_id)
+        if cached is not None:
+            return cached
+        return coalesced(self, 'customer', customer_id, self._retrieve_customer, customer_id)
 
-        return self._dict_to_customer(resp['profile'])
+    def _retrieve_customer(self, customer_id):
+        xml = self._retrieve_customer_xml(customer_id)
+        return self._cache_customer(customer_id, self._handle_retrieve_customer(self._post(xml)))
 
+    @metered
     def delete_customer(self, customer_id):
-        xml = self.build_xml('deleteCustomerProfileRequest', OrderedDict([
-            ('customerProfileId', customer_id),
-            ]))
-        resp = xml_to_dict(xml_post(self.url, xml))
+        xml = self._delete_customer_xml(customer_id)
         try:
-            self.check_for_error(resp)
-        except GatewayException as e:
-            error_code = e.args[0][0][0]
-            if error_code == 'E00040':  # NotFound
-                raise CustomerNotFoundError(e)
-            raise
-
+            self._handle_customer_not_found(self._post(xml))
+        finally:
+            self._invalidate_customer(customer_id)
         return True
 
+    @metered
     def charge_customer(self, customer, price, options):
         customer_id = customer.customer_id
 
         try:
             card_id = customer.card_id
         except AttributeError:
-            customer = self.retrieve_customer(customer_id)
-            card_id = customer.card_id
+            customer, cards = self.retrieve_customer(customer_id)
+            card_id = customer.get('card_id')
 
         return self._charge_customer(customer_id, card_id, price, options)
 
     def _charge_customer(self, customer_id, card_id, price, options):
-        xml = self._charge_customer_xml(customer_id, card_id, price, options)
-        resp = xml_to_dict(xml_post(self.url, xml))
-        try:
-            self.check_for_error(resp)
-        except GatewayException as e:
-            error_code = e.args[0][0][0]
-            if error_code == 'E00040':  # NotFound
-                raise CustomerNotFoundError(e)
-            raise
-
-        return self._resp_to_transaction_dict_direct_response(resp['directResponse'], price)
+        xml = self._charge_customer_request(customer_id, card_id, price, options)
+        return self._handle_charge_customer(self._post(xml), price)
 
+    @metered
     def update_card(self, card):
-        xml = self.build_xml('updateCustomerPaymentProfileRequest', OrderedDict([
-            ('customerProfileId', card.customer_id),
-            ('paymentProfile', OrderedDict([
-                ('billTo', self._billto_xml(card.data)),
-                ('payment', self._payment_xml(card.data)),
-                ('customerPaymentProfileId', card.card_id),
-            ])),
-            ('validationMode', 'liveMode'),
-        ]))
-        resp = xml_to_dict(xml_post(self.url, xml))
+        xml = self._update_card_xml(card)
         try:
-            self.check_for_error(resp)
-        except GatewayException as e:
-            error_code = e.args[0][0][0]
-            raise
+            return self._handle_ok(self._post(xml))
+        finally:
+            self._invalidate_customer(card.customer_id, card.card_id)
 
+    @metered
     def charge_card(self, card, price, options):
         return self._charge_customer(card.customer_id, card.card_id, price, options)
 
     def _get_customer_payment_profile(self, customer_id, card_id):
-        xml = self.build_xml('getCustomerPaymentProfileRequest', OrderedDict([
-            ('customerProfileId', customer_id),
-            ('customerPaymentProfileId', card_id),
-            ]))
-        resp = xml_to_dict(xml_post(self.url, xml))
+        key = self._payment_profile_key(customer_id, card_id)
+        profile = get_cached(self, 'payment_profile', key)
+        if profile is None:
+            profile = coalesced(self, 'payment_profile', key, self._fetch_payment_profile, customer_id, card_id)
+        return profile
+
+    def _fetch_payment_profile(self, customer_id, card_id):
+        xml = self._get_customer_payment_profile_xml(customer_id, card_id)
+        profile = self._handle_customer_not_found(self._post(xml))
+        set_cached(self, 'payment_profile', self._payment_profile_key(customer_id, card_id), profile)
+        return profile
+
+    @metered
+    def settle(self, transaction, amount):
+        xml = self._settle_xml(transaction, amount)
+        return self._handle_settle(self._post(xml), transaction)
+
+    @metered
+    def delete_card(self, card):
+        xml = self._delete_card_xml(card)
         try:
-            self.check_for_error(resp)
-        except GatewayException as e:
-            error_code = e.args[0][0][0]
-            if error_code == 'E00040':  # NotFound
-                raise CustomerNotFoundError(e)
-            raise
+            return self._handle_ok(self._post(xml))
+        finally:
+            self._invalidate_customer(card.customer_id, card.card_id)
 
+    ##|
+    ##|  CUSTOMER CACHE
+    ##|
+    # retrieve_customer is called behind the scenes by charge_customer and
+    # update_customer, so its responses are cached (if the gateway has a
+    # cache) until the customer or one of its cards changes.
+    def _cached_customer(self, customer_id):
+        cached = get_cached(self, 'customer', customer_id)
+        if cached is None:
+            return None
+        return cached['customer'], cached['cards']
+
+    def _cache_customer(self, customer_id, resp):
+        customer, cards = resp
+        set_cached(self, 'customer', customer_id, {'customer': customer, 'cards': cards})
         return resp
 
+    def _payment_profile_key(self, customer_id, card_id):
+        return '%s/%s' % (customer_id, card_id)
+
+    def _invalidate_customer(self, customer_id, card_id=None):
+        invalidate(self, 'customer', customer_id)
+        if card_id is not None:
+            invalidate(self, 'payment_profile', self._payment_profile_key(customer_id, card_id))
+
+    ##|
+    ##|  STREAMING OPERATIONS
+    ##|
+    @metered
+    def iter_customer_cards(self, customer_id):
+        """
+        Yields the cards (payment profiles) of a customer one at a time,
+        parsing the response as it arrives, for customers with too many cards
+        to comfortably retrieve_customer.
+        """
+        xml = self._retrieve_customer_xml(customer_id)
+        for elem in self._stream(xml, ('messages', 'paymentProfiles')):
+            if get_tag(elem) == 'messages':
+                self._handle_customer_not_found({'messages': _decode_messages(elem)})
+            else:
+                card = self._dict_to_payment_profile(_decode_payment_profile(elem))
+                card['customer_id'] = customer_id
+                yield card
+
+    @metered
+    def iter_batch_transactions(self, batch_id):
+        """
+        Yields the transactions in a settlement batch one at a time, parsing
+        the response as it arrives.
+        """
+        xml = self._transaction_list_xml(batch_id)
+        for elem in self._stream(xml, ('messages', 'transaction')):
+            if get_tag(elem) == 'messages':
+                self.check_for_error({'messages': _decode_messages(elem)})
+            else:
+                resp = _leaves(elem)
+                yield self._resp_to_transaction_dict(resp, resp.get('settleAmount'))
+
+    ##|
+    ##|  RESPONSE MAPPERS
+    ##|
     def _dict_to_customer(self, resp):
         ret = {
                 'customer_id': resp['customerProfileId'],
@@ -923,25 +1671,3 @@ class AuthorizeNet(Gateway):
             pass
 
         return ret
-
-    def settle(self, transaction, amount):
-        xml = self.build_xml('createTransactionRequest', OrderedDict([
-            ('transactionRequest', OrderedDict([
-                ('transactionType', 'priorAuthCaptureTransaction'),
-                ('amount', amount),
-                ('refTransId', transaction.transaction_id),
-                ])),
-            ]))
-
-        resp = xml_to_dict(xml_post(self.url, xml))
-        transaction.auth_code = resp['transactionResponse']['authCode']
-        return transaction
-
-    def delete_card(self, card):
-        xml = self.build_xml('deleteCustomerPaymentProfileRequest', OrderedDict([
-            ('customerProfileId', card.customer_id),
-            ('customerPaymentProfileId', card.card_id),
-            ]))
-
-        resp = xml_to_dict(xml_post(self.url, xml))
-        self.check_for_error(resp)
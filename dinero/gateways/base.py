@@ -1,11 +1,32 @@
+import sys
+
+from dinero.exceptions import DineroException
+
+
 class Gateway(object):
     """
     Implemented payment gateways should implement this interface.
     """
 
+    # set by dinero.configure, see dinero.cache
+    cache = None
+    # set by dinero.configure, see dinero.identity
+    identity_map = None
+    # set by dinero.configure, see dinero.singleflight
+    single_flight = None
+    # the account, so that the cached responses of gateways configured for
+    # different accounts don't mix, see dinero.cache
+    cache_namespace = None
+
     def charge(self, price, options):
         raise NotImplementedError
 
+    def warmup(self):
+        """
+        Does any expensive setup ahead of the first request.
+        """
+        pass
+
     def void(self, transaction):
         raise NotImplementedError
 
@@ -26,3 +47,33 @@ class Gateway(object):
 
     def settle(self, transaction, amount):
         raise NotImplementedError
+
+    def is_settled(self, transaction):
+        """
+        Whether ``transaction`` has settled, going by what is known about it
+        locally: True, False, or None if it can't be told.
+        """
+        return None
+
+    def iter_customer_cards(self, customer_id):
+        raise NotImplementedError
+
+    def iter_batch_transactions(self, batch_id):
+        raise NotImplementedError
+
+    _aio = None
+
+    @property
+    def aio(self):
+        """
+        Coroutine versions of the gateway operations.  Unless the gateway
+        does better, an :class:`dinero.gateways.aio.AsyncGateway` that runs
+        the blocking ones in threads.
+        """
+        if self._aio is None:
+            if sys.version_info < (3, 5):
+                raise DineroException('The asyncio API of {0} requires Python 3.5 or newer'.format(
+                    type(self).__name__))
+            from dinero.gateways.aio import AsyncGateway
+            self._aio = AsyncGateway(self)
+        return self._aio
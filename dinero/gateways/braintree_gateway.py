@@ -1,4 +1,6 @@
 import re
+import threading
+
 import braintree
 from braintree.exceptions import (
     NotFoundError,
@@ -7,6 +9,7 @@ from braintree.exceptions import (
 
 from dinero.exceptions import *
 from dinero.gateways.base import Gateway
+from dinero.metrics import metered
 
 
 # CVV RESPONSES
@@ -279,32 +282,74 @@ def check_for_errors(result):
 
 
 class Braintree(Gateway):
+    """
+    Each instance talks to Braintree through its own
+    :class:`braintree.BraintreeGateway`, so several merchant accounts can be
+    configured (and used from several threads) at once.
+    """
+
+    environments = {
+            'test': braintree.Environment.Sandbox,
+            'sandbox': braintree.Environment.Sandbox,
+            'live': braintree.Environment.Production,
+            'production': braintree.Environment.Production,
+            }
+
     def __init__(self, options):
-        environment = braintree.Environment.Sandbox  # TODO: autodetect live vs. test
+        self.merchant_id = options['merchant_id']
+        self.public_key = options['public_key']
+        self.private_key = options['private_key']
+        self._lock = threading.Lock()
+        self._braintree = None
+
+        environment = options.get('environment')
+        if environment is not None:
+            try:
+                self._braintree = self._build_gateway(self.environments[environment])
+            except KeyError:
+                raise DineroException('Unknown Braintree environment: {0!r}'.format(environment))
 
-        braintree.Configuration.configure(
-                environment,
-                options['merchant_id'],
-                options['public_key'],
-                options['private_key'],
-                )
+    @property
+    def cache_namespace(self):
+        return self.merchant_id
 
+    def _build_gateway(self, environment):
+        return braintree.BraintreeGateway(braintree.Configuration(
+                environment,
+                self.merchant_id,
+                self.public_key,
+                self.private_key,
+                ))
+
+    @property
+    def braintree(self):
+        """
+        The :class:`braintree.BraintreeGateway` for this account.  Unless an
+        ``environment`` was configured, the first access works out whether
+        this is a sandbox or a production account.
+        """
+        if self._braintree is None:
+            with self._lock:
+                if self._braintree is None:
+                    self._braintree = self._discover_gateway()
+        return self._braintree
+
+    def _discover_gateway(self):
         # Auto-discover if this is a real account or a developer account.  Tries
         # to access both end points and see which one works.
+        gateway = self._build_gateway(braintree.Environment.Sandbox)
         try:
-            self.retrieve('0')
+            gateway.transaction.find('0')
         except BraintreeAuthenticationError:
-            environment = braintree.Environment.Production  # TODO: autodetect live vs. test
-
-            braintree.Configuration.configure(
-                    environment,
-                    options['merchant_id'],
-                    options['public_key'],
-                    options['private_key'],
-                    )
-        except PaymentException:
+            return self._build_gateway(braintree.Environment.Production)
+        except NotFoundError:
             pass
+        return gateway
+
+    def warmup(self):
+        return self.braintree
 
+    @metered
     def charge(self, price, options):
         amount, price = _convert_amount(price)
 
@@ -359,7 +404,7 @@ class Braintree(Gateway):
             if customer:
                 submit['customer'] = customer
 
-        result = braintree.Transaction.sale(submit)
+        result = self.braintree.transaction.sale(submit)
 
         check_for_transaction_errors(result)
         return self._transaction_to_transaction_dict(result.transaction)
@@ -397,52 +442,56 @@ class Braintree(Gateway):
 
         return ret
 
+    @metered
     def void(self, transaction):
         try:
-            result = braintree.Transaction.void(transaction.transaction_id)
+            result = self.braintree.transaction.void(transaction.transaction_id)
         except NotFoundError as e:
             raise PaymentException([InvalidTransactionError(e)])
 
         check_for_transaction_errors(result)
         return True
 
+    @metered
     def refund(self, transaction, price):
         amount, price = _convert_amount(price)
 
         try:
-            result = braintree.Transaction.refund(transaction.transaction_id, amount)
+            result = self.braintree.transaction.refund(transaction.transaction_id, amount)
         except NotFoundError as e:
             raise PaymentException([InvalidTransactionError(e)])
 
         check_for_transaction_errors(result)
         return True
 
+    @metered
     def retrieve(self, transaction_id):
         try:
-            result = braintree.Transaction.find(transaction_id)
+            result = self.braintree.transaction.find(transaction_id)
         except NotFoundError as e:
             raise PaymentException([InvalidTransactionError(e)])
 
         return self._transaction_to_transaction_dict(result)
 
+    @metered
     def create_customer(self, options):
         customer, address, credit_card = self._create_all_from_dict(options)
         try:
-            result = braintree.Customer.create(customer)
+            result = self.braintree.customer.create(customer)
             check_for_errors(result)
             if address:
                 address['customer_id'] = result.customer.id
-                address_result = braintree.Address.create(address)
+                address_result = self.braintree.address.create(address)
                 if not address_result.is_success:
-                    result.braintree.Customer.delete(result.customer.id)
+                    self.braintree.customer.delete(result.customer.id)
                     check_for_errors(address_result)
                 result.customer.addresses = [address_result.address]
 
             if credit_card:
                 credit_card['customer_id'] = result.customer.id
-                credit_card_result = braintree.CreditCard.create(credit_card)
+                credit_card_result = self.braintree.credit_card.create(credit_card)
                 if not credit_card_result.is_success:
-                    result.braintree.Customer.delete(result.customer.id)
+                    self.braintree.customer.delete(result.customer.id)
                     check_for_errors(credit_card_result)
                 result.customer.credit_cards = [credit_card_result.credit_card]
 
@@ -455,23 +504,26 @@ class Braintree(Gateway):
 
         return profile
 
+    @metered
     def retrieve_customer(self, customer_id):
         try:
-            customer_result = braintree.Customer.find(str(customer_id))
+            customer_result = self.braintree.customer.find(str(customer_id))
         except NotFoundError as e:
             raise CustomerNotFoundError(e)
 
         return self._customer_from_customer_result(customer_result)
 
+    @metered
     def delete_customer(self, customer_id):
         try:
-            result = braintree.Customer.delete(str(customer_id))
+            result = self.braintree.customer.delete(str(customer_id))
         except NotFoundError as e:
             raise CustomerNotFoundError(e)
 
         check_for_errors(result)
         return True
 
+    @metered
     def update_customer(self, customer_id, options):
         customer, address, credit_card = self._create_all_from_dict(options)
 
@@ -480,28 +532,28 @@ class Braintree(Gateway):
         try:
             credit_card_token = options['credit_card_token']
         except KeyError:
-            customer_result = braintree.Customer.find(customer_id)
+            customer_result = self.braintree.customer.find(customer_id)
             if customer_result.credit_cards:
                 credit_card_token = customer_result.credit_cards[0].token
 
         try:
             address_id = options['address_id']
         except KeyError:
-            customer_result = braintree.Customer.find(customer_id)
+            customer_result = self.braintree.customer.find(customer_id)
             if customer_result.addresses:
                 address_id = customer_result.addresses[0].id
 
         try:
             if customer:
-                customer_result = braintree.Customer.update(customer_id, customer)
+                customer_result = self.braintree.customer.update(customer_id, customer)
                 check_for_errors(customer_result)
 
             if address and address_id:
-                address_result = braintree.Address.update(customer_id, address_id, address)
+                address_result = self.braintree.address.update(customer_id, address_id, address)
                 check_for_errors(address_result)
 
             if credit_card and credit_card_token:
-                credit_card_result = braintree.CreditCard.update(credit_card_token, credit_card)
+                credit_card_result = self.braintree.credit_card.update(credit_card_token, credit_card)
                 check_for_errors(credit_card_result)
         except NotFoundError as e:
             raise CustomerNotFoundError(e)
@@ -0,0 +1,663 @@
+"""
+A gateway that keeps everything in memory, for development and load
+testing.  It answers like :class:`dinero.gateways.AuthorizeNet`, but its
+latency, decline rate and errors are whatever it is configured with::
+
+    dinero.configure({
+        'fake': {
+            'type': 'dinero.gateways.Fake',
+            'default': True,
+            # seconds; a number, or a dict describing a distribution
+            'latency': {'distribution': 'lognormal', 'median': 0.3, 'sigma': 0.4},
+            # the fraction of charges that raise each error
+            'errors': {
+                'CardDeclinedError': 0.05,
+                'CVVError': 0.01,
+                'GatewayTimeout': 0.001,
+            },
+            'seed': 1234,
+        }
+    })
+
+The errors can be any of the :class:`dinero.exceptions.PaymentError`
+classes, which are raised in a :class:`dinero.exceptions.PaymentException`
+by charges, or ``GatewayException`` and ``GatewayTimeout``, which any
+operation can raise.  ``decline_rate`` is a shortcut for
+``CardDeclinedError``.  Whatever the configuration, these card numbers
+always fail:
+
+====================  =====================
+``4000000000000002``  ``CardDeclinedError``
+``4000000000000069``  ``ExpiryError``
+``4000000000000127``  ``CVVError``
+====================  =====================
+
+Captured transactions stay ``capturedPendingSettlement`` until
+``settlement_delay`` seconds have passed, if it is set, or until
+:meth:`Fake.settle_batch` is called.  Each call to ``settle_batch`` makes a
+settlement batch of the transactions it settled, which
+:meth:`dinero.Transaction.iter_batch` lists.
+"""
+import collections
+import itertools
+import math
+import random
+import threading
+import time
+from decimal import Decimal
+
+import six
+
+from dinero import exceptions
+from dinero.exceptions import (
+        CustomerNotFoundError,
+        DineroException,
+        DuplicateCustomerError,
+        GatewayException,
+        GatewayTimeout,
+        PaymentException,
+        )
+from dinero.gateways.base import Gateway
+from dinero.metrics import metered
+from dinero.timeouts import now, request_timeout
+
+# the error messages Authorize.net uses
+ERROR_MESSAGES = {
+    'CardDeclinedError': 'This transaction has been declined.',
+    'ExpiryError': 'The credit card has expired.',
+    'InvalidCardError': 'The credit card number is invalid.',
+    'InvalidAmountError': 'A valid amount is required.',
+    'AVSError': 'The transaction has been declined because of an AVS mismatch.',
+    'CVVError': 'This transaction has been declined because the card code does not match.',
+    'DuplicateTransactionError': 'A duplicate transaction has been submitted.',
+    'RefundError': 'The referenced transaction does not meet the criteria for issuing a credit.',
+    'InvalidTransactionError': 'The transaction cannot be found.',
+    'GatewayException': 'An error occurred during processing. Please try again.',
+    'GatewayTimeout': 'Timed out',
+    }
+
+# errors that any operation can raise, not just charges
+GATEWAY_ERRORS = frozenset(['GatewayException', 'GatewayTimeout'])
+
+TEST_NUMBERS = {
+    '4000000000000002': 'CardDeclinedError',
+    '4000000000000069': 'ExpiryError',
+    '4000000000000127': 'CVVError',
+    }
+
+CARD_TYPES = {
+    '3': 'AmericanExpress',
+    '4': 'Visa',
+    '5': 'MasterCard',
+    '6': 'Discover',
+    }
+
+BILLTO_FIELDS = ['first_name', 'last_name', 'company', 'address', 'city', 'state', 'zip', 'country', 'phone', 'fax']
+CUSTOMER_FIELDS = ['email'] + BILLTO_FIELDS
+
+
+def latency_from_options(latency):
+    """
+    Turns the ``latency`` option into a function that takes a
+    :class:`random.Random` and returns a number of seconds, or None for no
+    latency.  ``latency`` is a number of seconds, a function like the one
+    returned, or a dict with a ``distribution`` and its parameters:
+
+    ``constant``: ``seconds``
+    ``uniform``: ``min``, ``max``
+    ``normal``: ``mean``, ``stddev`` (never below 0)
+    ``lognormal``: ``median``, ``sigma``
+    ``exponential``: ``mean``
+    """
+    if not latency:
+        return None
+    if callable(latency):
+        return latency
+    if isinstance(latency, (int, float)):
+        return lambda rng: latency
+
+    latency = dict(latency)
+    distribution = latency.pop('distribution', 'constant')
+    try:
+        if distribution == 'constant':
+            seconds = latency['seconds']
+            return lambda rng: seconds
+        if distribution == 'uniform':
+            low, high = latency['min'], latency['max']
+            return lambda rng: rng.uniform(low, high)
+        if distribution == 'normal':
+            mean, stddev = latency['mean'], latency['stddev']
+            return lambda rng: max(0, rng.gauss(mean, stddev))
+        if distribution == 'lognormal':
+            mu, sigma = math.log(latency['median']), latency['sigma']
+            return lambda rng: rng.lognormvariate(mu, sigma)
+        if distribution == 'exponential':
+            rate = 1.0 / latency['mean']
+            return lambda rng: rng.expovariate(rate)
+    except KeyError as e:
+        raise DineroException('The {0} latency distribution needs {1}'.format(distribution, e))
+    raise DineroException('Unknown latency distribution: {0!r}'.format(distribution))
+
+
+def _outcome_table(errors):
+    """
+    The (cumulative probability, error name) pairs that one random number
+    is looked up in.
+    """
+    table = []
+    total = 0
+    for name, rate in sorted(errors.items()):
+        if name not in ERROR_MESSAGES:
+            raise DineroException('Unknown error for the fake gateway: {0!r}'.format(name))
+        if rate:
+            total += rate
+            table.append((total, name))
+    if total > 1:
+        raise DineroException('The error rates add up to more than 1')
+    return table
+
+
+def _raise(name):
+    message = ERROR_MESSAGES[name]
+    if name == 'GatewayTimeout':
+        raise GatewayTimeout(message)
+    if name == 'GatewayException':
+        raise GatewayException([('E00001', message)])
+    raise PaymentException([getattr(exceptions, name)(message)])
+
+
+def _amount(price):
+    return Decimal(str(price))
+
+
+def _mask(number):
+    return 'XXXX' + number[-4:]
+
+
+class _Transaction(object):
+    """
+    What the fake gateway knows about a transaction.
+    """
+    __slots__ = ('transaction_id', 'price', 'status', 'captured', 'refunded', 'account_number', 'card_type',
+                 'auth_code', 'customer_id', 'email')
+
+    def current_status(self, settlement_delay):
+        status = self.status
+        if (status == 'capturedPendingSettlement' and settlement_delay is not None
+                and now() - self.captured >= settlement_delay):
+            return 'settledSuccessfully'
+        return status
+
+    def to_dict(self, settlement_delay):
+        status = self.current_status(settlement_delay)
+        ret = {
+            'price': self.price,
+            'transaction_id': self.transaction_id,
+            'avs_successful': True,
+            'cvv_successful': True,
+            'avs_zip_successful': True,
+            'avs_address_successful': True,
+            'auth_code': self.auth_code,
+            'status': status,
+            'account_number': self.account_number,
+            'card_type': self.card_type,
+            'last_4': self.account_number[-4:],
+            'messages': [('1', 'This transaction has been approved.')],
+            }
+        if self.customer_id is not None:
+            ret['customer_id'] = self.customer_id
+        if self.email is not None:
+            ret['email'] = self.email
+        return ret
+
+
+class Fake(Gateway):
+    """
+    An in-memory gateway.  It is thread-safe; the only lock is held while
+    the gateway's state is read or changed, not during the latency.
+    ``max_transactions`` limits how many transactions are remembered (the
+    oldest ones are forgotten first), to bound its memory in long load
+    tests.
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.timeout = options.get('timeout')
+        self.seed = options.get('seed')
+        self.settlement_delay = options.get('settlement_delay')
+        self.max_transactions = options.get('max_transactions')
+        self._latency = latency_from_options(options.get('latency'))
+
+        errors = dict(options.get('errors', {}))
+        if options.get('decline_rate'):
+            errors['CardDeclinedError'] = errors.get('CardDeclinedError', 0) + options['decline_rate']
+        self._charge_outcomes = _outcome_table(errors)
+        self._outcomes = _outcome_table(dict((name, rate) for name, rate in errors.items() if name in GATEWAY_ERRORS))
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._streams = itertools.count()
+        self._ids = itertools.count(2200000001)
+        self._customer_ids = itertools.count(10000001)
+        self._batch_ids = itertools.count(1)
+        self._card_ids = itertools.count(20000001)
+        self._transactions = {}
+        self._order = collections.deque()
+        self._customers = {}
+        # transaction ids by batch id
+        self._batches = {}
+        # customer ids by email, for the duplicate check
+        self._emails = {}
+        self._aio = None
+
+    ##|
+    ##|  BEHAVIOR
+    ##|
+    def _random(self):
+        try:
+            return self._local.random
+        except AttributeError:
+            # one generator per thread, so that they don't contend; with a
+            # seed, each thread's sequence is still reproducible
+            stream = next(self._streams)
+            seed = None if self.seed is None else self.seed * 1000003 + stream
+            rng = self._local.random = random.Random(seed)
+            return rng
+
+    def _delay(self):
+        """
+        The latency of the next request, or None.
+        """
+        if self._latency is None:
+            return None
+        return self._latency(self._random())
+
+    def _wait(self, seconds):
+        if seconds is None:
+            return
+        timeout = request_timeout(self.timeout)
+        if timeout is not None and seconds > timeout:
+            time.sleep(timeout)
+            raise GatewayTimeout('Timed out after %s seconds' % (timeout,))
+        time.sleep(seconds)
+
+    def _roll(self, table):
+        if table:
+            value = self._random().random()
+            for threshold, name in table:
+                if value < threshold:
+                    _raise(name)
+
+    def _request(self, charge=False):
+        """
+        Stands in for a round trip: waits out the latency, then maybe fails.
+        """
+        self._wait(self._delay())
+        self._roll(self._charge_outcomes if charge else self._outcomes)
+
+    ##|
+    ##|  STATE
+    ##|
+    def _next_id(self, ids):
+        # next() on an itertools.count is atomic
+        return str(next(ids))
+
+    def _get_transaction(self, transaction_id):
+        try:
+            return self._transactions[transaction_id]
+        except KeyError:
+            _raise('InvalidTransactionError')
+
+    def _add_transaction(self, price, account_number, card_type, settle, customer_id=None, email=None):
+        record = _Transaction()
+        record.price = price
+        record.status = 'capturedPendingSettlement' if settle else 'authorizedPendingCapture'
+        record.captured = now()
+        record.refunded = 0
+        record.account_number = account_number
+        record.card_type = card_type
+        record.auth_code = '%06X' % self._random().getrandbits(24)
+        record.customer_id = customer_id
+        record.email = email
+        record.transaction_id = self._next_id(self._ids)
+        with self._lock:
+            self._transactions[record.transaction_id] = record
+            if self.max_transactions is not None:
+                self._order.append(record.transaction_id)
+                while len(self._order) > self.max_transactions:
+                    self._transactions.pop(self._order.popleft(), None)
+        return record.to_dict(self.settlement_delay)
+
+    def _charge(self, price, options):
+        if 'customer' in options:
+            return self._charge_customer(options['customer'], price, options)
+        if 'cc' in options:
+            return self._charge_card(options['cc'], price, options)
+
+        number = str(options.get('number', ''))
+        if number in TEST_NUMBERS:
+            _raise(TEST_NUMBERS[number])
+        if not number.isdigit() or not 13 <= len(number) <= 19:
+            _raise('InvalidCardError')
+        return self._add_transaction(price, _mask(number), CARD_TYPES.get(number[0], 'Other'),
+                                     options.get('settle', True),
+                                     options.get('customer_id'), options.get('email'))
+
+    def _charge_customer(self, customer, price, options):
+        customer_id = customer.customer_id
+        try:
+            card_id = customer.card_id
+        except AttributeError:
+            card_id = None
+        return self._charge_stored_card(customer_id, card_id, price, options)
+
+    def _charge_card(self, card, price, options):
+        return self._charge_stored_card(card.customer_id, card.card_id, price, options)
+
+    def _charge_stored_card(self, customer_id, card_id, price, options):
+        with self._lock:
+            customer, cards = self._get_customer(customer_id)
+            if card_id is None:
+                card_id = customer.get('card_id')
+            try:
+                card = cards[card_id]
+            except KeyError:
+                raise CustomerNotFoundError('The record cannot be found.')
+            account_number, card_type, email = card['number'], card['card_type'], customer.get('email')
+        return self._add_transaction(price, account_number, card_type, options.get('settle', True),
+                                     customer_id, email)
+
+    def _retrieve(self, transaction_id):
+        with self._lock:
+            return self._get_transaction(transaction_id).to_dict(self.settlement_delay)
+
+    def _void(self, transaction):
+        with self._lock:
+            record = self._get_transaction(transaction.transaction_id)
+            if record.current_status(self.settlement_delay) not in ('authorizedPendingCapture',
+                                                                    'capturedPendingSettlement'):
+                _raise('RefundError')
+            record.status = 'voided'
+        return True
+
+    def _refund(self, transaction, amount):
+        with self._lock:
+            record = self._get_transaction(transaction.transaction_id)
+            if record.current_status(self.settlement_delay) != 'settledSuccessfully':
+                _raise('RefundError')
+            amount = _amount(amount)
+            if record.refunded + amount > _amount(record.price):
+                _raise('RefundError')
+            record.refunded += amount
+        return True
+
+    def _settle(self, transaction, amount):
+        with self._lock:
+            record = self._get_transaction(transaction.transaction_id)
+            if record.status != 'authorizedPendingCapture' or _amount(amount) > _amount(record.price):
+                _raise('InvalidTransactionError')
+            record.price = amount
+            record.status = 'capturedPendingSettlement'
+            record.captured = now()
+            auth_code = record.auth_code
+        transaction.auth_code = auth_code
+        return transaction
+
+    def settle_batch(self):
+        """
+        Settles every captured transaction, like the gateway's daily batch,
+        and returns the batch id.
+        """
+        batch_id = self._next_id(self._batch_ids)
+        with self._lock:
+            settled = []
+            for record in six.itervalues(self._transactions):
+                # including the ones settlement_delay has already settled
+                if record.status == 'capturedPendingSettlement':
+                    record.status = 'settledSuccessfully'
+                    settled.append(record.transaction_id)
+            self._batches[batch_id] = settled
+        return batch_id
+
+    def is_settled(self, transaction):
+        status = transaction.data.get('status')
+        if status == 'settledSuccessfully':
+            return True
+        if status in ('authorizedPendingCapture', 'capturedPendingSettlement'):
+            return False
+        return None
+
+    def _get_customer(self, customer_id):
+        try:
+            return self._customers[str(customer_id)]
+        except KeyError:
+            raise CustomerNotFoundError('The record cannot be found.')
+
+    def _check_email(self, email, customer_id=None):
+        existing = self._emails.get(email)
+        if existing is not None and existing != customer_id:
+            raise DuplicateCustomerError('A duplicate record with ID {0} already exists.'.format(existing),
+                                         customer_id=existing)
+
+    def _new_card(self, customer_id, options):
+        number = str(options['number'])
+        card = dict((field, options[field]) for field in BILLTO_FIELDS if field in options)
+        card.update({
+            'customer_id': customer_id,
+            'card_id': self._next_id(self._card_ids),
+            'number': _mask(number),
+            'last_4': number[-4:],
+            'card_type': CARD_TYPES.get(number[0], 'Other'),
+            'expiration_date': 'XXXX',
+            'year': 'XXXX',
+            'month': 'XX',
+            })
+        return card
+
+    def _create_customer(self, options):
+        email = options.get('email')
+        customer_id = self._next_id(self._customer_ids)
+        card = self._new_card(customer_id, options) if 'number' in options else None
+
+        customer = dict((field, options[field]) for field in CUSTOMER_FIELDS if field in options)
+        customer['customer_id'] = customer_id
+        cards = collections.OrderedDict()
+        if card is not None:
+            customer['card_id'] = card['card_id']
+            cards[card['card_id']] = card
+        with self._lock:
+            if email is not None:
+                self._check_email(email)
+                self._emails[email] = customer_id
+            self._customers[customer_id] = (customer, cards)
+
+        profile = dict(options)
+        profile['customer_id'] = customer_id
+        profile['card_id'] = card and card['card_id']
+        return profile
+
+    def _retrieve_customer(self, customer_id):
+        with self._lock:
+            customer, cards = self._get_customer(customer_id)
+            cards = [dict(card) for card in six.itervalues(cards)]
+            customer = dict(customer)
+        if cards:
+            # like AuthorizeNet, the customer carries its first card's fields
+            first = dict(cards[0])
+            del first['customer_id']
+            first.update(customer)
+            customer = first
+        return customer, cards
+
+    def _update_customer(self, customer_id, options):
+        with self._lock:
+            customer, cards = self._get_customer(customer_id)
+            if 'email' in options:
+                email = options['email']
+                if email is not None:
+                    self._check_email(email, customer['customer_id'])
+                self._emails.pop(customer.get('email'), None)
+                if email is not None:
+                    self._emails[email] = customer['customer_id']
+            customer.update((field, options[field]) for field in CUSTOMER_FIELDS if field in options)
+            if any(field in options for field in BILLTO_FIELDS) or 'number' in options:
+                card_id = options.get('card_id', customer.get('card_id'))
+                if card_id in cards:
+                    card = cards[card_id]
+                    card.update((field, options[field]) for field in BILLTO_FIELDS if field in options)
+                    if 'number' in options and not str(options['number']).startswith('X'):
+                        new = self._new_card(customer_id, options)
+                        new['card_id'] = card_id
+                        card.update(new)
+                elif 'number' in options:
+                    card = self._new_card(customer_id, options)
+                    cards[card['card_id']] = card
+                    customer['card_id'] = card['card_id']
+        return True
+
+    def _delete_customer(self, customer_id):
+        with self._lock:
+            customer, cards = self._get_customer(customer_id)
+            del self._customers[str(customer_id)]
+            self._emails.pop(customer.get('email'), None)
+        return True
+
+    def _add_card_to_customer(self, customer, options):
+        card = self._new_card(customer.customer_id, options)
+        with self._lock:
+            stored, cards = self._get_customer(customer.customer_id)
+            cards[card['card_id']] = card
+            stored.setdefault('card_id', card['card_id'])
+        return dict(card)
+
+    def _update_card(self, card):
+        with self._lock:
+            stored, cards = self._get_customer(card.customer_id)
+            try:
+                stored_card = cards[card.card_id]
+            except KeyError:
+                raise CustomerNotFoundError('The record cannot be found.')
+            data = card.data
+            stored_card.update((field, data[field]) for field in BILLTO_FIELDS if field in data)
+        return True
+
+    def _delete_card(self, card):
+        with self._lock:
+            stored, cards = self._get_customer(card.customer_id)
+            try:
+                del cards[card.card_id]
+            except KeyError:
+                raise CustomerNotFoundError('The record cannot be found.')
+            if stored.get('card_id') == card.card_id:
+                stored.pop('card_id')
+                if cards:
+                    stored['card_id'] = next(iter(cards))
+        return True
+
+    def _iter_customer_cards(self, customer_id):
+        customer, cards = self._retrieve_customer(customer_id)
+        return iter(cards)
+
+    def _iter_batch_transactions(self, batch_id):
+        with self._lock:
+            records = [self._transactions.get(transaction_id)
+                       for transaction_id in self._batches.get(str(batch_id), [])]
+            # max_transactions may have dropped some
+            transactions = [record.to_dict(self.settlement_delay) for record in records if record is not None]
+        return iter(transactions)
+
+    ##|
+    ##|  OPERATIONS
+    ##|
+    @metered
+    def charge(self, price, options):
+        self._request(charge=True)
+        return self._charge(price, options)
+
+    @metered
+    def charge_customer(self, customer, price, options):
+        self._request(charge=True)
+        return self._charge_customer(customer, price, options)
+
+    @metered
+    def charge_card(self, card, price, options):
+        self._request(charge=True)
+        return self._charge_card(card, price, options)
+
+    @metered
+    def retrieve(self, transaction_id):
+        self._request()
+        return self._retrieve(transaction_id)
+
+    @metered
+    def void(self, transaction):
+        self._request()
+        return self._void(transaction)
+
+    @metered
+    def refund(self, transaction, amount):
+        self._request()
+        return self._refund(transaction, amount)
+
+    @metered
+    def settle(self, transaction, amount):
+        self._request()
+        return self._settle(transaction, amount)
+
+    @metered
+    def create_customer(self, options):
+        self._request()
+        return self._create_customer(options)
+
+    @metered
+    def retrieve_customer(self, customer_id):
+        self._request()
+        return self._retrieve_customer(customer_id)
+
+    @metered
+    def update_customer(self, customer_id, options):
+        self._request()
+        return self._update_customer(customer_id, options)
+
+    @metered
+    def delete_customer(self, customer_id):
+        self._request()
+        return self._delete_customer(customer_id)
+
+    @metered
+    def add_card_to_customer(self, customer, options):
+        self._request()
+        return self._add_card_to_customer(customer, options)
+
+    @metered
+    def update_card(self, card):
+        self._request()
+        return self._update_card(card)
+
+    @metered
+    def delete_card(self, card):
+        self._request()
+        return self._delete_card(card)
+
+    @metered
+    def iter_customer_cards(self, customer_id):
+        self._request()
+        for card in self._iter_customer_cards(customer_id):
+            yield card
+
+    @metered
+    def iter_batch_transactions(self, batch_id):
+        self._request()
+        for transaction in self._iter_batch_transactions(batch_id):
+            yield transaction
+
+    @property
+    def aio(self):
+        """
+        A :class:`dinero.gateways.aio.AsyncFake`, which waits out the latency
+        with :func:`asyncio.sleep`.
+        """
+        if self._aio is None:
+            from dinero.gateways.aio import AsyncFake
+            self._aio = AsyncFake(self)
+        return self._aio
@@ -0,0 +1,159 @@
+"""
+Transports move serialized request bodies to a gateway endpoint and bring the
+raw response body back.  Gateways own a transport instance, so the HTTP
+behavior (connection pooling, recording, canned responses for tests) can be
+swapped without touching any request building or response parsing code.
+"""
+import six
+import threading
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+from dinero.exceptions import GatewayTimeout
+from dinero.timeouts import now, remaining
+
+
+DEFAULT_POOL_SIZE = 10
+
+# bytes per chunk when streaming a response
+STREAM_CHUNK_SIZE = 16384
+
+
+class Transport(object):
+    """
+    Implemented transports should implement this interface.
+    """
+
+    def post(self, url, data, headers, timeout=None):
+        """
+        POST ``data`` (bytes) to ``url`` and return the response body as
+        bytes.  If the gateway does not answer within ``timeout`` seconds,
+        raise :class:`dinero.exceptions.GatewayTimeout`.
+        """
+        raise NotImplementedError
+
+    def post_stream(self, url, data, headers, timeout=None, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Like :meth:`post`, but returns an iterable of chunks of the response
+        body, so that a large response never has to be in memory all at once.
+        """
+        return [self.post(url, data, headers, timeout)]
+
+    def close(self):
+        pass
+
+
+class RequestsTransport(Transport):
+    """
+    A keep-alive transport backed by a :class:`requests.Session`.  Connections
+    are pooled per host, so consecutive requests to the same endpoint reuse
+    the TCP and TLS session instead of handshaking every time.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, verify=True):
+        self.pool_size = pool_size
+        self.verify = verify
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def post(self, url, data, headers, timeout=None):
+        return b''.join(self.post_stream(url, data, headers, timeout))
+
+    def post_stream(self, url, data, headers, timeout=None, chunk_size=STREAM_CHUNK_SIZE):
+        # requests' timeout is per read, so a body that trickles in is
+        # checked against the whole request's time in _iter_content
+        expires = None if timeout is None else now() + timeout
+        try:
+            resp = self.session.post(
+                    url,
+                    data=data,
+                    headers=headers,
+                    verify=self.verify,
+                    timeout=timeout,
+                    stream=True,
+                    )
+        except requests.exceptions.Timeout as e:
+            raise GatewayTimeout('Timed out after %s seconds: %s' % (timeout, e))
+        return self._iter_content(resp, timeout, expires, chunk_size)
+
+    def _iter_content(self, resp, timeout, expires, chunk_size):
+        read1 = getattr(resp.raw, 'read1', None)
+        if read1 is None:
+            # urllib3 < 2 only returns a chunk once it is full
+            chunks = resp.iter_content(chunk_size)
+        else:
+            # whatever has arrived, so that a slow body is noticed
+            chunks = iter(lambda: read1(chunk_size, decode_content=True), b'')
+        try:
+            for chunk in chunks:
+                if expires is not None and now() > expires:
+                    raise GatewayTimeout('Timed out after %s seconds reading the response' % (timeout,))
+                # and the caller's deadline, if it is shorter
+                remaining()
+                yield chunk
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                urllib3.exceptions.ReadTimeoutError, urllib3.exceptions.ProtocolError) as e:
+            raise GatewayTimeout('Timed out after %s seconds: %s' % (timeout, e))
+        finally:
+            # return the connection to the pool
+            resp.close()
+
+    def close(self):
+        self.session.close()
+
+
+class MemoryTransport(Transport):
+    """
+    A transport that never touches the network.  ``responses`` is either a
+    callable, ``responses(url, data) -> bytes``, or a list of response bodies
+    that are handed out in order.  Every request is recorded in
+    ``self.requests`` as a ``(url, data)`` tuple.
+    """
+
+    def __init__(self, responses=None):
+        self.requests = []
+        self._lock = threading.Lock()
+        if callable(responses):
+            self.handler = responses
+            self.responses = None
+        else:
+            self.handler = None
+            self.responses = list(responses or [])
+
+    def queue(self, *responses):
+        with self._lock:
+            self.responses.extend(responses)
+
+    def post(self, url, data, headers, timeout=None):
+        with self._lock:
+            self.requests.append((url, data))
+            if self.handler is None:
+                try:
+                    return self.responses.pop(0)
+                except IndexError:
+                    raise AssertionError('MemoryTransport ran out of responses')
+        return self.handler(url, data)
+
+    def post_stream(self, url, data, headers, timeout=None, chunk_size=STREAM_CHUNK_SIZE):
+        content = self.post(url, data, headers, timeout)
+        return [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+
+
+def transport_from_options(options):
+    """
+    Builds the transport described by a gateway configuration dict.
+    ``options['transport']`` may be a :class:`Transport` instance or the
+    dotted path of a :class:`Transport` subclass; otherwise a pooled
+    :class:`RequestsTransport` sized by ``options['pool_size']`` is used.
+    """
+    transport = options.get('transport')
+    if transport is None:
+        return RequestsTransport(pool_size=options.get('pool_size', DEFAULT_POOL_SIZE))
+    if isinstance(transport, six.string_types):
+        from dinero.configure import fancy_import
+        return fancy_import(transport)()
+    return transport
@@ -0,0 +1,88 @@
+"""
+An identity map makes every retrieve of the same transaction or customer
+return the same live object, so a change made through one reference, like a
+refund, is seen by all of them.  It is off unless the gateway is configured
+with one::
+
+    dinero.configure({
+        'foo': {
+            'type': 'dinero.gateways.AuthorizeNet',
+            # ...
+            'identity_map': True,
+        },
+    })
+
+Objects are only held weakly; once nothing else references one, it is
+forgotten.
+"""
+import threading
+import weakref
+
+
+class IdentityMap(object):
+    """
+    The live objects of one gateway, by kind (``'transaction'`` or
+    ``'customer'``) and id.
+    """
+
+    def __init__(self):
+        self._objects = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def get(self, kind, key):
+        return self._objects.get((kind, key))
+
+    def merge(self, kind, key, obj):
+        """
+        Returns the live object for ``key``, updated with the fields of
+        ``obj``, a copy that was just built from a gateway response.  If there
+        isn't one, ``obj`` becomes the live object.
+        """
+        with self._lock:
+            live = self._objects.get((kind, key))
+            if live is None:
+                self._objects[(kind, key)] = obj
+                return obj
+            live._update_from(obj)
+            return live
+
+    def discard(self, kind, key):
+        with self._lock:
+            self._objects.pop((kind, key), None)
+
+    def clear(self):
+        with self._lock:
+            self._objects.clear()
+
+    def __len__(self):
+        return len(self._objects)
+
+
+def identity_map_from_options(options):
+    """
+    Builds the identity map described by ``options['identity_map']``: None
+    or ``False`` for none, ``True`` for an :class:`IdentityMap`, or an
+    instance.
+    """
+    identity_map = options.get('identity_map')
+    if identity_map is None or identity_map is False:
+        return None
+    if identity_map is True:
+        return IdentityMap()
+    return identity_map
+
+
+def identify(gateway, kind, key, obj):
+    """
+    ``obj``, or the live object with the same id if ``gateway`` has an
+    identity map.
+    """
+    identity_map = gateway.identity_map
+    if identity_map is None or key is None:
+        return obj
+    return identity_map.merge(kind, key, obj)
+
+
+def forget(gateway, kind, key):
+    if gateway.identity_map is not None:
+        gateway.identity_map.discard(kind, key)
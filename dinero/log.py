@@ -1,11 +1,38 @@
 import functools
+import inspect
 import logging
 import re
 import six
 import time
 
+try:
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:  # Python < 3.2
+    QueueHandler = QueueListener = None
+
+from six.moves import queue
+
 logger = logging.getLogger('dinero')
 
+# Python < 3.5 has no native coroutines
+iscoroutinefunction = getattr(inspect, 'iscoroutinefunction', lambda fn: False)
+
+CARD_NUMBER_RE = re.compile(r"\b([0-9])[0-9- ]{9,16}([0-9]{4})\b")
+CVV_RE = re.compile(r"""(\bcvv'?\s*[=:]\s*u?')[0-9]*'""")
+
+
+def scrub(message):
+    """
+    Masks anything that looks like a credit card number, and card codes
+    passed as ``cvv``.
+
+    >>> scrub('number=4111111111111111')
+    'number=4XXXXXXXXX1111'
+    >>> scrub("cvv='900'")
+    "cvv='XXX'"
+    """
+    return CVV_RE.sub(r"\1XXX'", CARD_NUMBER_RE.sub(r'\1XXXXXXXXX\2', message))
+
 
 def args_kwargs_to_call(args, kwargs):
     """
@@ -31,36 +58,137 @@ def args_kwargs_to_call(args, kwargs):
     return ''.join(ret)
 
 
-def log(fn):
+class CallMessage(object):
     """
-    Wraps fn in logging calls
+    The log message for a call.  The arguments are scrubbed as soon as it is
+    created, on the calling thread, so that neither the caller's card
+    numbers nor objects that it goes on to change end up in the record; the
+    message itself is only put together when a handler formats the record.
     """
-    @functools.wraps(fn)
-    def inner(*args, **kwargs):
-        start_time = time.time()
+    __slots__ = ('name', 'call', 'seconds', 'exception', '_message')
+
+    def __init__(self, fn, args, kwargs, seconds, exception=None):
+        self.name = fn.__name__
+        self.call = scrub(args_kwargs_to_call(args, kwargs))
+        self.seconds = seconds
+        self.exception = exception and scrub(repr(exception))
+        self._message = None
 
-        def logit(exception=None):
-            if exception:
-                exception_message = ' and raised %r' % exception
+    def __str__(self):
+        if self._message is None:
+            if self.exception:
+                exception_message = ' and raised %s' % self.exception
             else:
                 exception_message = ''
 
-            end_time = time.time()
-            message = '%s(%s) took %s seconds%s' % (
-                    fn.__name__,
-                    args_kwargs_to_call(args, kwargs),
-                    end_time - start_time,
+            self._message = '%s(%s) took %s seconds%s' % (
+                    self.name,
+                    self.call,
+                    self.seconds,
                     exception_message)
-            # remove any credit card numbers
-            message = re.sub(r"\b([0-9])[0-9- ]{9,16}([0-9]{4})\b", r'\1XXXXXXXXX\2', message)
-            logger.info(message)
+        return self._message
+
+
+def log_call(fn, args, kwargs, seconds, exception=None):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(CallMessage(fn, args, kwargs, seconds, exception))
+
+
+def log(fn):
+    """
+    Wraps fn in logging calls
+    """
+    if iscoroutinefunction(fn):
+        from dinero.aio import alog
+        return alog(fn)
+    if inspect.isgeneratorfunction(fn):
+        return _log_generator(fn)
+
+    @functools.wraps(fn)
+    def inner(*args, **kwargs):
+        start_time = time.time()
 
         try:
             value = fn(*args, **kwargs)
-            logit()
+            log_call(fn, args, kwargs, time.time() - start_time)
             return value
         except Exception as e:
-            logit(e)
+            log_call(fn, args, kwargs, time.time() - start_time, e)
             raise
 
     return inner
+
+
+def _log_generator(fn):
+    """
+    :func:`log` for generator functions.  The call is logged once the
+    generator is exhausted or closed, with the time spent in it.
+    """
+    @functools.wraps(fn)
+    def inner(*args, **kwargs):
+        iterator = fn(*args, **kwargs)
+        seconds = 0
+        error = None
+        try:
+            while True:
+                start_time = time.time()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    seconds += time.time() - start_time
+                yield item
+        finally:
+            iterator.close()
+            log_call(fn, args, kwargs, seconds, error)
+
+    return inner
+
+
+if QueueHandler is not None:
+    class DeferredQueueHandler(QueueHandler):
+        """
+        A :class:`logging.handlers.QueueHandler` that leaves formatting
+        dinero's call messages to the listener's handlers.  The stock one
+        formats each record before queueing it, on the thread that logged
+        it; that is still done for any other record, whose arguments could
+        change, or hold card numbers, by the time the listener gets to them.
+        """
+
+        def prepare(self, record):
+            if isinstance(record.msg, CallMessage) and not record.args:
+                return record
+            return QueueHandler.prepare(self, record)
+else:
+    DeferredQueueHandler = None
+
+
+def log_in_background(handlers=None):
+    """
+    Moves the formatting and output of dinero's log records to a background
+    thread.  Records are passed through a queue to ``handlers``, by default
+    the handlers of the ``dinero`` logger or, if it has none, of the root
+    logger.  Returns the :class:`logging.handlers.QueueListener`; call its
+    ``stop()`` method to flush the queue at exit.  Requires Python 3.2 or
+    newer.
+    """
+    if QueueHandler is None:
+        raise ImportError('log_in_background requires logging.handlers.QueueHandler (Python 3.2+)')
+
+    if handlers is None:
+        handlers = list(logger.handlers or logging.getLogger().handlers)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    records = queue.Queue()
+    logger.addHandler(DeferredQueueHandler(records))
+    logger.propagate = False
+    listener = QueueListener(records, *handlers)
+    # Python 3.5+, so that each handler's level still applies
+    listener.respect_handler_level = True
+    listener.start()
+    return listener
@@ -0,0 +1,441 @@
+"""
+Latency, traffic and error metrics for every gateway operation, by gateway
+name and operation (``charge``, ``refund``, ``retrieve_customer``, ...).
+They are kept in :data:`registry`, which can render them in the Prometheus
+text format::
+
+    from dinero.metrics import registry
+
+    def metrics_view(request):
+        return HttpResponse(registry.render_prometheus(),
+                            content_type='text/plain; version=0.0.4')
+
+To send each measurement somewhere else as well, add a sink, a callable that
+takes a :class:`Measurement`::
+
+    registry.add_sink(lambda m: statsd.timing('dinero.' + m.operation, m.seconds))
+
+Each measurement also breaks the operation's time down into phases:
+
+``serialize``
+    building and serializing the requests
+``network``
+    waiting for the gateway to respond
+``parse``
+    parsing the responses
+``map``
+    turning the responses into dinero's dicts and exceptions
+
+The time not in any phase is dinero's own overhead, like caching.  The
+phases of the operation that created or retrieved a
+:class:`dinero.Transaction` or :class:`dinero.Customer` are also kept in
+its ``timings``.
+"""
+import collections
+import contextlib
+import functools
+import inspect
+import threading
+
+from dinero.exceptions import PaymentException
+from dinero.log import iscoroutinefunction
+from dinero.timeouts import now
+
+try:
+    import contextvars
+except ImportError:  # Python < 3.7
+    contextvars = None
+
+
+# seconds; gateway calls are rarely faster than 50ms
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PHASES = ('serialize', 'network', 'parse', 'map')
+
+
+class Measurement(collections.namedtuple('Measurement',
+                                         'gateway operation seconds sent received exception phases')):
+    """
+    One gateway operation: how long it took, how many bytes were sent and
+    received, the exception it raised, if any, and the seconds spent in
+    each phase.
+    """
+    __slots__ = ()
+
+
+class Histogram(object):
+    """
+    A cumulative histogram, like Prometheus's.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Registry(object):
+    """
+    Collects a :class:`Measurement` for each operation and passes it on to
+    the sinks.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.sinks = []
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            # (gateway, operation) -> Histogram
+            self.latency = {}
+            # (gateway, operation) -> [sent, received]
+            self.traffic = {}
+            # (gateway, operation, exception class name) -> count
+            self.errors = {}
+            # (gateway, operation, phase) -> seconds
+            self.phases = {}
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        self.sinks.remove(sink)
+
+    def record(self, measurement):
+        key = (measurement.gateway, measurement.operation)
+        with self._lock:
+            try:
+                histogram = self.latency[key]
+            except KeyError:
+                histogram = self.latency[key] = Histogram(self.buckets)
+            histogram.observe(measurement.seconds)
+
+            traffic = self.traffic.setdefault(key, [0, 0])
+            traffic[0] += measurement.sent
+            traffic[1] += measurement.received
+
+            if measurement.exception is not None:
+                for name in error_names(measurement.exception):
+                    error = key + (name,)
+                    self.errors[error] = self.errors.get(error, 0) + 1
+
+            for name, seconds in measurement.phases.items():
+                phase = key + (name,)
+                self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+        for sink in self.sinks:
+            sink(measurement)
+
+    def render_prometheus(self):
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            latency = sorted((key, (list(h.counts), h.count, h.sum)) for key, h in self.latency.items())
+            traffic = sorted((key, tuple(value)) for key, value in self.traffic.items())
+            errors = sorted(self.errors.items())
+            phases = sorted(self.phases.items())
+
+        lines = [
+            '# HELP dinero_operation_seconds Time taken by gateway operations.',
+            '# TYPE dinero_operation_seconds histogram',
+            ]
+        for (gateway, operation), (counts, count, total) in latency:
+            labels = _labels(gateway=gateway, operation=operation)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append('dinero_operation_seconds_bucket{%s,le="%s"} %d' % (labels, _number(bound), bucket_count))
+            lines.append('dinero_operation_seconds_bucket{%s,le="+Inf"} %d' % (labels, count))
+            lines.append('dinero_operation_seconds_sum{%s} %s' % (labels, _number(total)))
+            lines.append('dinero_operation_seconds_count{%s} %d' % (labels, count))
+
+        for name, index, help_text in [
+                ('dinero_request_bytes_total', 0, 'Bytes sent to gateways.'),
+                ('dinero_response_bytes_total', 1, 'Bytes received from gateways.'),
+                ]:
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s counter' % name)
+            for (gateway, operation), value in traffic:
+                lines.append('%s{%s} %d' % (name, _labels(gateway=gateway, operation=operation), value[index]))
+
+        lines.append('# HELP dinero_errors_total Gateway operations that raised, by exception class.')
+        lines.append('# TYPE dinero_errors_total counter')
+        for (gateway, operation, exception), count in errors:
+            lines.append('dinero_errors_total{%s} %d' % (
+                _labels(gateway=gateway, operation=operation, exception=exception), count))
+
+        lines.append('# HELP dinero_phase_seconds_total Time spent in each phase of gateway operations.')
+        lines.append('# TYPE dinero_phase_seconds_total counter')
+        for (gateway, operation, phase), seconds in phases:
+            lines.append('dinero_phase_seconds_total{%s} %s' % (
+                _labels(gateway=gateway, operation=operation, phase=phase), _number(seconds)))
+        return '\n'.join(lines) + '\n'
+
+
+def error_names(exception):
+    """
+    The class names to count ``exception`` under.  A
+    :class:`dinero.exceptions.PaymentException` counts as each of the
+    errors it holds, like ``CardDeclinedError``.
+    """
+    errors = getattr(exception, 'errors', None)
+    if isinstance(exception, PaymentException) and errors:
+        return sorted(set(type(error).__name__ for error in errors))
+    return [type(exception).__name__]
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(**labels):
+    return ','.join('%s="%s"' % (name, _escape(value)) for name, value in sorted(labels.items()))
+
+
+def _number(value):
+    return repr(float(value))
+
+
+#: The registry that gateway operations are recorded in.
+registry = Registry()
+
+
+class _Operation(object):
+    """
+    The operation in progress, which the requests it makes add their byte
+    counts and phase timings to.
+    """
+    __slots__ = ('sent', 'received', 'phases', 'phase')
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.phases = {}
+        # the phase being timed, if any
+        self.phase = None
+
+
+if contextvars is not None:
+    _current = contextvars.ContextVar('dinero_operation', default=None)
+    _collector = contextvars.ContextVar('dinero_timings', default=None)
+
+    def current_operation():
+        return _current.get()
+
+    def _set_operation(operation):
+        return _current.set(operation)
+
+    def _reset_operation(token):
+        _current.reset(token)
+
+    def _get_collector():
+        return _collector.get()
+
+    def _set_collector(timings):
+        return _collector.set(timings)
+
+    def _reset_collector(token):
+        _collector.reset(token)
+else:
+    _local = threading.local()
+
+    def current_operation():
+        return getattr(_local, 'operation', None)
+
+    def _set_operation(operation):
+        token = current_operation()
+        _local.operation = operation
+        return token
+
+    def _reset_operation(token):
+        _local.operation = token
+
+    def _get_collector():
+        return getattr(_local, 'timings', None)
+
+    def _set_collector(timings):
+        token = _get_collector()
+        _local.timings = timings
+        return token
+
+    def _reset_collector(token):
+        _local.timings = token
+
+
+def count_bytes(sent=0, received=0):
+    """
+    Adds to the byte counts of the operation in progress, if there is one.
+    """
+    operation = current_operation()
+    if operation is not None:
+        operation.sent += sent
+        operation.received += received
+
+
+def _add_phase(operation, name, seconds):
+    operation.phases[name] = operation.phases.get(name, 0) + seconds
+
+
+@contextlib.contextmanager
+def phase(name):
+    """
+    Adds the time spent in the ``with`` block to the ``name`` phase of the
+    operation in progress.  Time spent in a phase that is already being
+    timed isn't counted twice.
+    """
+    operation = current_operation()
+    if operation is None or operation.phase is not None:
+        yield
+        return
+
+    operation.phase = name
+    start = now()
+    try:
+        yield
+    finally:
+        operation.phase = None
+        _add_phase(operation, name, now() - start)
+
+
+def timed(name):
+    """
+    :func:`phase` as a decorator.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            operation = current_operation()
+            if operation is None or operation.phase is not None:
+                return fn(*args, **kwargs)
+
+            operation.phase = name
+            start = now()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                operation.phase = None
+                _add_phase(operation, name, now() - start)
+        return inner
+    return decorator
+
+
+@contextlib.contextmanager
+def collect_timings():
+    """
+    Yields a dict that the phase timings of the operations in the ``with``
+    block are added to, with their ``total`` time.
+    """
+    timings = {}
+    token = _set_collector(timings)
+    try:
+        yield timings
+    finally:
+        _reset_collector(token)
+
+
+def start_operation():
+    """
+    Returns the new operation and a token for :func:`finish_operation`, or
+    None if an operation is already in progress; operations that call other
+    operations, like a charge that charges a customer, are recorded once,
+    under the outer name.
+    """
+    if current_operation() is not None:
+        return None
+    operation = _Operation()
+    return operation, _set_operation(operation)
+
+
+def finish_operation(started, gateway, name, seconds, exception=None):
+    operation, token = started
+    _reset_operation(token)
+    _record(operation, gateway, name, seconds, exception)
+
+
+def _record(operation, gateway, name, seconds, exception):
+    timings = _get_collector()
+    if timings is not None:
+        for key, value in operation.phases.items():
+            timings[key] = timings.get(key, 0) + value
+        timings['total'] = timings.get('total', 0) + seconds
+    registry.record(Measurement(gateway, name, seconds, operation.sent, operation.received, exception,
+                                operation.phases))
+
+
+def metered(fn):
+    """
+    Records a gateway method's calls in :data:`registry`, under the
+    gateway's name and the method's name.
+    """
+    if iscoroutinefunction(fn):
+        from dinero.aio import ametered
+        return ametered(fn)
+    if inspect.isgeneratorfunction(fn):
+        return _metered_generator(fn)
+
+    @functools.wraps(fn)
+    def inner(self, *args, **kwargs):
+        started = start_operation()
+        if started is None:
+            return fn(self, *args, **kwargs)
+
+        start_time = now()
+        error = None
+        try:
+            return fn(self, *args, **kwargs)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            finish_operation(started, self.name, fn.__name__, now() - start_time, error)
+
+    return inner
+
+
+def _metered_generator(fn):
+    """
+    :func:`metered` for generator functions, like the streaming operations.
+    The operation is open whenever the generator runs, until it is
+    exhausted or closed, and its latency is the time spent in it.
+    """
+    @functools.wraps(fn)
+    def inner(self, *args, **kwargs):
+        if current_operation() is not None:
+            return fn(self, *args, **kwargs)
+        return _iter_metered(self.name, fn.__name__, fn(self, *args, **kwargs))
+    return inner
+
+
+def _iter_metered(gateway, name, iterator):
+    operation = _Operation()
+    seconds = 0
+    error = None
+    try:
+        while True:
+            # only while it runs, so that the caller's own operations in
+            # between aren't counted as part of this one
+            token = _set_operation(operation)
+            start_time = now()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                seconds += now() - start_time
+                _reset_operation(token)
+            yield item
+    finally:
+        iterator.close()
+        _record(operation, gateway, name, seconds, error)
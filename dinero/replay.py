@@ -0,0 +1,320 @@
+"""
+Replays a capture file (see :mod:`dinero.capture`) against the Authorize.net
+emulator, keeping the captured spacing between requests but speeding it up,
+and reports the latency and throughput.  Run with ``--concurrency`` set to
+the number of workers, it shows whether they would keep up with that
+traffic::
+
+    $ python -m dinero.emulator --port 8080 --latency 0.3 &
+    $ python -m dinero.replay capture.jsonl --url http://127.0.0.1:8080/xml/v1/request.api \\
+          --speed 10 --concurrency 32
+
+Without ``--url``, the requests are answered in the process by a
+:class:`dinero.emulator.Emulator`, with ``--latency`` added to each.
+
+Captured card numbers are masked, so they are replaced with test numbers
+that end in the same four digits, and the ids of transactions, customers and
+cards created during the replay are substituted for the captured ones.  A
+request that uses an id waits until the response that created it has come
+back; ids that nothing in the capture created (objects that already existed
+when it started) are sent as they are, and counted in the report.
+"""
+from __future__ import division, print_function
+
+import itertools
+import optparse
+import random
+import re
+import sys
+import threading
+import time
+
+from six.moves import queue
+
+from dinero.capture import read_capture
+from dinero.emulator import Emulator, luhn_valid
+from dinero.gateways.authorizenet_gateway import XML_HEADERS
+from dinero.gateways.fake import latency_from_options
+from dinero.gateways.transport import RequestsTransport
+from dinero.timeouts import now
+
+MASKED_NUMBER_RE = re.compile(r'<cardNumber>([0-9])X+([0-9]{4})</cardNumber>')
+CREDENTIALS_RE = re.compile(r'<name>[^<]*</name><transactionKey>[^<]*</transactionKey>')
+ID_RE = re.compile(r'<(transId|refTransId|customerProfileId|customerPaymentProfileId|numericString)>([0-9]+)</')
+DIRECT_RESPONSE_RE = re.compile(r'<directResponse>(?:[^,<]*,){6}([0-9]+),')
+RESULT_RE = re.compile(r'<resultCode>Error</resultCode>\s*<message>\s*<code>([^<]*)</code>')
+
+
+def replacement_number(first, last_4):
+    """
+    A card number that passes the Luhn check, starting with ``first`` and
+    ending with ``last_4``.
+    """
+    for digit in '0123456789':
+        number = first + '0' * 10 + digit + last_4
+        if luhn_valid(number):
+            return number
+
+
+def response_ids(response):
+    """
+    The ids in a response, in order.
+    """
+    if not response:
+        return []
+    ids = [value for tag, value in ID_RE.findall(response)]
+    ids.extend(DIRECT_RESPONSE_RE.findall(response))
+    return ids
+
+
+class Replay(object):
+    """
+    Turns captured requests into requests for the replay target.
+    ``unmapped`` counts the ids that were sent unchanged, because no
+    replayed response created them.
+    """
+
+    def __init__(self, login_id='login', transaction_key='key'):
+        self.credentials = '<name>%s</name><transactionKey>%s</transactionKey>' % (login_id, transaction_key)
+        self.ids = {}
+        self.unmapped = 0
+        # captured ids that a response still in flight will map, and the
+        # event that is set once it has
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def expect(self, captured_response):
+        """
+        Called, in order, before each exchange is sent.  Returns an event to
+        set once the response has been learned, if it creates ids that
+        later requests can wait for.
+        """
+        done = None
+        with self._lock:
+            for old in response_ids(captured_response):
+                if old != '0' and old not in self.ids and old not in self._pending:
+                    if done is None:
+                        done = threading.Event()
+                    self._pending[old] = done
+        return done
+
+    def request(self, captured):
+        for tag, old in ID_RE.findall(captured):
+            done = self._pending.get(old)
+            if done is not None:
+                done.wait()
+
+        body = MASKED_NUMBER_RE.sub(
+                lambda m: '<cardNumber>%s</cardNumber>' % replacement_number(m.group(1), m.group(2)), captured)
+        body = CREDENTIALS_RE.sub(self.credentials, body)
+        ids = self.ids
+        unmapped = []
+
+        def replace(m):
+            old = m.group(2)
+            if old not in ids:
+                unmapped.append(old)
+            return '<%s>%s</' % (m.group(1), ids.get(old, old))
+        body = ID_RE.sub(replace, body)
+        if unmapped:
+            with self._lock:
+                self.unmapped += len(unmapped)
+        return body.encode('utf-8')
+
+    def learn(self, captured, response):
+        """
+        Maps the ids in the captured response to the ones in the replayed
+        response.
+        """
+        pairs = zip(response_ids(captured), response_ids(response.decode('utf-8', 'replace')))
+        with self._lock:
+            for old, new in pairs:
+                if old != '0' and new != '0':
+                    self.ids[old] = new
+
+
+def percentile(values, fraction):
+    """
+    ``values`` must be sorted.
+    """
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Report(object):
+    """
+    The results of a replay.  ``lag`` is how late each request was sent,
+    compared to the sped up schedule; it grows when the workers can't keep
+    up.
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.lags = []
+        self.errors = {}
+        self.unmapped = 0
+        self.elapsed = 0
+        self.scheduled = 0
+        self._lock = threading.Lock()
+
+    def add(self, latency, lag, error=None):
+        with self._lock:
+            self.latencies.append(latency)
+            self.lags.append(lag)
+            if error:
+                self.errors[error] = self.errors.get(error, 0) + 1
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def throughput(self):
+        return self.requests / self.elapsed if self.elapsed else 0
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        lags = sorted(self.lags)
+        lines = [
+            'requests:   %d in %.2fs (%.2fs scheduled)' % (self.requests, self.elapsed, self.scheduled),
+            'throughput: %.1f requests/s' % self.throughput,
+            'latency:    p50 %.1fms  p90 %.1fms  p99 %.1fms  max %.1fms' % tuple(
+                percentile(latencies, p) * 1000 for p in (.5, .9, .99, 1)),
+            'lag:        p50 %.1fms  p90 %.1fms  p99 %.1fms  max %.1fms' % tuple(
+                percentile(lags, p) * 1000 for p in (.5, .9, .99, 1)),
+            ]
+        if self.unmapped:
+            lines.append('unmapped:   %d ids not created during the replay' % self.unmapped)
+        for error, count in sorted(self.errors.items()):
+            lines.append('error:      %s x %d' % (error, count))
+        return '\n'.join(lines)
+
+
+def replay(exchanges, post, speed=1.0, concurrency=10, login_id='login', transaction_key='key'):
+    """
+    Sends the captured ``exchanges`` with ``post(data) -> response``, from
+    ``concurrency`` threads, ``speed`` times faster than they were captured.
+    Returns a :class:`Report`.
+    """
+    rewriter = Replay(login_id, transaction_key)
+    report = Report()
+    pending = queue.Queue(concurrency * 100)
+
+    def work():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            due, exchange, done = item
+            started = now()
+            error = None
+            try:
+                data = rewriter.request(exchange['request'])
+                started = now()
+                response = post(data)
+                rewriter.learn(exchange.get('response'), response)
+                match = RESULT_RE.search(response.decode('utf-8', 'replace'))
+                if match:
+                    error = match.group(1)
+            except Exception as e:
+                # a failed request, or an exchange that couldn't be replayed;
+                # either way the worker carries on with the next one
+                error = type(e).__name__
+            finally:
+                # even if it failed, so that nothing waits for it forever
+                if done is not None:
+                    done.set()
+            report.add(now() - started, started - due, error)
+
+    workers = [threading.Thread(target=work) for _ in range(concurrency)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    start = now()
+    first = None
+    for exchange in exchanges:
+        if first is None:
+            first = exchange['time']
+        due = start + (exchange['time'] - first) / speed
+        delay = due - now()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            done = rewriter.expect(exchange.get('response'))
+        except Exception:
+            # learning from it will fail too, and be reported
+            done = None
+        pending.put((due, exchange, done))
+    report.scheduled = now() - start if first is None else due - start
+
+    for worker in workers:
+        pending.put(None)
+    for worker in workers:
+        worker.join()
+    report.elapsed = now() - start
+    report.unmapped = rewriter.unmapped
+    return report
+
+
+def in_process(latency=None, seed=None):
+    """
+    A ``post`` function for :func:`replay` that is answered by an
+    :class:`dinero.emulator.Emulator`, after ``latency``.
+    """
+    emulator = Emulator(seed=seed)
+    sample = latency_from_options(latency)
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def post(data):
+        if sample is not None:
+            with lock:
+                delay = sample(rng)
+            time.sleep(delay)
+        return emulator.handle(data)
+    return post
+
+
+def over_http(url, pool_size, timeout=30):
+    """
+    A ``post`` function for :func:`replay` that sends the requests to
+    ``url``, giving up on each after ``timeout`` seconds.
+    """
+    transport = RequestsTransport(pool_size=pool_size)
+
+    def post(data):
+        return transport.post(url, data, XML_HEADERS, timeout)
+    return post
+
+
+def main(args=None):
+    parser = optparse.OptionParser(usage='python -m dinero.replay CAPTURE [options]',
+                                   description='Replays captured gateway traffic.')
+    parser.add_option('--url', help='the emulator to send the requests to (default: one in this process)')
+    parser.add_option('--speed', type='float', default=1.0, help='how many times faster to replay')
+    parser.add_option('--concurrency', type='int', default=10, help='number of workers')
+    parser.add_option('--latency', type='float', help='seconds each in-process response takes')
+    parser.add_option('--timeout', type='float', default=30.0, help='seconds to wait for each response from --url')
+    parser.add_option('--login-id', default='login')
+    parser.add_option('--transaction-key', default='key')
+    parser.add_option('--limit', type='int', help='only replay this many requests')
+    parser.add_option('--seed', type='int')
+    options, args = parser.parse_args(args)
+    if len(args) != 1:
+        parser.error('a capture file is required')
+
+    if options.url:
+        post = over_http(options.url, options.concurrency, options.timeout)
+    else:
+        post = in_process(options.latency, options.seed)
+    exchanges = read_capture(args[0])
+    if options.limit:
+        exchanges = itertools.islice(exchanges, options.limit)
+    report = replay(exchanges, post, options.speed, options.concurrency, options.login_id, options.transaction_key)
+    print(report.summary())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
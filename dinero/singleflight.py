@@ -0,0 +1,156 @@
+"""
+Single-flight reads: when several threads ask a gateway for the same
+transaction, customer or payment profile at the same time, only the first
+one makes the request, and the others wait for its response (or the
+gateway's error) instead of sending their own.  If the first one times out,
+which can be its own deadline running out, the others make the request
+again with whatever time they have left.  It is off unless the gateway is
+configured with it::
+
+    dinero.configure({
+        'foo': {
+            'type': 'dinero.gateways.AuthorizeNet',
+            # ...
+            'single_flight': True,
+        },
+    })
+
+A change to an object (see :func:`dinero.cache.invalidate`) forgets its
+request in flight, so a read that starts after the change never gets a
+response from before it.  Coroutines share requests the same way, see
+:func:`dinero.aio.acoalesced`.
+"""
+import copy
+import threading
+
+from dinero.exceptions import GatewayTimeout
+from dinero.timeouts import request_timeout
+
+
+class _Call(object):
+    __slots__ = ('done', 'result', 'error', 'shared')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # False if the waiters have to make the request themselves
+        self.shared = False
+
+
+def copy_error(error):
+    """
+    A copy of ``error`` for another caller to raise, so that callers don't
+    share its traceback (or its ``errors``).
+    """
+    try:
+        return copy.deepcopy(error)
+    except Exception:
+        return copy.copy(error)
+
+
+class SingleFlight(object):
+    """
+    The requests of one gateway that are in flight, by kind (for example
+    ``'transaction'``) and id.  ``coalesced`` counts the requests that
+    weren't made because one was already in flight.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        # asyncio tasks by key and event loop, see dinero.aio.acoalesced
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def do(self, kind, key, fn, *args):
+        """
+        Returns ``fn(*args)``, or a copy of the result of the call for the
+        same ``kind`` and ``key`` that is already in flight.
+        """
+        key = (kind, key)
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = _Call()
+                    leader = True
+                else:
+                    self.coalesced += 1
+                    leader = False
+
+            if leader:
+                return self._lead(key, call, fn, args)
+
+            # the caller's own deadline still applies
+            call.done.wait(request_timeout())
+            if not call.done.is_set():
+                raise GatewayTimeout('Timed out waiting for a request in flight')
+            if call.shared:
+                if call.error is not None:
+                    raise copy_error(call.error)
+                # callers are free to change what they get back
+                return copy.deepcopy(call.result)
+
+    def _lead(self, key, call, fn, args):
+        try:
+            call.result = fn(*args)
+            call.shared = True
+        except GatewayTimeout:
+            raise
+        except Exception as e:
+            call.error = e
+            call.shared = True
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def forget(self, kind, key):
+        """
+        Makes the next call for ``kind`` and ``key`` start a new request,
+        even if one is in flight.
+        """
+        key = (kind, key)
+        with self._lock:
+            self._calls.pop(key, None)
+            self._tasks.pop(key, None)
+
+    def _task_done(self, key, loop, task, future=None):
+        with self._lock:
+            tasks = self._tasks.get(key)
+            if tasks is not None and tasks.get(loop) is task:
+                del tasks[loop]
+                if not tasks:
+                    del self._tasks[key]
+
+    def __len__(self):
+        return len(self._calls) + sum(len(tasks) for tasks in self._tasks.values())
+
+
+def single_flight_from_options(options):
+    """
+    Builds the :class:`SingleFlight` described by
+    ``options['single_flight']``: None or ``False`` for none, ``True`` for a
+    new one, or an instance.
+    """
+    single_flight = options.get('single_flight')
+    if single_flight is None or single_flight is False:
+        return None
+    if single_flight is True:
+        return SingleFlight()
+    return single_flight
+
+
+def coalesced(gateway, kind, key, fn, *args):
+    """
+    Calls ``fn(*args)``, the request for the ``kind`` object with id
+    ``key``, unless the same request is already in flight on ``gateway``.
+    """
+    single_flight = gateway.single_flight
+    if single_flight is None:
+        return fn(*args)
+    return single_flight.do(kind, key, fn, *args)
@@ -0,0 +1,145 @@
+"""
+Deadlines bound the total time a logical operation may spend talking to the
+gateway.  A single operation, like updating a customer's card, can take
+several requests; every request made inside a :func:`deadline` block only
+gets whatever is left of the budget.
+
+::
+
+    with dinero.deadline(3.0):
+        customer.save()
+"""
+import contextlib
+import threading
+import time
+
+from dinero.exceptions import GatewayTimeout
+
+try:
+    import contextvars
+except ImportError:  # Python < 3.7
+    contextvars = None
+
+try:
+    now = time.monotonic
+except AttributeError:  # Python < 3.3
+    now = time.time
+
+
+if contextvars is not None:
+    # a ContextVar is local to the thread *and* to the asyncio task
+    _current = contextvars.ContextVar('dinero_deadline', default=None)
+
+    def get_deadline():
+        return _current.get()
+
+    def _set_deadline(expires):
+        return _current.set(expires)
+
+    def _reset_deadline(token):
+        _current.reset(token)
+else:
+    _local = threading.local()
+
+    def get_deadline():
+        return getattr(_local, 'expires', None)
+
+    def _set_deadline(expires):
+        token = get_deadline()
+        _local.expires = expires
+        return token
+
+    def _reset_deadline(token):
+        _local.expires = token
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """
+    Limits everything inside the ``with`` block to ``seconds``.  Deadlines
+    nest; an inner deadline can only shorten the outer one.  ``None`` means
+    no (additional) limit.
+    """
+    if seconds is None:
+        yield
+        return
+
+    expires = now() + seconds
+    current = get_deadline()
+    if current is not None and current < expires:
+        expires = current
+
+    token = _set_deadline(expires)
+    try:
+        yield
+    finally:
+        _reset_deadline(token)
+
+
+@contextlib.contextmanager
+def at_deadline(expires):
+    """
+    Enters a deadline that :func:`get_deadline` returned, for example in a
+    worker thread doing part of the caller's operation.  ``None`` means no
+    deadline.
+    """
+    if expires is None:
+        yield
+        return
+
+    token = _set_deadline(expires)
+    try:
+        yield
+    finally:
+        _reset_deadline(token)
+
+
+def iter_deadline(seconds, iterator):
+    """
+    Iterates over ``iterator`` within a :func:`deadline` of ``seconds``,
+    which starts with the first item.  The deadline only applies while
+    ``iterator`` runs, not to the caller's code between items.
+    """
+    with deadline(seconds):
+        expires = get_deadline()
+    iterator = iter(iterator)
+    try:
+        while True:
+            with at_deadline(expires):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            close()
+
+
+def remaining():
+    """
+    Returns the number of seconds left before the current deadline, or
+    ``None`` if there is no deadline.  Raises :class:`GatewayTimeout` if the
+    deadline has already passed.
+    """
+    expires = get_deadline()
+    if expires is None:
+        return None
+    left = expires - now()
+    if left <= 0:
+        raise GatewayTimeout('Deadline exceeded')
+    return left
+
+
+def request_timeout(default=None):
+    """
+    The timeout to use for the next request: the smaller of ``default`` and
+    the time remaining before the current deadline.
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if default is None:
+        return left
+    return min(left, default)
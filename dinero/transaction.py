@@ -1,17 +1,47 @@
+import sys
+
 from dinero import exceptions, get_gateway
 from dinero.log import log
 from dinero.base import DineroObject
+from dinero.bulk import imap_ordered, run_many
+from dinero.cache import get_cached, set_cached, invalidate
+from dinero.identity import identify
+from dinero.metrics import collect_timings
+from dinero.timeouts import deadline, iter_deadline
+
+if sys.version_info >= (3, 5):
+    from dinero.aio import TransactionAsyncMixin
+else:
+    TransactionAsyncMixin = object
 
 
-class Transaction(DineroObject):
+class Transaction(DineroObject, TransactionAsyncMixin):
     """
     :class:`Transaction` is an abstraction over payments in a gateway.  This is
     the interface for creating payments.
     """
+    _core = ('gateway_name', 'price', 'transaction_id')
+    _fields = (
+        'auth_code',
+        'status',
+        'account_number',
+        'card_type',
+        'last_4',
+        'avs_successful',
+        'avs_zip_successful',
+        'avs_address_successful',
+        'cvv_successful',
+        'customer_id',
+        'email',
+        'messages',
+        )
+    _field_set = frozenset(_fields)
+    __slots__ = _core + _fields
+    _type_code = 1
 
     @classmethod
     @log
-    def create(cls, price, gateway_name=None, **kwargs):
+    def create(cls, price, gateway_name=None, timeout=None, **kwargs):
         """
         Creates a payment.  This method will actually charge your customer.
         :meth:`create` can be called in several different ways.
@@ -49,29 +79,132 @@ class Transaction(DineroObject):
 
         Other payment options include ``card`` and ``check``.  See
         :class:`dinero.CreditCard` for more information.
+
+        Like every method that talks to the gateway, :meth:`create` accepts
+        ``timeout``, the number of seconds the whole operation may take.  See
+        :func:`dinero.deadline`.
         """
         gateway = get_gateway(gateway_name)
-        resp = gateway.charge(price, kwargs)
-        return cls(gateway_name=gateway.name, **resp)
+        with deadline(timeout), collect_timings() as timings:
+            resp = gateway.charge(price, kwargs)
+        transaction = identify(gateway, 'transaction', resp['transaction_id'], cls(gateway_name=gateway.name, **resp))
+        transaction.timings = timings
+        return transaction
+
+    @classmethod
+    @log
+    def retrieve(cls, transaction_id, gateway_name=None, timeout=None):
+        """
+        Fetches a transaction object from the gateway, or from the gateway's
+        cache if it has one.  If the gateway has an identity map (see
+        :mod:`dinero.identity`) and the transaction is already loaded, that
+        object is updated and returned.
+        """
+        gateway = get_gateway(gateway_name)
+        resp = get_cached(gateway, 'transaction', transaction_id)
+        timings = None
+        if resp is None:
+            with deadline(timeout), collect_timings() as timings:
+                resp = gateway.retrieve(transaction_id)
+            set_cached(gateway, 'transaction', transaction_id, resp)
+        transaction = identify(gateway, 'transaction', transaction_id, cls(gateway_name=gateway.name, **resp))
+        transaction.timings = timings
+        return transaction
+
+    @classmethod
+    def create_many(cls, charges, concurrency=10, gateway_name=None, timeout=None):
+        """
+        Runs :meth:`create` for every item in ``charges``, ``concurrency`` at
+        a time.  Each charge is a dict of :meth:`create` arguments, including
+        ``price``. ::
+
+            charges = ({'price': 20, 'customer': customer} for customer in customers)
+            for result in Transaction.create_many(charges, concurrency=20):
+                if isinstance(result, PaymentException):
+                    ...
+
+        Returns an iterator that yields, in the same order as ``charges``, the
+        :class:`Transaction` or the exception for each charge: usually a
+        :class:`dinero.exceptions.PaymentException`, but a charge that fails
+        some other way, like a connection error, doesn't stop the rest
+        either.  ``charges`` is consumed as the results are, so it can be a
+        generator.  ``timeout`` applies to each charge separately.
+
+        Keep the gateway's ``pool_size`` at least as large as
+        ``concurrency``.
+        """
+        def create(charge):
+            charge = dict(charge)
+            price = charge.pop('price')
+            charge.setdefault('gateway_name', gateway_name)
+            charge.setdefault('timeout', timeout)
+            try:
+                return cls.create(price, **charge)
+            except Exception as e:
+                return e
+
+        return imap_ordered(create, charges, concurrency)
+
+    @classmethod
+    def refund_many(cls, transactions, concurrency=10, timeout=None):
+        """
+        Refunds every transaction in ``transactions`` in full, ``concurrency``
+        at a time.  Transactions whose ``status`` shows that they haven't
+        settled (see :meth:`retrieve`) are voided without trying a refund
+        first.
+
+        Returns an iterator of :class:`dinero.bulk.Outcome`, one for each
+        transaction, in the same order as ``transactions``.
+        """
+        def refund(transaction):
+            return transaction._refund(get_gateway(transaction.gateway_name), None)
+        return run_many(refund, 'refund', transactions, concurrency, timeout)
+
+    @classmethod
+    def void_many(cls, transactions, concurrency=10, timeout=None):
+        """
+        Like :meth:`refund_many`, but always voids.
+        """
+        def void(transaction):
+            return 'void', transaction._void(get_gateway(transaction.gateway_name))
+        return run_many(void, 'void', transactions, concurrency, timeout)
+
+    @classmethod
+    def settle_many(cls, transactions, concurrency=10, timeout=None):
+        """
+        Like :meth:`refund_many`, but settles each transaction for its full
+        price.
+        """
+        def settle(transaction):
+            return 'settle', transaction._settle(get_gateway(transaction.gateway_name), None)
+        return run_many(settle, 'settle', transactions, concurrency, timeout)
 
     @classmethod
     @log
-    def retrieve(cls, transaction_id, gateway_name=None):
+    def iter_batch(cls, batch_id, gateway_name=None, timeout=None):
         """
-        Fetches a transaction object from the gateway.
+        Fetches the transactions in a settlement batch one at a time.  The
+        response is parsed as it arrives, so memory use doesn't grow with the
+        size of the batch. ::
+
+            for transaction in Transaction.iter_batch('12345'):
+                ...
+
+        ``timeout`` covers the whole response, but not the time spent in the
+        loop between transactions.
         """
         gateway = get_gateway(gateway_name)
-        resp = gateway.retrieve(transaction_id)
-        return cls(gateway_name=gateway.name, **resp)
+        for resp in iter_deadline(timeout, gateway.iter_batch_transactions(batch_id)):
+            yield cls(gateway_name=gateway.name, **resp)
 
     def __init__(self, gateway_name, price, transaction_id, **kwargs):
         self.gateway_name = gateway_name
         self.price = price
         self.transaction_id = transaction_id
-        self.data = kwargs
+        self._set_data(kwargs)
 
     @log
-    def refund(self, amount=None):
+    def refund(self, amount=None, timeout=None):
         """
         If ``amount`` is None dinero will refund the full price of the
         transaction.
@@ -83,13 +216,39 @@ class Transaction(DineroObject):
         entire amount of a transaction before it is settled.
         """
         gateway = get_gateway(self.gateway_name)
+        with deadline(timeout):
+            operation, result = self._refund(gateway, amount)
+        return result
+
+    def _refund(self, gateway, amount):
+        """
+        Voids or refunds the transaction and returns which one it did, with
+        the gateway's result.  If the transaction's status says it hasn't
+        settled, it goes straight to voiding it, otherwise it tries a refund
+        and falls back to a void.
+        """
+        try:
+            return self._refund_or_void(gateway, amount)
+        finally:
+            self._invalidate(gateway)
+
+    def _refund_or_void(self, gateway, amount):
+        full = amount is None or amount == self.price
+        voided = False
+        if full and gateway.is_settled(self) is False:
+            try:
+                return 'void', gateway.void(self)
+            except exceptions.PaymentException:
+                # the status is out of date, it may have settled since
+                voided = True
 
-        # TODO: can this implementation live in dinero.gateways.AuthorizeNet?
         try:
-            return gateway.refund(self, amount or self.price)
+            return 'refund', gateway.refund(self, amount or self.price)
         except exceptions.PaymentException:
-            if amount is None or amount == self.price:
-                return gateway.void(self)
+            if full and not voided:
+                return 'void', gateway.void(self)
+            elif full:
+                raise
             else:
                 raise exceptions.PaymentException(
                     "You cannot refund a transaction that hasn't been settled"
@@ -97,20 +256,31 @@ class Transaction(DineroObject):
                 )
 
     @log
-    def settle(self, amount=None):
+    def settle(self, amount=None, timeout=None):
         """
         If you create a transaction without settling it, you can settle it with
         this method.  It is possible to settle only part of a transaction.  If
         ``amount`` is None, the full transaction price is settled.
         """
         gateway = get_gateway(self.gateway_name)
-        return gateway.settle(self, amount or self.price)
+        with deadline(timeout):
+            return self._settle(gateway, amount)
 
-    def __setattr__(self, attr, val):
-        if attr in ['gateway_name', 'transaction_id', 'price', 'data']:
-            self.__dict__[attr] = val
-        else:
-            self.data[attr] = val
+    def _settle(self, gateway, amount):
+        try:
+            return gateway.settle(self, amount or self.price)
+        finally:
+            self._invalidate(gateway)
+
+    def _void(self, gateway):
+        try:
+            return gateway.void(self)
+        finally:
+            self._invalidate(gateway)
+
+    def _invalidate(self, gateway):
+        # the transaction's status has changed, or might have
+        invalidate(gateway, 'transaction', self.transaction_id)
 
     @classmethod
     def from_dict(cls, dict):
@@ -127,3 +297,9 @@ class Transaction(DineroObject):
         if not isinstance(other, Transaction):
             return False
         return self.transaction_id == other.transaction_id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.transaction_id)
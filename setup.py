@@ -19,4 +19,7 @@ setup(
         platforms="any",
         license="BSD",
         install_requires=['six', 'lxml', 'requests'],
+        extras_require={
+            'async': ['aiohttp'],
+            },
         )
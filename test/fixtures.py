@@ -0,0 +1,233 @@
+"""
+Canned Authorize.net responses and helpers for tests that run without
+sandbox credentials.
+"""
+import codecs
+
+import dinero
+
+
+CHARGE_RESPONSE = codecs.BOM_UTF8 + b"""<?xml version="1.0" encoding="utf-8"?>
+<createTransactionResponse xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">
+  <messages>
+    <resultCode>Ok</resultCode>
+    <message>
+      <code>I00001</code>
+      <text>Successful.</text>
+    </message>
+  </messages>
+  <transactionResponse>
+    <responseCode>1</responseCode>
+    <authCode>ABC123</authCode>
+    <avsResultCode>Y</avsResultCode>
+    <cvvResultCode>M</cvvResultCode>
+    <cavvResultCode/>
+    <transId>2200000001</transId>
+    <refTransID/>
+    <transHash>D15F90A2DCF7B7FD7D15E220B7676708</transHash>
+    <testRequest>0</testRequest>
+    <accountNumber>XXXX1111</accountNumber>
+    <accountType>Visa</accountType>
+    <messages>
+      <message>
+        <code>1</code>
+        <description>This transaction has been approved.</description>
+      </message>
+    </messages>
+  </transactionResponse>
+</createTransactionResponse>"""
+
+
+def memory_gateway(transport):
+    dinero.configure({
+        'memory': {
+            'type': 'dinero.gateways.AuthorizeNet',
+            'login_id': 'login',
+            'transaction_key': 'key',
+            'transport': transport,
+        }
+    })
+    gateway = dinero.get_gateway('memory')
+    gateway.url = gateway.test_url
+    return gateway
+
+
+CUSTOMER_PROFILE_RESPONSE = b"""<?xml version="1.0" encoding="utf-8"?>
+<getCustomerProfileResponse xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">
+  <messages>
+    <resultCode>Ok</resultCode>
+    <message>
+      <code>I00001</code>
+      <text>Successful.</text>
+    </message>
+  </messages>
+  <profile>
+    <email>joeyjoejoejunior@example.com</email>
+    <customerProfileId>10000001</customerProfileId>
+    <paymentProfiles>
+      <billTo>
+        <firstName>Joey</firstName>
+        <lastName>Shabadoo</lastName>
+        <zip>12345</zip>
+      </billTo>
+      <customerPaymentProfileId>20000001</customerPaymentProfileId>
+      <payment>
+        <creditCard>
+          <cardNumber>XXXX1111</cardNumber>
+          <expirationDate>XXXX</expirationDate>
+        </creditCard>
+      </payment>
+    </paymentProfiles>
+  </profile>
+</getCustomerProfileResponse>"""
+
+CUSTOMER_NOT_FOUND_RESPONSE = b"""<?xml version="1.0" encoding="utf-8"?>
+<getCustomerProfileResponse xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">
+  <messages>
+    <resultCode>Error</resultCode>
+    <message>
+      <code>E00040</code>
+      <text>The record cannot be found.</text>
+    </message>
+  </messages>
+</getCustomerProfileResponse>"""
+
+DECLINED_RESPONSE = b"""<?xml version="1.0" encoding="utf-8"?>
+<createTransactionResponse xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">
+  <messages>
+    <resultCode>Error</resultCode>
+    <message>
+      <code>E00027</code>
+      <text>The transaction was unsuccessful.</text>
+    </message>
+  </messages>
+  <transactionResponse>
+    <responseCode>2</responseCode>
+    <authCode/>
+    <avsResultCode>P</avsResultCode>
+    <cvvResultCode/>
+    <cavvResultCode/>
+    <transId>0</transId>
+    <refTransID/>
+    <transHash>D15F90A2DCF7B7FD7D15E220B7676708</transHash>
+    <testRequest>0</testRequest>
+    <accountNumber>XXXX1111</accountNumber>
+    <accountType>Visa</accountType>
+    <errors>
+      <error>
+        <errorCode>2</errorCode>
+        <errorText>This transaction has been declined.</errorText>
+      </error>
+    </errors>
+  </transactionResponse>
+</createTransactionResponse>"""
+
+INVALID_TRANSACTION_RESPONSE = b"""<?xml version="1.0" encoding="utf-8"?>
+<createTransactionResponse xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">
+  <messages>
+    <resultCode>Error</resultCode>
+    <message>
+      <code>E00027</code>
+      <text>The transaction was unsuccessful.</text>
+    </message>
+  </messages>
+  <transactionResponse>
+    <responseCode>3</responseCode>
+    <authCode/>
+    <avsResultCode>P</avsResultCode>
+    <cvvResultCode/>
+    <cavvResultCode/>
+    <transId>0</transId>
+    <refTransID>0</refTransID>
+    <transHash>D15F90A2DCF7B7FD7D15E220B7676708</transHash>
+    <testRequest>0</testRequest>
+    <accountNumber/>
+    <accountType/>
+    <errors>
+      <error>
+        <errorCode>33</errorCode>
+        <errorText>A valid referenced transaction ID is required.</errorText>
+      </error>
+    </errors>
+  </transactionResponse>
+</createTransactionResponse>"""
+
+AUTHENTICATION_ERROR_RESPONSE = b"""<?xml version="1.0" encoding="utf-8"?>
+<createTransactionResponse xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">
+  <messages>
+    <resultCode>Error</resultCode>
+    <message>
+      <code>E00007</code>
+      <text>User authentication failed due to invalid authentication values.</text>
+    </message>
+  </messages>
+</createTransactionResponse>"""
+
+TRANSACTION_DETAILS_RESPONSE = b"""<?xml version="1.0" encoding="utf-8"?>
+<getTransactionDetailsResponse xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">
+  <messages>
+    <resultCode>Ok</resultCode>
+    <message>
+      <code>I00001</code>
+      <text>Successful.</text>
+    </message>
+  </messages>
+  <transaction>
+    <transId>2200000001</transId>
+    <submitTimeUTC>2026-10-18T16:00:00Z</submitTimeUTC>
+    <submitTimeLocal>2026-10-18T10:00:00</submitTimeLocal>
+    <transactionType>authCaptureTransaction</transactionType>
+    <transactionStatus>capturedPendingSettlement</transactionStatus>
+    <responseCode>1</responseCode>
+    <responseReasonCode>1</responseReasonCode>
+    <responseReasonDescription>Approval</responseReasonDescription>
+    <authCode>ABC123</authCode>
+    <AVSResponse>Y</AVSResponse>
+    <cardCodeResponse>M</cardCodeResponse>
+    <order>
+      <invoiceNumber>INV-1</invoiceNumber>
+    </order>
+    <authAmount>12.00</authAmount>
+    <settleAmount>12.00</settleAmount>
+    <taxExempt>false</taxExempt>
+    <payment>
+      <creditCard>
+        <cardNumber>XXXX1111</cardNumber>
+        <expirationDate>XXXX</expirationDate>
+        <cardType>Visa</cardType>
+      </creditCard>
+    </payment>
+    <customer>
+      <id>123</id>
+      <email>joeyjoejoejunior@example.com</email>
+    </customer>
+    <billTo>
+      <firstName>Joey</firstName>
+      <lastName>Shabadoo</lastName>
+    </billTo>
+    <recurringBilling>false</recurringBilling>
+  </transaction>
+</getTransactionDetailsResponse>"""
+
+CHARGE_CUSTOMER_RESPONSE = b"""<?xml version="1.0" encoding="utf-8"?>
+<createCustomerProfileTransactionResponse xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">
+  <messages>
+    <resultCode>Ok</resultCode>
+    <message>
+      <code>I00001</code>
+      <text>Successful.</text>
+    </message>
+  </messages>
+  <directResponse>1,1,1,This transaction has been approved.,ABC123,Y,2200000002,,,12.00,CC,auth_capture,,Joey,Shabadoo,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,XXXX1111,Visa,,,,,,,,,,,,,,,,</directResponse>
+</createCustomerProfileTransactionResponse>"""
+
+OK_RESPONSE = b"""<?xml version="1.0" encoding="utf-8"?>
+<updateCustomerProfileResponse xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">
+  <messages>
+    <resultCode>Ok</resultCode>
+    <message>
+      <code>I00001</code>
+      <text>Successful.</text>
+    </message>
+  </messages>
+</updateCustomerProfileResponse>"""
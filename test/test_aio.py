@@ -0,0 +1,113 @@
+import sys
+
+import pytest
+
+if sys.version_info < (3, 5):
+    pytest.skip('asyncio API requires Python 3.5', allow_module_level=True)
+
+import asyncio
+
+import dinero
+from dinero.exceptions import CustomerNotFoundError, GatewayTimeout
+from dinero.gateways.aio import AsyncMemoryTransport, ExecutorTransport
+from dinero.gateways.base import Gateway
+from dinero.gateways.transport import MemoryTransport
+from dinero.timeouts import remaining
+
+from .fixtures import (
+        CHARGE_RESPONSE,
+        CUSTOMER_NOT_FOUND_RESPONSE,
+        CUSTOMER_PROFILE_RESPONSE,
+        memory_gateway,
+        )
+
+
+def run(*coroutines):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(asyncio.gather(*coroutines))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def async_memory_gateway(responses):
+    transport = AsyncMemoryTransport(responses)
+    gateway = memory_gateway(MemoryTransport())
+    gateway.options['async_transport'] = transport
+    return gateway, transport
+
+
+def test_injected_transport_is_shared():
+    gateway = memory_gateway(MemoryTransport([CHARGE_RESPONSE]))
+    assert isinstance(gateway.aio.transport, ExecutorTransport)
+
+    transaction, = run(dinero.Transaction.acreate(12, number='4' + '1' * 15, month='12', year='2030', gateway_name='memory'))
+    assert transaction.transaction_id == '2200000001'
+    assert len(gateway.transport.requests) == 1
+
+
+def test_concurrent_acreate():
+    gateway, transport = async_memory_gateway(lambda url, data: CHARGE_RESPONSE)
+
+    transactions = run(*[
+        dinero.Transaction.acreate(price, number='4' + '1' * 15, month='12', year='2030', gateway_name='memory')
+        for price in range(1, 51)
+        ])
+
+    assert [t.price for t in transactions] == list(range(1, 51))
+    assert len(transport.requests) == 50
+
+
+def test_aretrieve_customer():
+    gateway, transport = async_memory_gateway([CUSTOMER_PROFILE_RESPONSE])
+
+    customer, = run(dinero.Customer.aretrieve('10000001', gateway_name='memory'))
+    assert customer.customer_id == '10000001'
+    assert customer.card_id == '20000001'
+    assert customer.cards[0].last_4 == '1111'
+
+
+def test_aretrieve_missing_customer():
+    gateway, transport = async_memory_gateway([CUSTOMER_NOT_FOUND_RESPONSE])
+
+    with pytest.raises(CustomerNotFoundError):
+        run(dinero.Customer.aretrieve('10000001', gateway_name='memory'))
+
+
+def test_async_timeout():
+    class SlowTransport(AsyncMemoryTransport):
+        async def post(self, url, data, headers, timeout=None):
+            await asyncio.sleep(1)
+
+    gateway, transport = async_memory_gateway([])
+    gateway.options['async_transport'] = SlowTransport()
+
+    with pytest.raises(GatewayTimeout):
+        run(dinero.Transaction.acreate(12, number='4' + '1' * 15, month='12', year='2030', gateway_name='memory', timeout=0.05))
+
+
+class BlockingGateway(Gateway):
+    """
+    A gateway with only the blocking API.
+    """
+
+    def __init__(self, options):
+        self.deadlines = []
+
+    def charge(self, price, options):
+        self.deadlines.append(remaining())
+        return {'transaction_id': '1234', 'price': price}
+
+
+def test_gateway_without_asyncio_support():
+    dinero.configure({'blocking': {'type': 'test.test_aio.BlockingGateway'}})
+    gateway = dinero.get_gateway('blocking')
+    assert getattr(gateway, 'aio', None) is not None
+
+    transaction, = run(dinero.Transaction.acreate(12, gateway_name='blocking', timeout=5))
+    assert transaction.transaction_id == '1234'
+    assert transaction.price == 12
+    # run in a thread, within the caller's deadline
+    assert 0 < gateway.deadlines[0] <= 5
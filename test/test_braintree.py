@@ -0,0 +1,118 @@
+import sys
+import threading
+import types
+
+import pytest
+
+import dinero
+
+
+class Namespace(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeBraintree(object):
+    """
+    Just enough of the braintree package for the Braintree gateway to be
+    configured, recording the requests it would make.
+    """
+
+    def __init__(self, production_merchants=()):
+        self.production_merchants = set(production_merchants)
+        self.requests = []
+        self.gateways = []
+
+        module = self.module = types.ModuleType('braintree')
+        exceptions = self.exceptions = types.ModuleType('braintree.exceptions')
+        exceptions.NotFoundError = type('NotFoundError', (Exception,), {})
+        exceptions.AuthenticationError = type('AuthenticationError', (Exception,), {})
+        module.exceptions = exceptions
+        module.Environment = type('Environment', (object,), {'Sandbox': 'sandbox', 'Production': 'production'})
+        module.Configuration = Configuration
+        module.BraintreeGateway = self.braintree_gateway
+
+    def braintree_gateway(self, config):
+        gateway = Namespace(config=config, transaction=Namespace(
+            find=lambda transaction_id: self.find(config, transaction_id)))
+        self.gateways.append(gateway)
+        return gateway
+
+    def find(self, config, transaction_id):
+        self.requests.append((config.environment, config.merchant_id))
+        if config.environment == 'sandbox' and config.merchant_id in self.production_merchants:
+            raise self.exceptions.AuthenticationError()
+        raise self.exceptions.NotFoundError()
+
+
+class Configuration(object):
+    def __init__(self, environment, merchant_id, public_key, private_key):
+        self.environment = environment
+        self.merchant_id = merchant_id
+        self.public_key = public_key
+        self.private_key = private_key
+
+
+@pytest.fixture
+def braintree(monkeypatch):
+    fake = FakeBraintree(production_merchants=['live-merchant'])
+    monkeypatch.setitem(sys.modules, 'braintree', fake.module)
+    monkeypatch.setitem(sys.modules, 'braintree.exceptions', fake.exceptions)
+    # imported again against the fake module, and forgotten afterwards
+    sys.modules.pop('dinero.gateways.braintree_gateway', None)
+    yield fake
+    sys.modules.pop('dinero.gateways.braintree_gateway', None)
+
+
+def configure(**gateways):
+    options = {}
+    for name, merchant_id in gateways.items():
+        options[name] = {
+            'type': 'dinero.gateways.braintree_gateway.Braintree',
+            'merchant_id': merchant_id,
+            'public_key': merchant_id + '-public',
+            'private_key': merchant_id + '-private',
+        }
+    dinero.configure(options)
+    return options
+
+
+def test_accounts_are_separate(braintree):
+    options = configure(us='us-merchant', eu='eu-merchant')
+    options['us']['environment'] = 'sandbox'
+    options['eu']['environment'] = 'production'
+    dinero.configure(options)
+
+    us = dinero.get_gateway('us').braintree.config
+    eu = dinero.get_gateway('eu').braintree.config
+    assert (us.environment, us.merchant_id, us.public_key, us.private_key) == (
+        'sandbox', 'us-merchant', 'us-merchant-public', 'us-merchant-private')
+    assert (eu.environment, eu.merchant_id, eu.public_key, eu.private_key) == (
+        'production', 'eu-merchant', 'eu-merchant-public', 'eu-merchant-private')
+    # a configured environment needs no discovery
+    assert braintree.requests == []
+
+
+def test_no_requests_until_first_use(braintree):
+    configure(sandbox='sandbox-merchant', live='live-merchant')
+    assert braintree.requests == []
+    assert braintree.gateways == []
+
+    assert dinero.get_gateway('sandbox').braintree.config.environment == 'sandbox'
+    assert braintree.requests == [('sandbox', 'sandbox-merchant')]
+
+    dinero.get_gateway('live').warmup()
+    assert dinero.get_gateway('live').braintree.config.environment == 'production'
+    assert braintree.requests == [('sandbox', 'sandbox-merchant'), ('sandbox', 'live-merchant')]
+
+
+def test_discovery_happens_once(braintree):
+    configure(sandbox='sandbox-merchant')
+    gateway = dinero.get_gateway('sandbox')
+
+    threads = [threading.Thread(target=lambda: gateway.braintree) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert braintree.requests == [('sandbox', 'sandbox-merchant')]
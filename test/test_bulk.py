@@ -0,0 +1,242 @@
+import random
+import re
+import threading
+import time
+
+import requests
+
+import dinero
+from dinero.bulk import imap_ordered
+from dinero.exceptions import CardDeclinedError, PaymentException, RefundError
+from dinero.gateways.transport import MemoryTransport
+from dinero.timeouts import remaining
+
+from .fixtures import CHARGE_RESPONSE, DECLINED_RESPONSE, INVALID_TRANSACTION_RESPONSE, memory_gateway
+
+
+class ChargeTransport(MemoryTransport):
+    """
+    Declines odd amounts, and keeps track of how many requests are in flight.
+    """
+
+    def __init__(self):
+        super(ChargeTransport, self).__init__(self.respond)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.count_lock = threading.Lock()
+
+    def respond(self, url, data):
+        with self.count_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(random.random() / 100)
+        with self.count_lock:
+            self.in_flight -= 1
+
+        amount = int(re.search(br'<amount>(\d+)', data).group(1))
+        if amount % 2:
+            return DECLINED_RESPONSE
+        return CHARGE_RESPONSE.replace(b'2200000001', str(amount).encode('ascii'))
+
+
+def test_imap_ordered_keeps_order():
+    def slow_square(x):
+        time.sleep(random.random() / 100)
+        return x * x
+
+    assert list(imap_ordered(slow_square, range(50), 8)) == [x * x for x in range(50)]
+
+
+def test_imap_ordered_is_lazy():
+    consumed = []
+
+    def items():
+        for i in range(1000):
+            consumed.append(i)
+            yield i
+
+    results = imap_ordered(lambda x: x, items(), 4)
+    assert next(results) == 0
+    assert len(consumed) <= 2 * 4
+    results.close()
+
+
+def test_imap_ordered_raises_in_order():
+    def fail_on_three(x):
+        if x == 3:
+            raise ValueError(x)
+        return x
+
+    results = imap_ordered(fail_on_three, range(10), 4)
+    assert [next(results) for _ in range(3)] == [0, 1, 2]
+    try:
+        next(results)
+    except ValueError:
+        pass
+    else:
+        assert False, 'ValueError expected'
+
+
+def test_imap_ordered_keeps_the_deadline():
+    with dinero.deadline(5):
+        left = list(imap_ordered(lambda x: remaining(), range(4), 2))
+    assert all(0 < seconds <= 5 for seconds in left)
+    assert list(imap_ordered(lambda x: remaining(), range(4), 2)) == [None] * 4
+
+
+def test_create_many_within_a_deadline():
+    def slow(url, data):
+        time.sleep(0.05)
+        return CHARGE_RESPONSE
+
+    memory_gateway(MemoryTransport(slow))
+    charges = ({'price': 2, 'number': '4' + '1' * 15, 'month': '12', 'year': '2030'} for _ in range(6))
+    with dinero.deadline(0.02):
+        results = list(dinero.Transaction.create_many(charges, concurrency=2, gateway_name='memory'))
+    # the first two got in, the rest ran out of the caller's time
+    assert [type(result).__name__ for result in results] == ['Transaction'] * 2 + ['GatewayTimeout'] * 4
+
+
+def test_create_many():
+    transport = ChargeTransport()
+    memory_gateway(transport)
+
+    charges = ({'price': price, 'number': '4' + '1' * 15, 'month': '12', 'year': '2030'}
+               for price in range(10, 50))
+    results = list(dinero.Transaction.create_many(charges, concurrency=5, gateway_name='memory'))
+
+    assert len(results) == 40
+    for price, result in zip(range(10, 50), results):
+        if price % 2:
+            assert isinstance(result, PaymentException)
+            assert CardDeclinedError in result
+        else:
+            assert isinstance(result, dinero.Transaction)
+            assert result.transaction_id == str(price)
+    assert 1 < transport.max_in_flight <= 5
+
+
+def test_create_many_survives_transport_errors():
+    def flaky(url, data):
+        if b'<amount>13' in data:
+            raise requests.exceptions.ConnectionError('connection reset')
+        return CHARGE_RESPONSE
+
+    memory_gateway(MemoryTransport(flaky))
+    charges = ({'price': price, 'number': '4' + '1' * 15, 'month': '12', 'year': '2030'}
+               for price in range(10, 20))
+    results = list(dinero.Transaction.create_many(charges, concurrency=3, gateway_name='memory'))
+
+    assert len(results) == 10
+    assert isinstance(results[3], requests.exceptions.ConnectionError)
+    assert all(isinstance(result, dinero.Transaction) for result in results[:3] + results[4:])
+
+
+def test_imap_ordered_base_exception():
+    def interrupt_on_two(x):
+        if x == 2:
+            raise KeyboardInterrupt
+        return x
+
+    results = imap_ordered(interrupt_on_two, range(5), 2)
+    assert [next(results) for _ in range(2)] == [0, 1]
+    try:
+        next(results)
+    except KeyboardInterrupt:
+        pass
+    else:
+        assert False, 'KeyboardInterrupt expected'
+    results.close()
+
+
+REFUND_ERROR_RESPONSE = INVALID_TRANSACTION_RESPONSE.replace(b'<errorCode>33</errorCode>', b'<errorCode>54</errorCode>')
+
+
+class SettlementTransport(MemoryTransport):
+    """
+    Refunds transactions with ids in ``settled``, voids the others.
+    """
+
+    def __init__(self, settled):
+        super(SettlementTransport, self).__init__(self.respond)
+        self.settled = settled
+        self.operations = []
+        self.operations_lock = threading.Lock()
+
+    def respond(self, url, data):
+        transaction_type = re.search(br'<transactionType>(\w+)', data).group(1).decode('ascii')
+        transaction_id = re.search(br'<refTransId>(\d+)', data).group(1).decode('ascii')
+        with self.operations_lock:
+            self.operations.append((transaction_type, transaction_id))
+        settled = transaction_id in self.settled
+        if (transaction_type == 'refundTransaction') != settled:
+            return REFUND_ERROR_RESPONSE
+        return CHARGE_RESPONSE
+
+
+def transactions(statuses):
+    return [dinero.Transaction('memory', 12, str(i), status=status, account_number='XXXX1111')
+            for i, status in enumerate(statuses)]
+
+
+def test_refund_many_voids_unsettled_transactions_directly():
+    transport = SettlementTransport(settled=['1'])
+    memory_gateway(transport)
+
+    outcomes = list(dinero.Transaction.refund_many(
+        transactions(['capturedPendingSettlement', 'settledSuccessfully', 'capturedPendingSettlement']),
+        concurrency=2))
+
+    assert [outcome.operation for outcome in outcomes] == ['void', 'refund', 'void']
+    assert all(outcome.ok for outcome in outcomes)
+    assert sorted(transport.operations) == [
+        ('refundTransaction', '1'),
+        ('voidTransaction', '0'),
+        ('voidTransaction', '2'),
+    ]
+
+
+def test_refund_many_without_status_falls_back_to_void():
+    transport = SettlementTransport(settled=[])
+    memory_gateway(transport)
+
+    outcome, = dinero.Transaction.refund_many(transactions([None]))
+
+    assert outcome.ok
+    assert outcome.operation == 'void'
+    assert transport.operations == [('refundTransaction', '0'), ('voidTransaction', '0')]
+
+
+def test_refund_with_stale_status():
+    transport = SettlementTransport(settled=['0'])
+    memory_gateway(transport)
+
+    transaction, = transactions(['capturedPendingSettlement'])
+    assert transaction.refund()
+    assert transport.operations == [('voidTransaction', '0'), ('refundTransaction', '0')]
+
+
+def test_void_many_reports_errors():
+    transport = SettlementTransport(settled=['1'])
+    memory_gateway(transport)
+
+    outcomes = list(dinero.Transaction.void_many(transactions([None, None])))
+
+    assert outcomes[0].ok
+    assert not outcomes[1].ok
+    assert outcomes[1].operation == 'void'
+    assert RefundError in outcomes[1].result
+
+
+def test_void_many_survives_transport_errors():
+    def flaky(url, data):
+        if b'<refTransId>1<' in data:
+            raise requests.exceptions.ConnectionError('connection reset')
+        return CHARGE_RESPONSE
+
+    memory_gateway(MemoryTransport(flaky))
+
+    outcomes = list(dinero.Transaction.void_many(transactions([None, None, None])))
+
+    assert [outcome.ok for outcome in outcomes] == [True, False, True]
+    assert isinstance(outcomes[1].result, requests.exceptions.ConnectionError)
@@ -0,0 +1,291 @@
+import os
+import shutil
+import tempfile
+import time
+
+import dinero
+from dinero.cache import LRUCache, SQLiteCache, SharedMemoryCache, cache_from_options
+from dinero.gateways.transport import MemoryTransport
+
+from .fixtures import (
+        CHARGE_CUSTOMER_RESPONSE,
+        CHARGE_RESPONSE,
+        CUSTOMER_PROFILE_RESPONSE,
+        OK_RESPONSE,
+        TRANSACTION_DETAILS_RESPONSE,
+        )
+
+
+def cached_gateway(transport, **cache):
+    dinero.configure({
+        'cached': {
+            'type': 'dinero.gateways.AuthorizeNet',
+            'login_id': 'login',
+            'transaction_key': 'key',
+            'environment': 'sandbox',
+            'transport': transport,
+            'cache': cache,
+        }
+    })
+    return dinero.get_gateway('cached')
+
+
+def test_lru_eviction():
+    cache = LRUCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    # b was the least recently used
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+
+
+def test_ttl():
+    cache = LRUCache(ttl=0.01)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    time.sleep(0.02)
+    assert cache.get('a') is None
+
+
+def check_backend(make_cache):
+    cache = make_cache(ttl=60)
+    value = {'transaction_id': '2200000001', 'price': 12, 'messages': [['1', 'Approved']]}
+    cache.set('a', value)
+    assert cache.get('a') == value
+    assert cache.get('b') is None
+
+    # another process (or worker) using the same file sees it too
+    assert make_cache(ttl=60).get('a') == value
+
+    cache.delete('a')
+    assert cache.get('a') is None
+
+    cache = make_cache(ttl=0.01)
+    cache.set('a', value)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+
+
+def test_sqlite_cache():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'cache.sqlite3')
+        check_backend(lambda ttl: SQLiteCache(path, ttl=ttl))
+
+        cache = SQLiteCache(path, max_size=2)
+        cache.clear()
+        cache.set('a', 1)
+        time.sleep(0.01)
+        cache.set('b', 2)
+        time.sleep(0.01)
+        cache.set('c', 3)
+        assert len(cache) == 2
+        # a was the closest to expiring
+        assert cache.get('a') is None
+        assert cache.get('b') == 2
+
+        # only JSON is stored, and the file is private
+        cache.set('d', object())
+        assert cache.get('d') is None
+        assert os.stat(path).st_mode & 0o077 == 0
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_shared_memory_cache():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'cache.mmap')
+        check_backend(lambda ttl: SharedMemoryCache(path, ttl=ttl, slots=64, slot_size=512))
+
+        # too big for a slot
+        cache = SharedMemoryCache(path, slots=64, slot_size=512)
+        cache.set('big', 'x' * 1000)
+        assert cache.get('big') is None
+        cache.set('object', object())
+        assert cache.get('object') is None
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_cache_from_options():
+    assert cache_from_options({}) is None
+    assert isinstance(cache_from_options({'cache': True}), LRUCache)
+    assert cache_from_options({'cache': {'max_size': 5}}).max_size == 5
+    cache = cache_from_options({'cache': {'backend': 'dinero.cache.LRUCache', 'ttl': 5}})
+    assert isinstance(cache, LRUCache)
+    assert cache.ttl == 5
+
+
+def test_accounts_share_a_cache():
+    cache = LRUCache()
+    transports = {}
+    for login_id in ('login', 'other'):
+        transports[login_id] = MemoryTransport([TRANSACTION_DETAILS_RESPONSE])
+        dinero.configure({
+            'shared': {
+                'type': 'dinero.gateways.AuthorizeNet',
+                'login_id': login_id,
+                'transaction_key': 'key',
+                'environment': 'sandbox',
+                'transport': transports[login_id],
+                'cache': cache,
+            }
+        })
+        dinero.Transaction.retrieve('2200000001', gateway_name='shared')
+
+    # the other account didn't get the first one's response
+    assert len(transports['other'].requests) == 1
+    assert len(cache) == 2
+
+
+def test_no_cache_by_default():
+    transport = MemoryTransport([TRANSACTION_DETAILS_RESPONSE, TRANSACTION_DETAILS_RESPONSE])
+    dinero.configure({
+        'uncached': {
+            'type': 'dinero.gateways.AuthorizeNet',
+            'login_id': 'login',
+            'transaction_key': 'key',
+            'environment': 'sandbox',
+            'transport': transport,
+        }
+    })
+    dinero.Transaction.retrieve('2200000001', gateway_name='uncached')
+    dinero.Transaction.retrieve('2200000001', gateway_name='uncached')
+    assert len(transport.requests) == 2
+
+
+def test_retrieve_is_cached():
+    transport = MemoryTransport([TRANSACTION_DETAILS_RESPONSE])
+    cached_gateway(transport)
+
+    first = dinero.Transaction.retrieve('2200000001', gateway_name='cached')
+    second = dinero.Transaction.retrieve('2200000001', gateway_name='cached')
+
+    assert len(transport.requests) == 1
+    assert second.to_dict() == first.to_dict()
+    # changing one copy doesn't change the cache
+    second.status = 'voided'
+    assert dinero.Transaction.retrieve('2200000001', gateway_name='cached').status == first.status
+
+
+def test_create_is_not_cached():
+    transport = MemoryTransport([CHARGE_RESPONSE, TRANSACTION_DETAILS_RESPONSE])
+    cached_gateway(transport)
+
+    transaction = dinero.Transaction.create(12, number='4' + '1' * 15, month='12', year='2030', gateway_name='cached')
+    # a charge response doesn't have everything a retrieve does
+    dinero.Transaction.retrieve(transaction.transaction_id, gateway_name='cached')
+
+    assert len(transport.requests) == 2
+
+
+def test_cached_values_are_copied():
+    transport = MemoryTransport([CUSTOMER_PROFILE_RESPONSE])
+    gateway = cached_gateway(transport)
+
+    customer, cards = gateway.retrieve_customer('10000001')
+    cards[0]['last_4'] = '0000'
+    customer, cards = gateway.retrieve_customer('10000001')
+    assert cards[0]['last_4'] == '1111'
+    cards[0]['last_4'] = '0000'
+    assert gateway.retrieve_customer('10000001')[1][0]['last_4'] == '1111'
+    assert len(transport.requests) == 1
+
+
+def test_refund_invalidates():
+    transport = MemoryTransport([TRANSACTION_DETAILS_RESPONSE, CHARGE_RESPONSE, TRANSACTION_DETAILS_RESPONSE])
+    cached_gateway(transport)
+
+    transaction = dinero.Transaction.retrieve('2200000001', gateway_name='cached')
+    # capturedPendingSettlement, so this is a void
+    transaction.refund()
+    dinero.Transaction.retrieve('2200000001', gateway_name='cached')
+
+    assert len(transport.requests) == 3
+
+
+def charge_customer(customer):
+    return dinero.Transaction.create(12, customer=customer, gateway_name='cached')
+
+
+def test_charge_customer_looks_up_card_once():
+    transport = MemoryTransport([CUSTOMER_PROFILE_RESPONSE, CHARGE_CUSTOMER_RESPONSE, CHARGE_CUSTOMER_RESPONSE])
+    gateway = cached_gateway(transport)
+    customer = dinero.Customer('cached', '10000001')
+
+    charge_customer(customer)
+    charge_customer(customer)
+
+    assert len(transport.requests) == 3
+    assert gateway.cache.saved_round_trips == 1
+
+
+def test_customer_save_invalidates():
+    transport = MemoryTransport([
+        CUSTOMER_PROFILE_RESPONSE,
+        # save
+        OK_RESPONSE,
+        # charge
+        CUSTOMER_PROFILE_RESPONSE,
+        CHARGE_CUSTOMER_RESPONSE,
+    ])
+    gateway = cached_gateway(transport)
+
+    dinero.Customer.retrieve('10000001', gateway_name='cached')
+    dinero.Customer('cached', '10000001', email='joey@example.com').save()
+    charge_customer(dinero.Customer('cached', '10000001'))
+
+    assert len(transport.requests) == 4
+    assert gateway.cache.saved_round_trips == 0
+
+
+def test_gateway_with_shared_backend():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'cache.sqlite3')
+        transport = MemoryTransport([TRANSACTION_DETAILS_RESPONSE])
+        cached_gateway(transport, backend='sqlite', path=path)
+        first = dinero.Transaction.retrieve('2200000001', gateway_name='cached')
+
+        # a worker in another process, with its own gateway
+        cached_gateway(MemoryTransport(), backend='sqlite', path=path)
+        second = dinero.Transaction.retrieve('2200000001', gateway_name='cached')
+
+        assert second.to_dict() == first.to_dict()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def check_cached_like_uncached(**cache):
+    transport = MemoryTransport([TRANSACTION_DETAILS_RESPONSE, CUSTOMER_PROFILE_RESPONSE] * 2)
+
+    def retrieve():
+        transaction = dinero.Transaction.retrieve('2200000001', gateway_name='cached')
+        return gateway.retrieve_customer('10000001'), transaction.to_dict()
+
+    gateway = cached_gateway(transport)
+    gateway.cache = None
+    uncached = retrieve()
+    gateway = cached_gateway(transport, **cache)
+    retrieve()
+    cached = retrieve()
+
+    assert len(transport.requests) == 4
+    assert cached == uncached
+    # down to the types, like the (customer, cards) tuple
+    assert repr(cached) == repr(uncached)
+
+
+def test_cached_like_uncached():
+    check_cached_like_uncached()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        check_cached_like_uncached(backend='sqlite', path=os.path.join(tmpdir, 'cache.sqlite3'))
+        check_cached_like_uncached(backend='shared_memory', path=os.path.join(tmpdir, 'cache.mmap'))
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,175 @@
+import sys
+import threading
+import time
+
+import pytest
+
+import dinero
+from dinero.capture import Capture, read_capture, scrub_xml
+from dinero.emulator import Emulator
+from dinero.exceptions import PaymentException
+from dinero.gateways.transport import MemoryTransport
+from dinero.replay import Replay, replacement_number, replay
+
+CARD = {'number': '4' + '1' * 15, 'month': '12', 'year': '2030', 'cvv': '123'}
+
+
+def captured_gateway(path, emulator):
+    dinero.configure({
+        'captured': {
+            'type': 'dinero.gateways.AuthorizeNet',
+            'login_id': 'login',
+            'transaction_key': 'secret',
+            'transport': MemoryTransport(lambda url, data: emulator.handle(data)),
+            'capture': path if isinstance(path, Capture) else str(path),
+        }
+    })
+    gateway = dinero.get_gateway('captured')
+    gateway.url = gateway.test_url
+    return gateway
+
+
+def test_scrub_xml():
+    scrubbed = scrub_xml(b'<name>login</name><transactionKey>secret</transactionKey>'
+                         b'<cardNumber>4111111111111111</cardNumber><cardCode>123</cardCode>')
+    assert scrubbed == ('<name>login</name><transactionKey>XXX</transactionKey>'
+                        '<cardNumber>4XXXXXXXXX1111</cardNumber><cardCode>XXX</cardCode>')
+
+
+def test_capture(tmpdir):
+    path = tmpdir.join('capture.jsonl')
+    captured_gateway(path, Emulator())
+    transaction = dinero.Transaction.create(12, gateway_name='captured', **CARD)
+    try:
+        dinero.Transaction.create(12, gateway_name='captured', **dict(CARD, number='4000000000000002'))
+    except PaymentException:
+        pass
+
+    exchanges = list(read_capture(str(path)))
+    assert len(exchanges) == 2
+    charge = exchanges[0]
+    assert set(charge) == set(['time', 'url', 'seconds', 'request', 'response', 'error'])
+    assert '4111111111111111' not in charge['request']
+    assert 'secret' not in charge['request']
+    assert '<cardCode>XXX</cardCode>' in charge['request']
+    assert transaction.transaction_id in charge['response']
+    assert '<code>E00027</code>' in exchanges[1]['response']
+
+
+def test_capture_errors(tmpdir):
+    capture = Capture(str(tmpdir.join('capture.jsonl')))
+    capture.record('http://example.com', b'<request/>', None, 1.5, ValueError())
+    exchange, = read_capture(capture.path)
+    assert exchange['error'] == 'ValueError'
+    assert exchange['response'] is None
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason='asyncio API requires Python 3.5')
+def test_async_capture_is_written_off_the_loop(tmpdir):
+    import asyncio
+    from dinero.gateways.aio import AsyncMemoryTransport
+
+    class ThreadCapture(Capture):
+        threads = []
+
+        def record(self, *args, **kwargs):
+            self.threads.append(threading.current_thread())
+            return super(ThreadCapture, self).record(*args, **kwargs)
+
+    emulator = Emulator()
+    capture = ThreadCapture(str(tmpdir.join('capture.jsonl')))
+    gateway = captured_gateway(capture, emulator)
+    gateway.options['async_transport'] = AsyncMemoryTransport(lambda url, data: emulator.handle(data))
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        transaction = loop.run_until_complete(dinero.Transaction.acreate(12, gateway_name='captured', **CARD))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+    exchange, = read_capture(capture.path)
+    assert transaction.transaction_id in exchange['response']
+    assert ThreadCapture.threads and threading.current_thread() not in ThreadCapture.threads
+
+
+def test_replacement_number():
+    assert replacement_number('4', '0002') == '4000000000000002'
+    assert replacement_number('5', '4444').endswith('4444')
+
+
+def test_replay(tmpdir):
+    path = tmpdir.join('capture.jsonl')
+    captured_gateway(path, Emulator())
+    transaction = dinero.Transaction.create(12, gateway_name='captured', **CARD)
+    dinero.Transaction.retrieve(transaction.transaction_id, gateway_name='captured')
+    customer = dinero.Customer.create(gateway_name='captured', email='joey@example.com', **CARD)
+    dinero.Transaction.create(12, customer=customer, gateway_name='captured')
+    dinero.Customer.retrieve(customer.customer_id, gateway_name='captured')
+    try:
+        dinero.Transaction.create(12, gateway_name='captured', **dict(CARD, number='4000000000000002'))
+    except PaymentException:
+        pass
+
+    # the replayed objects get different ids than the captured ones
+    target = Emulator('login', 'key')
+    target.handle(Replay().request(next(read_capture(str(path)))['request']))
+    target.handle(Replay().request(list(read_capture(str(path)))[2]['request']).replace(b'joey@', b'other@'))
+
+    report = replay(read_capture(str(path)), target.handle, speed=1000, concurrency=1)
+    assert report.requests == 6
+    assert report.errors == {'E00027': 1}
+    assert len(target.transactions) == 3
+    # charged the replayed customer, not the one that has the captured id
+    customer_ids = set(t.customer['id'] for t in target.transactions.values() if t.customer)
+    assert customer_ids == set([str(int(customer.customer_id) + 1)])
+    assert 'requests:   6' in report.summary()
+
+
+def test_replay_waits_for_created_ids(tmpdir):
+    path = tmpdir.join('capture.jsonl')
+    captured_gateway(path, Emulator())
+    for _ in range(4):
+        # not settled, so the refund fails and it is voided
+        dinero.Transaction.create(12, gateway_name='captured', **CARD).refund()
+    dinero.Transaction.retrieve('2200000001', gateway_name='captured')
+
+    target = Emulator('login', 'key')
+    # so that the replayed ids differ from the captured ones
+    target.handle(Replay().request(next(read_capture(str(path)))['request']))
+
+    def post(data):
+        if b'authCaptureTransaction' in data:
+            time.sleep(0.05)
+        return target.handle(data)
+
+    report = replay(read_capture(str(path)), post, speed=1000, concurrency=8)
+    assert report.requests == 13
+    # the refunds that the captured voids followed
+    assert report.errors == {'E00027': 4}
+    assert set(t.status for t in target.transactions.values()) == set(['voided', 'capturedPendingSettlement'])
+    # the retrieve's id was created by the first charge
+    assert report.unmapped == 0
+
+    report = replay(iter([{'time': 0, 'request': Replay().request(
+        '<getTransactionDetailsRequest><transId>2200000001</transId></getTransactionDetailsRequest>').decode()}]),
+        target.handle)
+    assert report.unmapped == 1
+    assert 'unmapped:   1' in report.summary()
+
+
+def test_replay_survives_bad_exchanges():
+    target = Emulator('login', 'key')
+    exchange = {
+        'time': 0,
+        'request': '<getTransactionDetailsRequest><transId>1</transId></getTransactionDetailsRequest>',
+        }
+    # a response that can't be read, then more exchanges than the queue
+    # holds, so that a dead worker would hang the replay
+    exchanges = [dict(exchange, response=12)] + [exchange] * 150 + [{'time': 0}]
+
+    report = replay(exchanges, target.handle, speed=1000, concurrency=1)
+    assert report.requests == 152
+    assert report.errors['TypeError'] == 1
+    assert report.errors['KeyError'] == 1
@@ -0,0 +1,61 @@
+from lxml import etree
+
+from dinero.exceptions import DineroException
+from dinero.gateways.authorizenet_gateway import decode_response, parse_xml_response, xml_to_dict
+from dinero.gateways.transport import MemoryTransport
+
+from .fixtures import (
+        AUTHENTICATION_ERROR_RESPONSE,
+        CHARGE_CUSTOMER_RESPONSE,
+        CHARGE_RESPONSE,
+        CUSTOMER_NOT_FOUND_RESPONSE,
+        CUSTOMER_PROFILE_RESPONSE,
+        DECLINED_RESPONSE,
+        INVALID_TRANSACTION_RESPONSE,
+        TRANSACTION_DETAILS_RESPONSE,
+        memory_gateway,
+        )
+
+
+def outcome(handler, resp):
+    try:
+        return handler(resp)
+    except DineroException as e:
+        return type(e), repr(e), repr(getattr(e, 'errors', None))
+
+
+def assert_same(handler, response):
+    root = parse_xml_response(response)
+    assert outcome(handler, decode_response(root)) == outcome(handler, xml_to_dict(root))
+
+
+def test_unknown_responses_use_xml_to_dict():
+    root = etree.XML(b'<deleteCustomerProfileResponse><messages><resultCode>Ok</resultCode></messages></deleteCustomerProfileResponse>')
+    assert decode_response(root) == xml_to_dict(root)
+
+
+def test_charge_responses():
+    gateway = memory_gateway(MemoryTransport())
+    for response in [CHARGE_RESPONSE, DECLINED_RESPONSE, INVALID_TRANSACTION_RESPONSE, AUTHENTICATION_ERROR_RESPONSE]:
+        assert_same(lambda resp: gateway._handle_charge(resp, 12), response)
+        assert_same(gateway._handle_ok, response)
+        assert_same(gateway._handle_probe, response)
+
+
+def test_retrieve_response():
+    gateway = memory_gateway(MemoryTransport())
+    assert_same(gateway._handle_retrieve, TRANSACTION_DETAILS_RESPONSE)
+    transaction = gateway._handle_retrieve(decode_response(parse_xml_response(TRANSACTION_DETAILS_RESPONSE)))
+    assert transaction['customer_id'] == 123
+    assert transaction['avs_successful']
+
+
+def test_charge_customer_response():
+    gateway = memory_gateway(MemoryTransport())
+    assert_same(lambda resp: gateway._handle_charge_customer(resp, 12), CHARGE_CUSTOMER_RESPONSE)
+
+
+def test_customer_profile_responses():
+    gateway = memory_gateway(MemoryTransport())
+    for response in [CUSTOMER_PROFILE_RESPONSE, CUSTOMER_NOT_FOUND_RESPONSE]:
+        assert_same(gateway._handle_retrieve_customer, response)
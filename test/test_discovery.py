@@ -0,0 +1,147 @@
+import json
+import os
+import shutil
+import tempfile
+
+import pytest
+
+import dinero
+from dinero.gateways.authorizenet_gateway import read_discovery_cache
+from dinero.gateways.transport import MemoryTransport
+
+from .fixtures import AUTHENTICATION_ERROR_RESPONSE, CHARGE_RESPONSE, INVALID_TRANSACTION_RESPONSE
+
+
+def configure(transport, **options):
+    conf = {
+        'type': 'dinero.gateways.AuthorizeNet',
+        'login_id': 'login',
+        'transaction_key': 'key',
+        'transport': transport,
+    }
+    conf.update(options)
+    dinero.configure({'discovery': conf})
+    return dinero.get_gateway('discovery')
+
+
+def charge():
+    return dinero.Transaction.create(12, number='4' + '1' * 15, month='12', year='2030', gateway_name='discovery')
+
+
+def test_discovery_probes_both_endpoints():
+    transport = MemoryTransport([AUTHENTICATION_ERROR_RESPONSE, INVALID_TRANSACTION_RESPONSE, CHARGE_RESPONSE])
+    gateway = configure(transport)
+    charge()
+    assert gateway.url == gateway.live_url
+    assert [url for url, data in transport.requests] == [gateway.test_url, gateway.live_url, gateway.live_url]
+
+
+def test_environment_skips_discovery():
+    transport = MemoryTransport([CHARGE_RESPONSE])
+    gateway = configure(transport, environment='production')
+    charge()
+    assert [url for url, data in transport.requests] == [gateway.live_url]
+
+
+def test_unknown_environment():
+    try:
+        configure(MemoryTransport(), environment='staging')
+    except dinero.exceptions.DineroException:
+        pass
+    else:
+        assert False, 'DineroException expected'
+
+
+def test_discovery_cache():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'endpoints.json')
+
+        transport = MemoryTransport([INVALID_TRANSACTION_RESPONSE])
+        gateway = configure(transport, discovery_cache=path)
+        assert gateway.url == gateway.test_url
+        assert read_discovery_cache(path) == {'login': gateway.test_url}
+
+        # a new process finds the endpoint in the cache
+        transport = MemoryTransport([CHARGE_RESPONSE])
+        gateway = configure(transport, discovery_cache=path)
+        charge()
+        assert [url for url, data in transport.requests] == [gateway.test_url]
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_corrupt_discovery_cache_is_ignored():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'endpoints.json')
+        with open(path, 'w') as f:
+            f.write('{not json')
+
+        transport = MemoryTransport([INVALID_TRANSACTION_RESPONSE])
+        gateway = configure(transport, discovery_cache=path)
+        assert gateway.url == gateway.test_url
+        with open(path) as f:
+            assert json.load(f) == {'login': gateway.test_url}
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_warmup():
+    transport = MemoryTransport([INVALID_TRANSACTION_RESPONSE, CHARGE_RESPONSE])
+    configure(transport, warmup=True)
+    assert len(transport.requests) == 1
+
+    charge()
+    assert len(transport.requests) == 2
+
+
+def test_stale_discovery_cache_is_rediscovered():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'endpoints.json')
+        with open(path, 'w') as f:
+            json.dump({'login': 'https://api2.authorize.net/xml/v1/request.api'}, f)
+
+        # the account isn't at the cached endpoint, it's a sandbox account
+        transport = MemoryTransport([AUTHENTICATION_ERROR_RESPONSE, INVALID_TRANSACTION_RESPONSE, CHARGE_RESPONSE])
+        gateway = configure(transport, discovery_cache=path)
+        charge()
+        assert [url for url, data in transport.requests] == [gateway.live_url, gateway.test_url, gateway.test_url]
+        assert read_discovery_cache(path) == {'login': gateway.test_url}
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_authentication_error_after_the_cached_endpoint_worked():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'endpoints.json')
+        with open(path, 'w') as f:
+            json.dump({'login': 'https://apitest.authorize.net/xml/v1/request.api'}, f)
+
+        transport = MemoryTransport([CHARGE_RESPONSE, AUTHENTICATION_ERROR_RESPONSE])
+        gateway = configure(transport, discovery_cache=path)
+        charge()
+        # only the first response can send it back to discovery
+        with pytest.raises(dinero.exceptions.GatewayException):
+            charge()
+        assert len(transport.requests) == 2
+        assert read_discovery_cache(path) == {'login': gateway.test_url}
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_default_discovery_cache_is_per_user(monkeypatch):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        monkeypatch.setenv('XDG_CACHE_HOME', tmpdir)
+        transport = MemoryTransport([INVALID_TRANSACTION_RESPONSE])
+        gateway = configure(transport, discovery_cache=True)
+        assert gateway.discovery_cache == os.path.join(tmpdir, 'dinero', 'authorizenet.json')
+
+        gateway.warmup()
+        assert read_discovery_cache(gateway.discovery_cache) == {'login': gateway.test_url}
+        assert os.stat(os.path.dirname(gateway.discovery_cache)).st_mode & 0o777 == 0o700
+    finally:
+        shutil.rmtree(tmpdir)
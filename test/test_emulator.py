@@ -0,0 +1,159 @@
+import errno
+
+import pytest
+
+import dinero
+from dinero.emulator import Emulator, EmulatorServer, luhn_valid, parse_expiration
+from dinero.exceptions import (
+        CardDeclinedError,
+        CustomerNotFoundError,
+        DuplicateCardError,
+        DuplicateCustomerError,
+        ExpiryError,
+        GatewayException,
+        InvalidCardError,
+        PaymentException,
+        )
+
+CARD = {'number': '4' + '1' * 15, 'month': '12', 'year': '2030'}
+
+
+@pytest.fixture
+def emulator():
+    server = EmulatorServer(Emulator('login', 'key')).start()
+    dinero.configure({
+        'emulated': {
+            'type': 'dinero.gateways.AuthorizeNet',
+            'login_id': 'login',
+            'transaction_key': 'key',
+        }
+    })
+    dinero.get_gateway('emulated').url = server.url
+    try:
+        yield server.emulator
+    finally:
+        server.stop()
+
+
+def test_card_checks():
+    assert luhn_valid('4111111111111111')
+    assert not luhn_valid('4111111111111112')
+    assert parse_expiration('2030-12') == (2030, 12)
+    assert parse_expiration('1230') == (2030, 12)
+    assert parse_expiration('2030-13') is None
+
+
+def test_charge_retrieve_refund(emulator):
+    transaction = dinero.Transaction.create(12, gateway_name='emulated', email='joey@example.com', **CARD)
+    assert transaction.last_4 == '1111'
+    assert transaction.card_type == 'Visa'
+
+    same = dinero.Transaction.retrieve(transaction.transaction_id, gateway_name='emulated')
+    assert same.status == 'capturedPendingSettlement'
+    assert same.email == 'joey@example.com'
+
+    # voided, because it hasn't settled
+    same.refund()
+    assert dinero.Transaction.retrieve(transaction.transaction_id, gateway_name='emulated').status == 'voided'
+
+    transaction = dinero.Transaction.create(12, gateway_name='emulated', **CARD)
+    emulator.settle_batch()
+    transaction = dinero.Transaction.retrieve(transaction.transaction_id, gateway_name='emulated')
+    assert transaction.status == 'settledSuccessfully'
+    transaction.refund(5)
+    with pytest.raises(PaymentException):
+        transaction.refund(10)
+
+
+def test_authorize_then_settle(emulator):
+    transaction = dinero.Transaction.create(12, settle=False, gateway_name='emulated', **CARD)
+    transaction.settle(10)
+    transaction = dinero.Transaction.retrieve(transaction.transaction_id, gateway_name='emulated')
+    assert transaction.status == 'capturedPendingSettlement'
+
+
+def test_settlement_delay(emulator):
+    emulator.settlement_delay = 0
+    transaction = dinero.Transaction.create(12, gateway_name='emulated', **CARD)
+    transaction = dinero.Transaction.retrieve(transaction.transaction_id, gateway_name='emulated')
+    assert transaction.status == 'settledSuccessfully'
+
+
+@pytest.mark.parametrize('options, error', [
+    ({'number': '4000000000000002'}, CardDeclinedError),
+    ({'number': '4111111111111112'}, InvalidCardError),
+    ({'year': '2001'}, ExpiryError),
+])
+def test_declines(emulator, options, error):
+    with pytest.raises(PaymentException) as e:
+        dinero.Transaction.create(12, gateway_name='emulated', **dict(CARD, **options))
+    assert error in e.value
+
+
+def test_bad_credentials(emulator):
+    dinero.get_gateway('emulated').transaction_key = 'wrong'
+    with pytest.raises(GatewayException) as e:
+        dinero.Transaction.create(12, gateway_name='emulated', **CARD)
+    assert e.value.args[0][0][0] == 'E00007'
+
+
+def test_customer_lifecycle(emulator):
+    customer = dinero.Customer.create(gateway_name='emulated', email='joey@example.com', first_name='Joey', **CARD)
+    assert customer.card_id
+
+    with pytest.raises(DuplicateCustomerError) as e:
+        dinero.Customer.create(gateway_name='emulated', email='joey@example.com', **CARD)
+    assert e.value.customer_id == customer.customer_id
+
+    card = customer.add_card(gateway_name='emulated', number='5555555555554444', month='12', year='2030', first_name='Joey')
+    with pytest.raises(DuplicateCardError):
+        customer.add_card(gateway_name='emulated', number='5555555555554444', month='12', year='2030', first_name='Joey')
+
+    customer = dinero.Customer.retrieve(customer.customer_id, gateway_name='emulated')
+    assert [c.last_4 for c in customer.cards] == ['1111', '4444']
+    assert customer.first_name == 'Joey'
+
+    transaction = dinero.Transaction.create(12, customer=customer, gateway_name='emulated')
+    assert transaction.last_4 == '1111'
+    transaction = dinero.Transaction.create(12, cc=customer.cards[1], gateway_name='emulated')
+    assert transaction.card_type == 'MasterCard'
+    transaction = dinero.Transaction.retrieve(transaction.transaction_id, gateway_name='emulated')
+    assert transaction.customer_id == int(customer.customer_id)
+
+    customer.email = 'joey@example.org'
+    customer.last_name = 'Shabadoo'
+    customer.save()
+    customer = dinero.Customer.retrieve(customer.customer_id, gateway_name='emulated')
+    assert customer.email == 'joey@example.org'
+    assert customer.last_name == 'Shabadoo'
+
+    card.delete()
+    assert len(dinero.Customer.retrieve(customer.customer_id, gateway_name='emulated').cards) == 1
+
+    customer_id = customer.customer_id
+    customer.delete()
+    with pytest.raises(CustomerNotFoundError):
+        dinero.Customer.retrieve(customer_id, gateway_name='emulated')
+
+
+def test_unknown_request():
+    response = Emulator().handle(b'<fooRequest xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd"/>')
+    assert b'<code>E00003</code>' in response
+
+
+def test_disconnected_clients_are_quiet(capsys):
+    server = EmulatorServer(Emulator('login', 'key'))
+    try:
+        try:
+            raise IOError(errno.EPIPE, 'Broken pipe')
+        except IOError:
+            server.handle_error(None, ('127.0.0.1', 0))
+        assert capsys.readouterr().err == ''
+
+        try:
+            raise ValueError('bug')
+        except ValueError:
+            server.handle_error(None, ('127.0.0.1', 0))
+        assert 'ValueError' in capsys.readouterr().err
+    finally:
+        server.server_close()
@@ -0,0 +1,186 @@
+import sys
+import threading
+
+import pytest
+
+import dinero
+from dinero.exceptions import (
+        CardDeclinedError,
+        CustomerNotFoundError,
+        DineroException,
+        DuplicateCustomerError,
+        GatewayTimeout,
+        PaymentException,
+        )
+from dinero.gateways.fake import latency_from_options
+
+CARD = {'number': '4' + '1' * 15, 'month': '12', 'year': '2030'}
+
+
+def fake_gateway(**options):
+    options.update({'type': 'dinero.gateways.Fake'})
+    dinero.configure({'fake': options})
+    return dinero.get_gateway('fake')
+
+
+def test_charge_retrieve_refund():
+    gateway = fake_gateway()
+    transaction = dinero.Transaction.create(12, gateway_name='fake', **CARD)
+    assert transaction.last_4 == '1111'
+    assert transaction.card_type == 'Visa'
+    assert transaction.status == 'capturedPendingSettlement'
+
+    same = dinero.Transaction.retrieve(transaction.transaction_id, gateway_name='fake')
+    assert same == transaction
+    assert same.price == 12
+
+    # not settled yet, so it is voided
+    transaction.refund()
+    assert dinero.Transaction.retrieve(transaction.transaction_id, gateway_name='fake').status == 'voided'
+
+    transaction = dinero.Transaction.create(12, gateway_name='fake', **CARD)
+    batch_id = gateway.settle_batch()
+    assert [t.transaction_id for t in dinero.Transaction.iter_batch(batch_id, gateway_name='fake')] == [
+        transaction.transaction_id]
+    assert list(dinero.Transaction.iter_batch(gateway.settle_batch(), gateway_name='fake')) == []
+    transaction = dinero.Transaction.retrieve(transaction.transaction_id, gateway_name='fake')
+    transaction.refund(5)
+    transaction.refund(7)
+    with pytest.raises(PaymentException):
+        transaction.refund(1)
+
+
+def test_authorize_then_settle():
+    fake_gateway()
+    transaction = dinero.Transaction.create(12, settle=False, gateway_name='fake', **CARD)
+    assert transaction.status == 'authorizedPendingCapture'
+    transaction.settle(10)
+    transaction = dinero.Transaction.retrieve(transaction.transaction_id, gateway_name='fake')
+    assert transaction.status == 'capturedPendingSettlement'
+    assert transaction.price == 10
+
+
+def test_declines():
+    fake_gateway(decline_rate=1)
+    with pytest.raises(PaymentException) as e:
+        dinero.Transaction.create(12, gateway_name='fake', **CARD)
+    assert CardDeclinedError in e.value
+
+    fake_gateway()
+    with pytest.raises(PaymentException) as e:
+        dinero.Transaction.create(12, gateway_name='fake', number='4000000000000002', month='12', year='2030')
+    assert CardDeclinedError in e.value
+
+
+def test_error_mix_is_reproducible():
+    def outcomes():
+        fake_gateway(errors={'CardDeclinedError': 0.3, 'GatewayTimeout': 0.1}, seed=42)
+        results = []
+        for _ in range(200):
+            try:
+                dinero.Transaction.create(12, gateway_name='fake', **CARD)
+                results.append('ok')
+            except PaymentException:
+                results.append('declined')
+            except GatewayTimeout:
+                results.append('timeout')
+        return results
+
+    results = outcomes()
+    assert results == outcomes()
+    assert 30 < results.count('declined') < 90
+    assert 5 < results.count('timeout') < 40
+
+
+def test_bad_options():
+    with pytest.raises(DineroException):
+        fake_gateway(errors={'NoSuchError': 0.1})
+    with pytest.raises(DineroException):
+        fake_gateway(errors={'CardDeclinedError': 0.8, 'CVVError': 0.3})
+    with pytest.raises(DineroException):
+        latency_from_options({'distribution': 'lognormal', 'median': 0.1})
+
+
+def test_latency_and_deadline():
+    fake_gateway(latency=0.5)
+    with pytest.raises(GatewayTimeout):
+        with dinero.deadline(0.01):
+            dinero.Transaction.create(12, gateway_name='fake', **CARD)
+
+    sample = latency_from_options({'distribution': 'uniform', 'min': 0.1, 'max': 0.2})
+    import random
+    assert all(0.1 <= sample(random.Random(i)) <= 0.2 for i in range(100))
+
+
+def test_customers_and_cards():
+    fake_gateway()
+    customer = dinero.Customer.create(gateway_name='fake', email='joey@example.com', first_name='Joey', **CARD)
+    assert customer.card_id
+
+    with pytest.raises(DuplicateCustomerError) as e:
+        dinero.Customer.create(gateway_name='fake', email='joey@example.com', **CARD)
+    assert e.value.customer_id == customer.customer_id
+
+    card = customer.add_card(gateway_name='fake', number='5' + '5' * 15, month='12', year='2030', first_name='Joey')
+    customer = dinero.Customer.retrieve(customer.customer_id, gateway_name='fake')
+    assert [c.last_4 for c in customer.cards] == ['1111', '5555']
+    assert customer.first_name == 'Joey'
+
+    transaction = dinero.Transaction.create(12, customer=customer, gateway_name='fake')
+    assert transaction.last_4 == '1111'
+    transaction = dinero.Transaction.create(12, cc=customer.cards[1], gateway_name='fake')
+    assert transaction.card_type == 'MasterCard'
+
+    customer.email = 'joey@example.org'
+    customer.save()
+    assert dinero.Customer.retrieve(customer.customer_id, gateway_name='fake').email == 'joey@example.org'
+    # the old email is free, the new one isn't
+    other = dinero.Customer.create(gateway_name='fake', email='joey@example.com')
+    with pytest.raises(DuplicateCustomerError):
+        dinero.Customer.create(gateway_name='fake', email='joey@example.org')
+    other.email = 'joey@example.org'
+    with pytest.raises(DuplicateCustomerError):
+        other.save()
+
+    customer.cards[0].delete()
+    assert dinero.Customer.retrieve(customer.customer_id, gateway_name='fake').card_id == card.card_id
+
+    customer_id = customer.customer_id
+    customer.delete()
+    with pytest.raises(CustomerNotFoundError):
+        dinero.Customer.retrieve(customer_id, gateway_name='fake')
+    dinero.Customer.create(gateway_name='fake', email='joey@example.org')
+
+
+def test_threads():
+    gateway = fake_gateway(max_transactions=1000)
+    ids = []
+
+    def charge():
+        for _ in range(500):
+            ids.append(dinero.Transaction.create(12, gateway_name='fake', **CARD).transaction_id)
+
+    threads = [threading.Thread(target=charge) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(ids)) == 4000
+    assert len(gateway._transactions) == 1000
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason='asyncio API requires Python 3.5')
+def test_async():
+    import asyncio
+
+    fake_gateway(latency=0.01)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        transactions = loop.run_until_complete(asyncio.gather(*[
+            dinero.Transaction.acreate(12, gateway_name='fake', **CARD) for _ in range(20)]))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+    assert len(set(t.transaction_id for t in transactions)) == 20
@@ -0,0 +1,81 @@
+import gc
+
+import dinero
+from dinero.gateways.transport import MemoryTransport
+from dinero.identity import IdentityMap
+
+from .fixtures import CUSTOMER_PROFILE_RESPONSE, OK_RESPONSE, TRANSACTION_DETAILS_RESPONSE
+
+
+def mapped_gateway(transport):
+    dinero.configure({
+        'mapped': {
+            'type': 'dinero.gateways.AuthorizeNet',
+            'login_id': 'login',
+            'transaction_key': 'key',
+            'environment': 'sandbox',
+            'transport': transport,
+            'identity_map': True,
+        }
+    })
+    return dinero.get_gateway('mapped')
+
+
+def test_retrieve_returns_live_object():
+    transport = MemoryTransport([TRANSACTION_DETAILS_RESPONSE] * 2)
+    gateway = mapped_gateway(transport)
+
+    transaction = dinero.Transaction.retrieve('2200000001', gateway_name='mapped')
+    transaction.status = 'voided'
+    transaction.note = 'kept'
+    again = dinero.Transaction.retrieve('2200000001', gateway_name='mapped')
+
+    assert again is transaction
+    # refreshed from the gateway, local extras kept
+    assert transaction.status == 'capturedPendingSettlement'
+    assert transaction.note == 'kept'
+    assert len(transport.requests) == 2
+    assert len(gateway.identity_map) == 1
+
+    del transaction, again
+    gc.collect()
+    assert len(gateway.identity_map) == 0
+
+
+def test_without_identity_map():
+    transport = MemoryTransport([TRANSACTION_DETAILS_RESPONSE] * 2)
+    dinero.configure({
+        'unmapped': {
+            'type': 'dinero.gateways.AuthorizeNet',
+            'login_id': 'login',
+            'transaction_key': 'key',
+            'environment': 'sandbox',
+            'transport': transport,
+        }
+    })
+    first = dinero.Transaction.retrieve('2200000001', gateway_name='unmapped')
+    second = dinero.Transaction.retrieve('2200000001', gateway_name='unmapped')
+    assert first is not second
+    assert first == second
+    assert len(set([first, second])) == 1
+
+
+def test_customer_retrieve_and_delete():
+    transport = MemoryTransport([CUSTOMER_PROFILE_RESPONSE, CUSTOMER_PROFILE_RESPONSE, OK_RESPONSE])
+    gateway = mapped_gateway(transport)
+
+    customer = dinero.Customer.retrieve('10000001', gateway_name='mapped')
+    assert dinero.Customer.retrieve('10000001', gateway_name='mapped') is customer
+    assert len(customer.cards) == 1
+
+    customer.delete()
+    assert gateway.identity_map.get('customer', '10000001') is None
+
+
+def test_merge():
+    identity_map = IdentityMap()
+    first = dinero.Transaction('memory', 12, '1', status='a')
+    assert identity_map.merge('transaction', '1', first) is first
+    second = dinero.Transaction('memory', 12, '1', status='b')
+    assert identity_map.merge('transaction', '1', second) is first
+    assert first.status == 'b'
@@ -0,0 +1,80 @@
+import logging
+
+import dinero
+from dinero.log import CallMessage, log, log_in_background, logger, scrub
+
+
+class Counted(object):
+    reprs = 0
+
+    def __repr__(self):
+        Counted.reprs += 1
+        return 'Counted()'
+
+
+@log
+def charge(*args, **kwargs):
+    return True
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_disabled_logger_skips_formatting():
+    level = logger.level
+    logger.setLevel(logging.WARNING)
+    try:
+        Counted.reprs = 0
+        assert charge(Counted())
+        assert Counted.reprs == 0
+    finally:
+        logger.setLevel(level)
+
+
+def test_message_is_scrubbed():
+    message = CallMessage(charge, (), {'number': '4111-1111-1111-1111'}, 0.5)
+    assert str(message) == "charge(number='4XXXXXXXXX1111') took 0.5 seconds"
+    assert scrub('4111 1111 1111 1111') == '4XXXXXXXXX1111'
+
+
+def test_message_is_a_snapshot():
+    options = {'number': '4111111111111111', 'cvv': '900'}
+    message = CallMessage(charge, (options,), {}, 0.5)
+    options['number'] = '4222222222222222'
+    options['price'] = 10
+    assert '4111111111111111' not in message.call
+    assert '900' not in message.call
+    assert str(message) in (
+        "charge({'number': '4XXXXXXXXX1111', 'cvv': 'XXX'}) took 0.5 seconds",
+        "charge({'cvv': 'XXX', 'number': '4XXXXXXXXX1111'}) took 0.5 seconds",
+        )
+
+
+def test_log_in_background():
+    handler = ListHandler()
+    level, propagate, handlers = logger.level, logger.propagate, logger.handlers[:]
+    logger.setLevel(logging.INFO)
+    listener = log_in_background([handler])
+    try:
+        charge(number='4111111111111111')
+        changing = []
+        logger.info('changed %r', changing)
+        changing.append('x')
+    finally:
+        listener.stop()
+        for h in logger.handlers[:]:
+            logger.removeHandler(h)
+        for h in handlers:
+            logger.addHandler(h)
+        logger.setLevel(level)
+        logger.propagate = propagate
+
+    assert handler.messages[0].startswith("charge(number='4XXXXXXXXX1111') took ")
+    # other records are formatted before they are queued
+    assert handler.messages[1:] == ['changed []']
@@ -0,0 +1,97 @@
+import dinero
+from dinero.exceptions import CardDeclinedError, PaymentException
+from dinero.gateways.transport import MemoryTransport
+from dinero.metrics import Registry, Measurement, current_operation, registry
+
+from .fixtures import CHARGE_RESPONSE, CUSTOMER_PROFILE_RESPONSE, CHARGE_CUSTOMER_RESPONSE, DECLINED_RESPONSE, memory_gateway
+
+CARD = {'number': '4' + '1' * 15, 'month': '12', 'year': '2030'}
+
+
+def test_gateway_operations_are_recorded():
+    registry.clear()
+    measurements = []
+    registry.add_sink(measurements.append)
+    try:
+        memory_gateway(MemoryTransport([CHARGE_RESPONSE, DECLINED_RESPONSE]))
+        dinero.Transaction.create(12, gateway_name='memory', **CARD)
+        try:
+            dinero.Transaction.create(12, gateway_name='memory', **CARD)
+        except PaymentException as e:
+            assert CardDeclinedError in e
+        else:
+            assert False, 'PaymentException not raised'
+    finally:
+        registry.remove_sink(measurements.append)
+
+    assert [(m.gateway, m.operation) for m in measurements] == [('memory', 'charge')] * 2
+    assert measurements[0].exception is None
+    assert isinstance(measurements[1].exception, PaymentException)
+    assert measurements[0].sent > 0
+    assert measurements[0].received == len(CHARGE_RESPONSE)
+
+    assert registry.latency[('memory', 'charge')].count == 2
+    assert registry.errors == {('memory', 'charge', 'CardDeclinedError'): 1}
+    assert registry.traffic[('memory', 'charge')][1] == len(CHARGE_RESPONSE) + len(DECLINED_RESPONSE)
+
+
+def test_nested_operations_are_recorded_once():
+    registry.clear()
+    gateway = memory_gateway(MemoryTransport([CUSTOMER_PROFILE_RESPONSE, CHARGE_CUSTOMER_RESPONSE]))
+    # charge -> charge_customer -> retrieve_customer
+    gateway.charge(12, {'customer': dinero.Customer('memory', '10000001')})
+
+    assert list(registry.latency) == [('memory', 'charge')]
+    assert registry.traffic[('memory', 'charge')][1] == len(CUSTOMER_PROFILE_RESPONSE) + len(CHARGE_CUSTOMER_RESPONSE)
+
+
+def test_render_prometheus():
+    metrics = Registry(buckets=(0.1, 1.0))
+    metrics.record(Measurement('a "b"', 'charge', 0.5, 100, 200, None, {'network': 0.25}))
+    metrics.record(Measurement('a "b"', 'charge', 2, 100, 200, CardDeclinedError(), {'network': 1.0}))
+
+    text = metrics.render_prometheus()
+    assert '# TYPE dinero_operation_seconds histogram\n' in text
+    assert 'dinero_operation_seconds_bucket{gateway="a \\"b\\"",operation="charge",le="0.1"} 0\n' in text
+    assert 'dinero_operation_seconds_bucket{gateway="a \\"b\\"",operation="charge",le="1.0"} 1\n' in text
+    assert 'dinero_operation_seconds_bucket{gateway="a \\"b\\"",operation="charge",le="+Inf"} 2\n' in text
+    assert 'dinero_operation_seconds_sum{gateway="a \\"b\\"",operation="charge"} 2.5\n' in text
+    assert 'dinero_request_bytes_total{gateway="a \\"b\\"",operation="charge"} 200\n' in text
+    assert 'dinero_response_bytes_total{gateway="a \\"b\\"",operation="charge"} 400\n' in text
+    assert ('dinero_errors_total{exception="CardDeclinedError",gateway="a \\"b\\"",operation="charge"} 1\n'
+            in text)
+    assert 'dinero_phase_seconds_total{gateway="a \\"b\\"",operation="charge",phase="network"} 1.25\n' in text
+
+
+def test_timings():
+    registry.clear()
+    memory_gateway(MemoryTransport([CHARGE_RESPONSE]))
+    transaction = dinero.Transaction.create(12, gateway_name='memory', **CARD)
+
+    timings = transaction.timings
+    assert set(timings) == set(['serialize', 'network', 'parse', 'map', 'total'])
+    assert sum(timings[phase] for phase in ['serialize', 'network', 'parse', 'map']) <= timings['total']
+    measurement_phases = {}
+    for (gateway, operation, phase), seconds in registry.phases.items():
+        measurement_phases[phase] = seconds
+    assert measurement_phases == dict((k, v) for k, v in timings.items() if k != 'total')
+
+    assert dinero.Transaction('memory', 12, '1').timings is None
+
+
+def test_interrupted_operations_are_finished():
+    registry.clear()
+
+    def interrupt(url, data):
+        raise KeyboardInterrupt
+
+    memory_gateway(MemoryTransport(interrupt))
+    try:
+        dinero.Transaction.create(12, gateway_name='memory', **CARD)
+    except KeyboardInterrupt:
+        pass
+    else:
+        assert False, 'KeyboardInterrupt not raised'
+
+    assert current_operation() is None
+    assert registry.errors == {('memory', 'charge', 'KeyboardInterrupt'): 1}
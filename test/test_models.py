@@ -0,0 +1,169 @@
+import dinero
+
+
+def make_transaction():
+    return dinero.Transaction('memory', 12, '2200000001',
+                              status='capturedPendingSettlement',
+                              auth_code='ABC123',
+                              last_4='1111',
+                              invoice_number='INV-1')
+
+
+def test_fields_and_extras():
+    transaction = make_transaction()
+    # only the extra field needs the overflow dict
+    assert transaction._extra == {'invoice_number': 'INV-1'}
+    assert transaction.status == 'capturedPendingSettlement'
+    # not a known field
+    assert transaction.invoice_number == 'INV-1'
+    assert transaction.data == {
+        'status': 'capturedPendingSettlement',
+        'auth_code': 'ABC123',
+        'last_4': '1111',
+        'invoice_number': 'INV-1',
+    }
+
+
+def test_extras_dont_shadow_methods():
+    transaction = dinero.Transaction('memory', 12, '2200000001', refund='partial', update=1)
+    customer = dinero.Customer('memory', '10000001', save=True)
+
+    assert callable(transaction.refund)
+    assert callable(customer.save)
+    assert transaction.data['refund'] == 'partial'
+    assert transaction.data['update'] == 1
+    assert customer.data['save'] is True
+
+    copy = dinero.Transaction.from_bytes(transaction.to_bytes())
+    assert callable(copy.refund)
+    assert copy.data['refund'] == 'partial'
+    assert dinero.Transaction.from_dict(transaction.to_dict()).data['refund'] == 'partial'
+
+    try:
+        transaction.refund = 'full'
+    except AttributeError:
+        pass
+    else:
+        assert False, 'AttributeError expected'
+
+
+def test_missing_field():
+    transaction = make_transaction()
+    try:
+        transaction.email
+    except AttributeError:
+        pass
+    else:
+        assert False, 'AttributeError expected'
+    assert 'email' not in transaction.data
+    assert transaction.data.get('email') is None
+
+
+def test_setting_fields():
+    transaction = make_transaction()
+    transaction.status = 'voided'
+    transaction.note = 'refunded by support'
+    transaction.data['email'] = 'joey@example.com'
+    del transaction.data['auth_code']
+
+    assert transaction.data['status'] == 'voided'
+    assert transaction.data['note'] == 'refunded by support'
+    assert transaction.email == 'joey@example.com'
+    assert not hasattr(transaction, 'auth_code')
+
+
+def test_to_dict_round_trip():
+    transaction = make_transaction()
+    as_dict = transaction.to_dict()
+    assert as_dict == {
+        'gateway_name': 'memory',
+        'price': 12,
+        'transaction_id': '2200000001',
+        'data': {
+            'status': 'capturedPendingSettlement',
+            'auth_code': 'ABC123',
+            'last_4': '1111',
+            'invoice_number': 'INV-1',
+        },
+    }
+    assert dinero.Transaction.from_dict(as_dict).to_dict() == as_dict
+
+
+def test_customer_and_card():
+    customer = dinero.Customer('memory', '10000001', email='joey@example.com', website='example.com')
+    card = dinero.CreditCard('memory', '10000001', card_id='20000001', last_4='1111')
+
+    assert customer.website == 'example.com'
+    assert dinero.Customer.from_dict(customer.to_dict()).to_dict() == customer.to_dict()
+    assert dinero.CreditCard.from_dict(card.to_dict()).to_dict() == card.to_dict()
+
+    customer.cards.append(card)
+    assert customer.data['cards'] == [card]
+
+
+def test_pickle():
+    import pickle
+
+    transaction = make_transaction()
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+        copy = pickle.loads(pickle.dumps(transaction, protocol))
+        assert copy.to_dict() == transaction.to_dict()
+        assert copy._extra == {'invoice_number': 'INV-1'}
+
+
+def test_to_bytes_round_trip():
+    from decimal import Decimal
+
+    transaction = make_transaction()
+    transaction.price = Decimal('12.00')
+    transaction.messages = [('1', 'This transaction has been approved.')]
+    copy = dinero.Transaction.from_bytes(transaction.to_bytes())
+    assert copy.to_dict() == transaction.to_dict()
+    assert isinstance(copy.price, Decimal)
+    assert not hasattr(copy, 'email')
+
+    # fields that were never set stay unset
+    bare = dinero.Transaction('memory', 12, '2200000002')
+    copy = dinero.Transaction.from_bytes(bare.to_bytes())
+    assert copy.data == {}
+    assert not hasattr(copy, '_extra')
+
+
+def test_to_bytes_nested_cards():
+    from dinero.base import DineroObject
+
+    customer = dinero.Customer('memory', '10000001', email='joey@example.com')
+    customer.cards.append(dinero.CreditCard('memory', '10000001', card_id='20000001', last_4='1111'))
+
+    copy = DineroObject.from_bytes(customer.to_bytes())
+    assert isinstance(copy, dinero.Customer)
+    assert copy.email == 'joey@example.com'
+    assert [card.to_dict() for card in copy.cards] == [card.to_dict() for card in customer.cards]
+
+
+def test_from_bytes_checks():
+    customer = dinero.Customer('memory', '10000001')
+    for data in [b'', b'junk', b'DN\x63\x01' + customer.to_bytes()[4:]]:
+        try:
+            dinero.Customer.from_bytes(data)
+        except ValueError:
+            pass
+        else:
+            assert False, 'ValueError not raised for %r' % data
+
+    try:
+        dinero.Transaction.from_bytes(customer.to_bytes())
+    except ValueError:
+        pass
+    else:
+        assert False, 'ValueError not raised'
+
+    from dinero.base import DineroObject, FORMAT_VERSION, HEADER, MAGIC
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 99)
+    for data in [header + b'[[],0,[],null]', customer.to_bytes()[:-1], customer.to_bytes()[:4] + b'[1]']:
+        try:
+            DineroObject.from_bytes(data)
+        except ValueError:
+            pass
+        else:
+            assert False, 'ValueError not raised for %r' % data
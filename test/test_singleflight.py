@@ -0,0 +1,222 @@
+import sys
+import threading
+import time
+
+import pytest
+
+import dinero
+from dinero.cache import invalidate
+from dinero.exceptions import CustomerNotFoundError, GatewayTimeout
+from dinero.gateways.transport import MemoryTransport
+from dinero.singleflight import SingleFlight
+from dinero.timeouts import remaining
+
+from .fixtures import CUSTOMER_NOT_FOUND_RESPONSE, TRANSACTION_DETAILS_RESPONSE, memory_gateway
+
+
+def single_flight_gateway(transport):
+    dinero.configure({
+        'memory': {
+            'type': 'dinero.gateways.AuthorizeNet',
+            'login_id': 'login',
+            'transaction_key': 'key',
+            'transport': transport,
+            'single_flight': True,
+        }
+    })
+    gateway = dinero.get_gateway('memory')
+    gateway.url = gateway.test_url
+    return gateway
+
+
+def slow_transport(response, seconds=0.2):
+    def respond(url, data):
+        time.sleep(seconds)
+        return response
+    return MemoryTransport(respond)
+
+
+def run_threads(fn, count=10):
+    results = [None] * count
+
+    def run(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_retrieves_share_a_request():
+    transport = slow_transport(TRANSACTION_DETAILS_RESPONSE)
+    gateway = single_flight_gateway(transport)
+
+    results = run_threads(lambda: gateway.retrieve('2200000001'))
+    assert len(transport.requests) == 1
+    assert gateway.single_flight.coalesced == 9
+    assert all(result == results[0] for result in results)
+    # every caller gets its own copy
+    results[0]['status'] = 'voided'
+    assert results[1]['status'] == 'capturedPendingSettlement'
+
+    dinero.Transaction.retrieve('2200000001', gateway_name='memory')
+    assert len(transport.requests) == 2
+    assert len(gateway.single_flight) == 0
+
+
+def test_exceptions_are_shared():
+    transport = slow_transport(CUSTOMER_NOT_FOUND_RESPONSE)
+    single_flight_gateway(transport)
+
+    results = run_threads(lambda: dinero.Customer.retrieve('123', gateway_name='memory'))
+    assert len(transport.requests) == 1
+    assert all(isinstance(result, CustomerNotFoundError) for result in results)
+    # each caller raises its own copy
+    assert len(set(id(result) for result in results)) == len(results)
+
+
+def test_leaders_deadline_is_not_shared():
+    def respond(url, data):
+        time.sleep(0.1)
+        # like a transport whose timeout is what's left of the deadline
+        remaining()
+        return TRANSACTION_DETAILS_RESPONSE
+
+    transport = MemoryTransport(respond)
+    gateway = single_flight_gateway(transport)
+    errors = []
+
+    def lead():
+        try:
+            with dinero.deadline(0.05):
+                gateway.retrieve('2200000001')
+        except GatewayTimeout as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    time.sleep(0.01)
+    # this one has time to make the request again
+    with dinero.deadline(1):
+        transaction = gateway.retrieve('2200000001')
+    leader.join()
+
+    assert len(errors) == 1
+    assert transaction['transaction_id'] == '2200000001'
+    assert len(transport.requests) == 2
+
+
+def test_off_by_default():
+    transport = slow_transport(TRANSACTION_DETAILS_RESPONSE, 0.05)
+    gateway = memory_gateway(transport)
+    assert gateway.single_flight is None
+
+    run_threads(lambda: gateway.retrieve('2200000001'), 3)
+    assert len(transport.requests) == 3
+
+
+def test_forget():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch(value):
+        calls.append(value)
+        started.set()
+        release.wait()
+        return value
+
+    leader = threading.Thread(target=single_flight.do, args=('transaction', '1', fetch, 'old'))
+    leader.start()
+    started.wait()
+    # a change to the transaction means the new read can't share the old one
+    single_flight.forget('transaction', '1')
+    release.set()
+    assert single_flight.do('transaction', '1', fetch, 'new') == 'new'
+    leader.join()
+    assert calls == ['old', 'new']
+
+
+def test_invalidate_forgets():
+    gateway = single_flight_gateway(MemoryTransport())
+    gateway.single_flight._calls[('transaction', '1')] = object()
+    invalidate(gateway, 'transaction', '1')
+    assert len(gateway.single_flight) == 0
+
+
+def test_waiting_honours_the_deadline():
+    transport = slow_transport(TRANSACTION_DETAILS_RESPONSE, 0.5)
+    gateway = single_flight_gateway(transport)
+
+    leader = threading.Thread(target=gateway.retrieve, args=('2200000001',))
+    leader.start()
+    time.sleep(0.05)
+    with pytest.raises(GatewayTimeout):
+        with dinero.deadline(0.05):
+            gateway.retrieve('2200000001')
+    leader.join()
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason='asyncio API requires Python 3.5')
+def test_async_retrieves_share_a_request():
+    import asyncio
+    from dinero.gateways.aio import AsyncMemoryTransport
+
+    transport = AsyncMemoryTransport([TRANSACTION_DETAILS_RESPONSE])
+    gateway = single_flight_gateway(MemoryTransport())
+    gateway.options['async_transport'] = transport
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        transactions = loop.run_until_complete(asyncio.gather(*[
+            dinero.Transaction.aretrieve('2200000001', gateway_name='memory') for _ in range(10)]))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+    assert len(transport.requests) == 1
+    assert gateway.single_flight.coalesced == 9
+    assert all(t.status == 'capturedPendingSettlement' for t in transactions)
+    assert len(gateway.single_flight) == 0
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason='asyncio API requires Python 3.5')
+def test_async_leaders_deadline_is_not_shared():
+    import asyncio
+    from dinero.aio import acoalesced
+
+    gateway = single_flight_gateway(MemoryTransport())
+    calls = []
+
+    async def fetch():
+        calls.append(None)
+        if len(calls) == 1:
+            await asyncio.sleep(0.01)
+            raise GatewayTimeout('Deadline exceeded')
+        return {'status': 'settledSuccessfully'}
+
+    async def both():
+        first = asyncio.ensure_future(acoalesced(gateway, 'transaction', '1', fetch))
+        second = asyncio.ensure_future(acoalesced(gateway, 'transaction', '1', fetch))
+        with pytest.raises(GatewayTimeout):
+            await first
+        return await second
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        result = loop.run_until_complete(both())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+    assert result == {'status': 'settledSuccessfully'}
+    assert len(calls) == 2
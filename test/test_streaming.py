@@ -0,0 +1,189 @@
+import codecs
+import logging
+
+import dinero
+from dinero.exceptions import CustomerNotFoundError
+from dinero.gateways.authorizenet_gateway import xml_iterparse
+from dinero.gateways.transport import MemoryTransport
+from dinero.metrics import current_operation, registry
+from dinero.timeouts import remaining
+
+from .fixtures import CUSTOMER_NOT_FOUND_RESPONSE, memory_gateway
+
+
+PAYMENT_PROFILE = b"""
+    <paymentProfiles>
+      <billTo>
+        <firstName>Joey</firstName>
+        <lastName>Shabadoo</lastName>
+        <zip>12345</zip>
+      </billTo>
+      <customerPaymentProfileId>%d</customerPaymentProfileId>
+      <payment>
+        <creditCard>
+          <cardNumber>XXXX%04d</cardNumber>
+          <expirationDate>XXXX</expirationDate>
+        </creditCard>
+      </payment>
+    </paymentProfiles>"""
+
+BATCH_TRANSACTION = b"""
+    <transaction>
+      <transId>%d</transId>
+      <submitTimeUTC>2026-10-18T16:00:00Z</submitTimeUTC>
+      <submitTimeLocal>2026-10-18T10:00:00</submitTimeLocal>
+      <transactionStatus>settledSuccessfully</transactionStatus>
+      <invoiceNumber>INV-1</invoiceNumber>
+      <firstName>Joey</firstName>
+      <lastName>Shabadoo</lastName>
+      <accountType>Visa</accountType>
+      <accountNumber>XXXX1111</accountNumber>
+      <settleAmount>12.00</settleAmount>
+      <marketType>eCommerce</marketType>
+      <product>Card Not Present</product>
+    </transaction>"""
+
+
+def customer_profile_response(cards):
+    return codecs.BOM_UTF8 + b"""<?xml version="1.0" encoding="utf-8"?>
+<getCustomerProfileResponse xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">
+  <messages>
+    <resultCode>Ok</resultCode>
+    <message>
+      <code>I00001</code>
+      <text>Successful.</text>
+    </message>
+  </messages>
+  <profile>
+    <email>joeyjoejoejunior@example.com</email>
+    <customerProfileId>10000001</customerProfileId>""" + b''.join(
+        PAYMENT_PROFILE % (20000000 + i, i) for i in range(cards)) + b"""
+  </profile>
+</getCustomerProfileResponse>"""
+
+
+def transaction_list_response(transactions):
+    return b"""<?xml version="1.0" encoding="utf-8"?>
+<getTransactionListResponse xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">
+  <messages>
+    <resultCode>Ok</resultCode>
+    <message>
+      <code>I00001</code>
+      <text>Successful.</text>
+    </message>
+  </messages>
+  <transactions>""" + b''.join(
+        BATCH_TRANSACTION % (2200000000 + i) for i in range(transactions)) + b"""
+  </transactions>
+</getTransactionListResponse>"""
+
+
+def chunked(content, size):
+    return [content[i:i + size] for i in range(0, len(content), size)]
+
+
+def test_iterparse_handles_bom_across_chunks():
+    content = customer_profile_response(3)
+    tags = ('paymentProfiles',)
+    ids = [elem.findtext('{AnetApi/xml/v1/schema/AnetApiSchema.xsd}customerPaymentProfileId')
+           for elem in xml_iterparse(chunked(content, 1), tags)]
+    assert ids == ['20000000', '20000001', '20000002']
+
+
+def test_iterparse_clears_finished_elements():
+    content = customer_profile_response(50)
+    elements = []
+    for elem in xml_iterparse(chunked(content, 64), ('paymentProfiles',)):
+        # earlier profiles have been dropped from the tree
+        assert len(elem.getparent()) < 5
+        elements.append(elem)
+    assert len(elements) == 50
+    assert all(len(elem) == 0 for elem in elements)
+
+
+def test_iter_cards():
+    memory_gateway(MemoryTransport([customer_profile_response(200)]))
+    customer = dinero.Customer('memory', '10000001')
+
+    cards = list(customer.iter_cards())
+
+    assert len(cards) == 200
+    assert cards[0].card_id == '20000000'
+    assert cards[0].customer_id == '10000001'
+    assert cards[0].last_4 == '0000'
+    assert cards[-1].last_4 == '0199'
+    assert cards[-1].first_name == 'Joey'
+
+
+def test_iter_cards_is_metered():
+    registry.clear()
+    response = customer_profile_response(20)
+    memory_gateway(MemoryTransport([response]))
+
+    for card in dinero.Customer('memory', '10000001').iter_cards():
+        # the stream's operation is only open while it runs
+        assert current_operation() is None
+
+    assert registry.latency[('memory', 'iter_customer_cards')].count == 1
+    assert registry.traffic[('memory', 'iter_customer_cards')][1] == len(response)
+
+
+def test_iter_cards_not_found():
+    memory_gateway(MemoryTransport([CUSTOMER_NOT_FOUND_RESPONSE]))
+    customer = dinero.Customer('memory', '10000001')
+    try:
+        list(customer.iter_cards())
+    except CustomerNotFoundError:
+        pass
+    else:
+        assert False, 'CustomerNotFoundError expected'
+
+
+def test_iter_batch():
+    transport = MemoryTransport([transaction_list_response(100)])
+    memory_gateway(transport)
+
+    transactions = list(dinero.Transaction.iter_batch('12345', gateway_name='memory'))
+
+    assert len(transactions) == 100
+    assert transactions[0].transaction_id == '2200000000'
+    assert transactions[0].price == '12.00'
+    assert transactions[0].status == 'settledSuccessfully'
+    assert transactions[0].last_4 == '1111'
+    assert b'<batchId>12345</batchId>' in transport.requests[0][1]
+
+
+class TimeoutTransport(MemoryTransport):
+    def __init__(self, *args, **kwargs):
+        super(TimeoutTransport, self).__init__(*args, **kwargs)
+        self.timeouts = []
+
+    def post(self, url, data, headers, timeout=None):
+        self.timeouts.append(timeout)
+        return super(TimeoutTransport, self).post(url, data, headers, timeout)
+
+
+def test_iter_cards_timeout():
+    transport = TimeoutTransport([customer_profile_response(3)])
+    memory_gateway(transport)
+
+    for card in dinero.Customer('memory', '10000001').iter_cards(timeout=5):
+        # the deadline only applies while the cards are being fetched
+        assert remaining() is None
+
+    assert 0 < transport.timeouts[0] <= 5
+
+
+def test_iter_batch_timeout_and_log(caplog):
+    transport = TimeoutTransport([transaction_list_response(3)])
+    memory_gateway(transport)
+
+    with caplog.at_level(logging.INFO, logger='dinero'):
+        transactions = dinero.Transaction.iter_batch('12345', gateway_name='memory', timeout=5)
+        assert not caplog.records
+        assert len(list(transactions)) == 3
+
+    assert 0 < transport.timeouts[0] <= 5
+    messages = [record.getMessage() for record in caplog.records]
+    assert len(messages) == 1
+    assert messages[0].startswith("iter_batch(")
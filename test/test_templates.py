@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import sys
+
+from lxml import etree
+
+import dinero
+from dinero.gateways.authorizenet_gateway import _dict_to_bytes, _dict_to_xml
+from dinero.gateways.transport import MemoryTransport
+
+from .fixtures import memory_gateway
+
+if sys.version_info < (2, 7):
+    from dinero.ordereddict import OrderedDict
+else:
+    from collections import OrderedDict
+
+
+CHARGE_OPTIONS = [
+    {'number': '4' + '1' * 15, 'month': '12', 'year': '2030'},
+    {'number': '4111-1111-1111-1111', 'month': 2, 'year': 30, 'cvv': '900', 'settle': False},
+    {
+        'number': '4' + '1' * 15,
+        'month': '12',
+        'year': '2030',
+        'first_name': u'Jos\xe9',
+        'last_name': u'O\'Brien & <Sons>\r',
+        'company': u'€ Inc.',
+        'zip': 12345,
+        'customer_id': 123,
+        'email': 'joeyjoejoejunior@example.com',
+        'invoice_number': 'INV-1',
+    },
+]
+
+
+def gateway():
+    return memory_gateway(MemoryTransport())
+
+
+def test_dict_to_bytes_matches_lxml():
+    dictionary = OrderedDict([
+        ('text', u'a & b < c > d ☃'),
+        ('empty_text', u''),
+        ('zero', 0),
+        ('none', None),
+        ('number', 12.5),
+        ('empty_dict', OrderedDict([('none', None)])),
+        ('list', [OrderedDict([('a', '1')]), OrderedDict([('a', '2')])]),
+        ])
+    root = _dict_to_xml('root', dictionary)
+    assert etree.tostring(root) == b'<root>' + _dict_to_bytes(dictionary) + b'</root>'
+
+
+def test_transaction_request_matches_xml():
+    g = gateway()
+    for options in CHARGE_OPTIONS:
+        assert g._transaction_request(12, options) == etree.tostring(g._transaction_xml(12, options))
+
+
+def test_charge_customer_request_matches_xml():
+    g = gateway()
+    for options in CHARGE_OPTIONS:
+        assert (g._charge_customer_request('10000001', '20000001', 12, options) ==
+                etree.tostring(g._charge_customer_xml('10000001', '20000001', 12, options)))
+
+
+def test_retrieve_request_matches_xml():
+    g = gateway()
+    assert g._retrieve_request('2200000001') == etree.tostring(g._retrieve_xml('2200000001'))
+
+
+def test_request_head_is_cached():
+    g = gateway()
+    g._transaction_request(12, CHARGE_OPTIONS[0])
+    head = g._request_heads['createTransactionRequest']
+    g._transaction_request(13, CHARGE_OPTIONS[0])
+    assert g._request_heads['createTransactionRequest'] is head
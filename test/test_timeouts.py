@@ -0,0 +1,105 @@
+import time
+
+import dinero
+from dinero.exceptions import GatewayException, GatewayTimeout
+from dinero.gateways.transport import MemoryTransport
+from dinero.timeouts import deadline, remaining, request_timeout
+
+from .fixtures import CHARGE_RESPONSE, memory_gateway
+
+
+class SlowTransport(MemoryTransport):
+    def __init__(self, delay, *args, **kwargs):
+        super(SlowTransport, self).__init__(*args, **kwargs)
+        self.delay = delay
+        self.timeouts = []
+
+    def post(self, url, data, headers, timeout=None):
+        self.timeouts.append(timeout)
+        time.sleep(self.delay)
+        return super(SlowTransport, self).post(url, data, headers, timeout)
+
+
+def test_no_deadline():
+    assert remaining() is None
+    assert request_timeout(30) == 30
+
+
+def test_nested_deadline_only_shortens():
+    with deadline(10):
+        with deadline(100):
+            assert remaining() <= 10
+        with deadline(1):
+            assert remaining() <= 1
+        assert remaining() > 1
+    assert remaining() is None
+
+
+def test_expired_deadline():
+    with deadline(0.01):
+        time.sleep(0.02)
+        try:
+            remaining()
+        except GatewayTimeout:
+            pass
+        else:
+            assert False, 'GatewayTimeout expected'
+
+
+def test_default_request_timeout():
+    transport = SlowTransport(0, [CHARGE_RESPONSE])
+    gateway = memory_gateway(transport)
+    dinero.Transaction.create(12, number='4' + '1' * 15, month='12', year='2030', gateway_name='memory')
+    assert transport.timeouts == [gateway.timeout]
+
+
+def test_timeout_is_shared_across_requests():
+    transport = SlowTransport(0.05, [CHARGE_RESPONSE, CHARGE_RESPONSE])
+    memory_gateway(transport)
+
+    with deadline(0.5):
+        dinero.Transaction.create(12, number='4' + '1' * 15, month='12', year='2030', gateway_name='memory')
+        dinero.Transaction.create(12, number='4' + '1' * 15, month='12', year='2030', gateway_name='memory')
+
+    first, second = transport.timeouts
+    assert first <= 0.5
+    assert second < first
+
+
+def test_create_timeout_raises_gateway_timeout():
+    transport = SlowTransport(0.05, [CHARGE_RESPONSE, CHARGE_RESPONSE])
+    gateway = memory_gateway(transport)
+    # force url discovery, which would be a second request
+    gateway.url = None
+
+    try:
+        dinero.Transaction.create(12, number='4' + '1' * 15, month='12', year='2030', gateway_name='memory', timeout=0.01)
+    except GatewayTimeout:
+        pass
+    else:
+        assert False, 'GatewayTimeout expected'
+    assert len(transport.requests) == 1
+
+
+def test_error_code_handlers_pass_timeouts_through():
+    gateway = memory_gateway(MemoryTransport())
+
+    def check_for_error(resp):
+        raise GatewayTimeout('Deadline exceeded')
+    gateway.check_for_error = check_for_error
+
+    for handle in [lambda: gateway._check_for_error_codes({}, {'D': ValueError}),
+                   lambda: gateway._handle_probe({}),
+                   lambda: gateway._handle_create_customer({}, {})]:
+        try:
+            handle()
+        except GatewayTimeout as e:
+            assert e.args == ('Deadline exceeded',)
+        else:
+            assert False, 'GatewayTimeout expected'
+
+
+def test_timeout_is_not_a_gateway_error():
+    # handlers for gateway error codes don't catch timeouts
+    assert not issubclass(GatewayTimeout, GatewayException)
+    assert issubclass(GatewayTimeout, dinero.exceptions.DineroException)
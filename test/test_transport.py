@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+from lxml import etree
+from six.moves import BaseHTTPServer
+
+import dinero
+from dinero.exceptions import GatewayTimeout
+from dinero.gateways.transport import MemoryTransport, RequestsTransport, transport_from_options
+
+from .fixtures import CHARGE_RESPONSE, memory_gateway
+
+
+def test_default_transport_is_pooled():
+    transport = transport_from_options({'pool_size': 3})
+    assert isinstance(transport, RequestsTransport)
+    assert transport.session.get_adapter('https://apitest.authorize.net')._pool_maxsize == 3
+
+
+def test_transport_from_dotted_path():
+    transport = transport_from_options({'transport': 'dinero.gateways.transport.MemoryTransport'})
+    assert isinstance(transport, MemoryTransport)
+
+
+def test_charge_uses_injected_transport():
+    transport = MemoryTransport([CHARGE_RESPONSE])
+    memory_gateway(transport)
+
+    transaction = dinero.Transaction.create(12, number='4' + '1' * 15, month='12', year='2030', gateway_name='memory')
+
+    assert transaction.transaction_id == '2200000001'
+    assert transaction.auth_code == 'ABC123'
+    assert transaction.last_4 == '1111'
+    assert len(transport.requests) == 1
+    url, data = transport.requests[0]
+    assert url == dinero.gateways.AuthorizeNet.test_url
+    request = etree.XML(data)
+    assert request.tag == '{AnetApi/xml/v1/schema/AnetApiSchema.xsd}createTransactionRequest'
+
+
+def test_callable_transport():
+    seen = []
+
+    def respond(url, data):
+        seen.append(data)
+        return CHARGE_RESPONSE
+
+    memory_gateway(MemoryTransport(respond))
+    dinero.Transaction.create(12, number='4' + '1' * 15, month='12', year='2030', gateway_name='memory')
+    dinero.Transaction.create(13, number='4' + '1' * 15, month='12', year='2030', gateway_name='memory')
+    assert len(seen) == 2
+
+
+class DripHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Sends a response a byte at a time, each well within a read timeout.
+    """
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Length', '100')
+        self.end_headers()
+        try:
+            for _ in range(100):
+                self.wfile.write(b'x')
+                self.wfile.flush()
+                time.sleep(0.02)
+        except (IOError, OSError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_slow_body_times_out():
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), DripHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    transport = RequestsTransport()
+    url = 'http://127.0.0.1:%d/' % server.server_address[1]
+    try:
+        started = time.time()
+        with pytest.raises(GatewayTimeout):
+            transport.post(url, b'data', {}, timeout=0.2)
+        assert time.time() - started < 1
+
+        started = time.time()
+        with pytest.raises(GatewayTimeout):
+            with dinero.deadline(0.2):
+                transport.post(url, b'data', {}, timeout=30)
+        assert time.time() - started < 1
+    finally:
+        transport.close()
+        server.shutdown()
+        server.server_close()